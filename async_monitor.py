@@ -0,0 +1,322 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List
+
+from requests.utils import parse_header_links
+
+from github_monitor import GitHubMonitor, Colors, RequestCancelled, current_user
+from circuit_breaker import CircuitOpenError
+from http_cache import HTTPCache
+from repo_snapshot import RepoRecord, SnapshotDiffer, UserSnapshot
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖，只有异步引擎需要
+    aiohttp = None
+
+
+def next_page_url(link_header: str):
+    """从 Link 响应头中取出 rel=next 的地址"""
+    if not link_header:
+        return None
+    for link in parse_header_links(link_header):
+        if link.get('rel') == 'next':
+            return link.get('url')
+    return None
+
+
+class AsyncGitHubMonitor(GitHubMonitor):
+    """基于 asyncio 的监控引擎
+
+    所有用户检查和提交查询都作为协程运行在同一个 keep-alive 连接池上，
+    状态、缓存、对比逻辑和通知流程与线程引擎完全一致，只替换每轮检查的执行方式。
+    """
+
+    def __init__(self, token, email_config, connection_limit: int = 100, **kwargs):
+        if aiohttp is None:
+            raise ImportError("异步引擎需要 aiohttp，请先执行 pip install aiohttp")
+        super().__init__(token, email_config, **kwargs)
+        self.connection_limit = connection_limit
+        self.loop = None  # 正在运行检查的事件循环
+        self.stop_async = None  # 事件循环内的退出事件，用于打断分散检查的等待
+        self.check_tasks = []  # 本轮所有用户的检查协程
+
+    def _perform_check(self, usernames):
+        """在事件循环中并发检查所有用户并等待完成"""
+        ordered = self._schedule_order(usernames)
+        self._begin_cycle(ordered)
+        asyncio.run(self._perform_check_async(ordered))
+        self._end_cycle(usernames)
+
+    def _start_round(self, ordered, spread_window: float):
+        """在线程池中运行本轮的事件循环，各用户按 spread_window 错开开始，调度线程不被占用"""
+        self.worker_pool.submit(self._run_round, ordered, spread_window)
+
+    def _run_round(self, ordered, spread_window: float):
+        try:
+            asyncio.run(self._perform_check_async(ordered, spread_window))
+        finally:
+            self.scheduler.call_soon(self._finish_round)
+
+    def stop(self):
+        super().stop()
+        if self.loop is not None and self.stop_async is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.stop_async.set)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+
+    async def _perform_check_async(self, usernames, spread_window: float = 0):
+        self.loop = asyncio.get_running_loop()
+        self.stop_async = asyncio.Event()
+        if self.stop_event.is_set():
+            self.stop_async.set()
+        connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+        headers = {'Accept': 'application/vnd.github+json'}  # Authorization 按请求选择的 token 设置
+        connect_timeout, read_timeout = self.request_timeout
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+            delay = spread_window / len(usernames) if spread_window and usernames else 0
+            self.check_tasks = [asyncio.ensure_future(self._check_user_updates_async(session, username, position * delay))
+                                for position, username in enumerate(usernames)]
+            try:
+                await asyncio.gather(*self.check_tasks, return_exceptions=True)
+            finally:
+                self.check_tasks = []
+
+    def _deadline_reached(self):
+        """所有用户的检查同时开始，到达单次运行时限时直接取消未完成的检查
+
+        用户状态在检查结束时才整体提交，被取消的用户保持原状态，下次运行继续检查。
+        """
+        super()._deadline_reached()
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(lambda: [task.cancel() for task in self.check_tasks])
+            except RuntimeError:
+                pass  # 事件循环已经结束
+
+    async def _run_blocking(self, func, *args):
+        """在线程中执行同步的状态保存和更新日志写入，不阻塞事件循环
+
+        状态一旦开始提交，对应的通知也必须写入队列：检查在这一步被取消（到达运行时限）时
+        等待它完成而不中断，与线程引擎中正在进行的检查会完成的行为一致。
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        while True:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    raise
+
+    async def cached_get_async(self, session, url: str, params: Dict = None, trim=None):
+        """异步版本的条件 GET 请求，返回 (status, headers, data, next_url)"""
+        key = HTTPCache.make_key(url, params, trim)
+        conditional = self.http_cache.conditional_headers(key)
+
+        async def handle(response):
+            if response.status == 304:
+                entry = self.http_cache.get(key)
+                if entry is not None:
+                    self.metrics.inc('github_cache_hits_total')
+                    link = response.headers.get('Link') or entry.get('link')
+                    return response.status, response.headers, entry['data'], next_page_url(link)
+                return None
+            return await self._read_response(key, response, trim)
+
+        result = await self._request_async(session, url, params, conditional, handle)
+        if result is None:
+            # 缓存条目丢失时退回无条件请求
+            result = await self._request_async(session, url, params, None, handle)
+        return result
+
+    async def _request_async(self, session, url: str, params: Dict, headers: Dict, handle):
+        """异步版本的统一请求层：超时、抖动重试和按用户熔断与 request 一致，响应交给 handle 读取"""
+        username = self._breaker_check()
+        for attempt in range(self.max_retries + 1):
+            client, delay = self.token_pool.reserve()
+            if delay > 0:
+                await self._wait_or_cancel_async(delay)  # 按所选 token 的令牌桶节奏等待，不阻塞事件循环
+            started = time.monotonic()
+            try:
+                async with session.get(url, params=params, headers=dict(headers or {}, **client.auth_header)) as response:
+                    self._record_request('GET', url, response.status, time.monotonic() - started)
+                    self.metrics.inc('github_token_requests_total', token=client.label)
+                    text = await response.text() if response.status == 403 else ''
+                    if (self._report_token(client, response.status, response.headers, text)
+                            and attempt < self.max_retries and self.token_pool.has_available()):
+                        continue  # 换一个 token 立即重试
+                    retryable = self.is_retryable(response.status, response.headers, text)
+                    if not retryable or attempt >= self.max_retries:
+                        self._breaker_record(username, retryable)
+                        return await handle(response)
+                    delay = self.retry_delay(response.headers, attempt)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self._record_request('GET', url, 'error', time.monotonic() - started)
+                if attempt >= self.max_retries:
+                    self._breaker_record(username, True)
+                    raise
+                delay = self.retry_delay(None, attempt)
+            await self._wait_or_cancel_async(delay)
+
+    async def _wait_or_cancel_async(self, delay: float):
+        """_wait_or_cancel 的异步版本：等待期间收到停止请求时放弃本次请求"""
+        try:
+            await asyncio.wait_for(self.stop_async.wait(), delay)
+        except asyncio.TimeoutError:
+            return
+        raise RequestCancelled('监控正在停止，放弃等待中的请求')
+
+    async def _read_response(self, key: str, response, trim):
+        if response.status != 200:
+            return response.status, response.headers, None, None
+        data = await response.json(content_type=None)
+        if trim:
+            data = trim(data)
+        self.http_cache.store(key, response, data)
+        return response.status, response.headers, data, next_page_url(response.headers.get('Link'))
+
+    async def _iter_repo_pages(self, session, username: str) -> AsyncIterator[List[Dict]]:
+        """按 Link: rel=next 逐页产出用户仓库（只保留监控需要的字段）"""
+        url = f'{self.api_base}/users/{username}/repos'
+        params = {'per_page': 100}
+        while url:
+            status, _, data, url = await self.cached_get_async(session, url, params=params,
+                                                               trim=self._compact_repos)
+            if data is None:
+                raise RuntimeError(f"获取用户 {username} 仓库失败 (状态码: {status})")
+            yield data
+            params = None
+
+    async def get_repo_commits_async(self, session, username: str, repo: str, limit: int = None) -> List[Dict]:
+        """异步获取仓库的提交记录"""
+        url = f'{self.api_base}/repos/{username}/{repo}/commits'
+        params = {'per_page': limit} if limit else None
+        try:
+            status, _, data, _ = await self.cached_get_async(session, url, params=params)
+            self._record_repo_access(username, repo, status)
+            if data is None:
+                print(f"{Colors.RED}获取仓库 {repo} 提交记录失败 (状态码: {status}){Colors.ENDC}")
+                return []
+            return data
+        except (CircuitOpenError, RequestCancelled):
+            raise
+        except Exception:
+            print(f"{Colors.RED}获取仓库 {repo} 提交记录时出错{Colors.ENDC}")
+            return []
+
+    async def get_new_commits_async(self, session, username: str, repo: str, old_state: RepoRecord = None):
+        """get_new_commits 的异步版本：从游标开始增量获取，按 Link 翻页直到遇到游标"""
+        url = f'{self.api_base}/repos/{username}/{repo}/commits'
+        params = self._commit_cursor(username, old_state)
+        head, new_commits, page_keys = None, [], []
+        page_url, page_params = url, params
+        try:
+            while page_url:
+                page_keys.append(HTTPCache.make_key(page_url, page_params, self._compact_commits))
+                status, _, data, next_url = await self.cached_get_async(session, page_url, params=page_params,
+                                                                        trim=self._compact_commits)
+                self._record_repo_access(username, repo, status)
+                if data is None:
+                    print(f"{Colors.RED}获取仓库 {repo} 提交记录失败 (状态码: {status}){Colors.ENDC}")
+                    return [], []
+                head = head or (data[0] if data else None)
+                if 'since' not in params or self._take_new_commits(data, old_state, new_commits):
+                    break
+                page_url, page_params = next_url, None
+        except (CircuitOpenError, RequestCancelled):
+            raise
+        except Exception:
+            print(f"{Colors.RED}获取仓库 {repo} 提交记录时出错{Colors.ENDC}")
+            return [], []
+        if head is None and 'since' in params:
+            self.http_cache.discard(self._first_commit_keys(url)[0])
+            return await self.get_repo_commits_async(session, username, repo, limit=1), []
+        return self._finish_commit_fetch(url, params, page_keys, head, new_commits)
+
+    async def _has_new_events_async(self, session, username: str) -> bool:
+        if time.time() < self.events_poll_after.get(username, 0):
+            return False
+        try:
+            status, headers, _, _ = await self.cached_get_async(session, self._events_url(username),
+                                                                trim=self._drop_events)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            print(f"{Colors.RED}获取用户 {username} 事件流时出错: {str(e)}{Colors.ENDC}")
+            return True
+        return self._events_changed(username, status, headers)
+
+    async def _build_repo_state_async(self, session, username: str, repo: Dict, old_state: RepoRecord = None,
+                                      reuse: bool = False) -> RepoRecord:
+        if reuse and self._can_reuse_state(repo, old_state):
+            self._count('api_calls_saved')
+            return old_state
+        if self._is_known_inaccessible(username, repo):
+            self._count('inaccessible_skipped')
+            return self._repo_state(username, repo, [])
+        commits, new_commits = await self.get_new_commits_async(session, username, repo['name'], old_state)
+        self._mark_inaccessible_pushed_at(username, repo)
+        self._stash_new_commits(username, repo['name'], new_commits)
+        return self._repo_state(username, repo, commits)
+
+    async def check_user_activity_async(self, session, username: str) -> List:
+        """与 check_user_activity 相同的检查逻辑，同一页内的提交查询并发执行；失败时同样抛出异常"""
+        prefetched = self.prefetched_states.pop(username, None)
+        if prefetched is not None:
+            return await self._run_blocking(self._commit_user_state, username, prefetched)
+
+        known = self.known_repos.get(username)
+        use_events = self.detection_mode == 'events' and known is not None
+
+        if use_events and not await self._has_new_events_async(session, username):
+            self._count('api_calls_saved', 1 + len(known))
+            return []
+
+        current_state = UserSnapshot(username)
+        differ = SnapshotDiffer(known) if known is not None else None
+        try:
+            async for page in self._iter_repo_pages(session, username):
+                records = await asyncio.gather(*(
+                    self._build_repo_state_async(session, username, repo,
+                                                 known.get(repo['name']) if known is not None else None,
+                                                 reuse=use_events)
+                    for repo in page))
+                for record in records:
+                    current_state.add(record)
+                    if differ is not None:
+                        differ.add(record)
+
+            return await self._run_blocking(self._commit_user_state, username, current_state, differ)
+        except BaseException:
+            # 包括运行时限到达时被取消的检查
+            if use_events:
+                self._discard_events_etag(username)
+            raise
+
+    async def _check_user_updates_async(self, session, username: str, start_delay: float = 0):
+        if start_delay:
+            try:
+                await asyncio.wait_for(self.stop_async.wait(), timeout=start_delay)
+            except asyncio.TimeoutError:
+                pass
+        if self.stop_event.is_set():
+            return  # 正在退出，排队中的用户留到下次启动再检查
+        started = time.monotonic()
+        notifications = []
+        current_user.set(username)  # 每个协程运行在各自的上下文副本中
+        try:
+            if self._skip_open_circuit(username):
+                return
+            self._announce_check(username)
+            notifications = await self.check_user_activity_async(session, username)
+            await self._run_blocking(self._dispatch_notifications, username, notifications)
+        except RequestCancelled:
+            print(f"{Colors.YELLOW}监控正在停止，放弃检查用户 {username}{Colors.ENDC}")
+        except Exception as e:
+            self._count('failed_users')
+            print(f"{Colors.RED}检查用户 {username} 时出错: {str(e)}{Colors.ENDC}")
+        finally:
+            self._record_check_latency(username, started)
+            self._reschedule(username, bool(notifications))
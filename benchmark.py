@@ -0,0 +1,448 @@
+"""监控引擎基准测试
+
+在子进程中启动本地模拟 GitHub API（fake_github.py）和 SMTP 接收端（smtp_sink.py），
+用 GitHubMonitor / AsyncGitHubMonitor 执行若干轮检查，输出每轮请求数、耗时、峰值内存和通知发送速率。
+
+示例：
+    python benchmark.py --users 50 --repos 100 --cycles 3 --churn 20
+    python benchmark.py --latency 0.05 --variant engine=threads --variant engine=asyncio
+    python benchmark.py --variant detection_mode=repos --variant detection_mode=events --output bench.jsonl
+    python benchmark.py --snapshot --users 1000 --repos 100
+    python benchmark.py --startup --users 50 --repos 20 --latency 0.01
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+from fake_github import CONTROL_PREFIX, FakeGitHub
+from repo_snapshot import RepoRecord, UserSnapshot, diff_snapshots
+from smtp_sink import SMTPSink
+
+# 可以通过 --variant key=value 覆盖的参数
+VARIANT_KEYS = ('engine', 'detection_mode', 'workers', 'connection_limit', 'state_backend',
+                'digest_window', 'spread_ratio', 'users', 'repos', 'latency', 'churn', 'cycles')
+
+
+def run_services(args, conn):
+    """子进程：运行模拟 GitHub 和 SMTP 接收端，直到父进程通知退出"""
+    fake = FakeGitHub(users=args.users, repos=args.repos, latency=args.latency,
+                      rate_limit=args.rate_limit, poll_interval=0)
+    sink = SMTPSink(latency=args.smtp_latency)
+    smtp_server = sink.serve()
+    http_server = fake.serve(extra_stats=sink.stats)
+    conn.send((http_server.server_port, smtp_server.server_address[1]))
+    conn.recv()  # 等待退出信号
+    http_server.shutdown()
+    smtp_server.shutdown()
+
+
+def control(base: str, action: str, **params) -> dict:
+    query = '&'.join(f'{k}={v}' for k, v in params.items())
+    url = f'{base}{CONTROL_PREFIX}/{action}' + (f'?{query}' if query else '')
+    method = 'GET' if action == 'stats' else 'POST'
+    with urllib.request.urlopen(urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)) as response:
+        return json.loads(response.read())
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def build_monitor(args, api_base: str, smtp_port: int):
+    from github_monitor import GitHubMonitor
+
+    email_config = {
+        'smtp_server': '127.0.0.1',
+        'smtp_port': smtp_port,
+        'smtp_security': 'none',
+        'sender': 'monitor@localhost',
+        'password': '',
+        'receiver': 'bench@localhost',
+    }
+    options = dict(detection_mode=args.detection_mode, api_base=api_base, spread_ratio=args.spread_ratio,
+                   state_backend=args.state_backend, digest_window=args.digest_window)
+    if args.engine == 'asyncio':
+        from async_monitor import AsyncGitHubMonitor
+        return AsyncGitHubMonitor(args.token, email_config, connection_limit=args.connection_limit, **options)
+    return GitHubMonitor(args.token, email_config, max_workers=args.workers, **options)
+
+
+def run_benchmark(args) -> dict:
+    """执行一次基准测试，返回结果字典"""
+    parent_conn, child_conn = multiprocessing.Pipe()
+    services = multiprocessing.Process(target=run_services, args=(args, child_conn), daemon=True)
+    services.start()
+    http_port, smtp_port = parent_conn.recv()
+    api_base = f'http://127.0.0.1:{http_port}'
+
+    workdir = tempfile.mkdtemp(prefix='github-monitor-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # 状态、缓存和队列文件都写到临时目录
+    output = sys.stdout if args.verbose else io.StringIO()
+    usernames = [f'user{u}' for u in range(args.users)]
+    cycles = []
+    try:
+        with contextlib.redirect_stdout(output):
+            monitor = build_monitor(args, api_base, smtp_port)
+            threading.Thread(target=monitor.notification_sender, daemon=True).start()
+
+            for cycle in range(args.cycles + 1):
+                # 第 0 轮为冷启动（建立基线，不产生通知），之后每轮先制造 churn 个推送
+                if cycle and args.churn:
+                    control(api_base, 'churn', count=args.churn)
+                control(api_base, 'reset_stats')
+                started = time.perf_counter()
+                monitor._perform_check(usernames)
+                elapsed = time.perf_counter() - started
+                stats = control(api_base, 'stats')
+                cycles.append({'cycle': cycle, 'seconds': round(elapsed, 3), 'requests': stats['requests'],
+                               'not_modified': stats['not_modified'], 'rate_limited': stats['rate_limited'],
+                               'by_endpoint': stats['by_endpoint']})
+
+            # 等待通知队列发送完毕
+            deadline = time.monotonic() + args.drain_timeout
+            while monitor.notification_queue.qsize() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            undelivered = monitor.notification_queue.qsize()
+            produced = monitor.metrics.to_dict()['counters'].get('notifications_total', {}).get('', 0)
+            monitor.smtp.close()
+        sink_stats = control(api_base, 'stats')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        parent_conn.send('stop')
+        services.join(timeout=5)
+
+    warm = cycles[1:] or cycles
+    emails = sink_stats['emails']
+    span = (sink_stats['last_email_at'] or 0) - (sink_stats['first_email_at'] or 0)
+    return {
+        'config': {key: getattr(args, key) for key in VARIANT_KEYS},
+        'cold_cycle_seconds': cycles[0]['seconds'],
+        'cold_cycle_requests': cycles[0]['requests'],
+        'warm_cycle_seconds': round(sum(c['seconds'] for c in warm) / len(warm), 3),
+        'warm_cycle_requests': round(sum(c['requests'] for c in warm) / len(warm), 1),
+        'warm_not_modified_ratio': round(sum(c['not_modified'] for c in warm) /
+                                         max(1, sum(c['requests'] for c in warm)), 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'notifications': produced,
+        'emails': emails,
+        'undelivered': undelivered,
+        'smtp_connections': sink_stats['smtp_connections'],
+        'notifications_per_second': round(emails / span, 1) if emails > 1 and span > 0 else None,
+        'cycles': cycles,
+    }
+
+
+def _legacy_repo_state(repo: dict, commits: list) -> dict:
+    """改用 RepoRecord 之前的字典状态，作为快照基准测试的对照"""
+    state = {'created_at': repo['created_at'], 'updated_at': repo['updated_at'], 'pushed_at': repo.get('pushed_at'),
+             'html_url': repo['html_url'], 'has_commits': bool(commits)}
+    if commits:
+        state['latest_commit'] = commits[0]['commit']['author']['date']
+    return state
+
+
+def _legacy_diff(old: dict, new: dict) -> int:
+    """改用 diff_snapshots 之前逐个仓库对比的逻辑，返回需要通知的仓库数"""
+    changed = 0
+    for name, state in new.items():
+        previous = old.get(name)
+        if previous is None:
+            changed += 1
+        elif (state['updated_at'] > previous['updated_at'] and state['has_commits'] and
+              (not previous.get('latest_commit') or state['latest_commit'] > previous.get('latest_commit', ''))):
+            changed += 1
+    return changed
+
+
+def _snapshot_diff(old: UserSnapshot, new: UserSnapshot) -> int:
+    diff = diff_snapshots(old, new)
+    return len(diff.created) + len(diff.updated)
+
+
+def _synthetic_payloads(users: int, repos: int, churn: int):
+    """生成与 fake_github 相同形状的仓库列表 JSON（每个用户一份），第二份中有 churn 个仓库推送了新提交
+
+    保存为 JSON 文本，测量时再解析，与真实运行时一样由状态持有解析出的字符串。
+    """
+    def stamp(seconds):
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1600000000 + seconds))
+
+    step = max(1, users * repos // max(1, churn))
+    rounds = []
+    for shift in (0, 1):
+        data = {}
+        for u in range(users):
+            username = f'user{u}'
+            entries = []
+            for r in range(repos):
+                index = u * repos + r
+                updated = stamp(index + (86400 if shift and index % step == 0 else 0))
+                repo = {'id': index + 1, 'name': f'repo{r}', 'created_at': stamp(index), 'updated_at': updated,
+                        'pushed_at': updated, 'html_url': f'https://github.com/{username}/repo{r}'}
+                entries.append([repo, [{'commit': {'author': {'date': updated}}}]])
+            data[username] = json.dumps(entries)
+        rounds.append(data)
+    return rounds
+
+
+def _build_dicts(payloads: dict) -> dict:
+    return {username: {repo['name']: _legacy_repo_state(repo, commits) for repo, commits in json.loads(payload)}
+            for username, payload in payloads.items()}
+
+
+def _build_snapshots(payloads: dict) -> dict:
+    return {username: UserSnapshot(username, (RepoRecord.from_api(username, repo, commits)
+                                              for repo, commits in json.loads(payload)))
+            for username, payload in payloads.items()}
+
+
+def _retained_mb(build, payloads: dict) -> float:
+    """构建完成后仍被状态占用的内存（解析出的临时对象已释放）"""
+    tracemalloc.start()
+    result = build(payloads)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return round(size / (1024 * 1024), 2)
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, round(time.perf_counter() - started, 3)
+
+
+def run_snapshot_benchmark(args) -> dict:
+    """对比字典状态和 RepoRecord 快照的内存占用、构建和对比耗时（不需要模拟服务）"""
+    before, after = _synthetic_payloads(args.users, args.repos, args.churn)
+    result = {'config': {'users': args.users, 'repos': args.repos, 'churn': args.churn}}
+    for label, build, diff in (('dict', _build_dicts, _legacy_diff),
+                               ('snapshot', _build_snapshots, _snapshot_diff)):
+        memory = _retained_mb(build, before)
+        old, build_seconds = _timed(build, before)
+        new = build(after)
+        changed, diff_seconds = _timed(lambda: sum(diff(old[u], new[u]) for u in new))
+        result[label] = {'memory_mb': memory, 'build_seconds': build_seconds,
+                         'diff_seconds': diff_seconds, 'changed': changed}
+    return result
+
+
+# 启动耗时探针：在全新的解释器中导入、创建监控实例并检查第一个用户，各阶段耗时以 JSON 输出到最后一行
+STARTUP_PROBE = '''
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+from github_monitor import GitHubMonitor
+imported = time.perf_counter()
+options = json.loads(sys.argv[1])
+token, username = options.pop('token'), options.pop('username')
+with contextlib.redirect_stdout(io.StringIO()):
+    monitor = GitHubMonitor(token, {}, **options)
+    ready = time.perf_counter()
+    monitor._perform_check([username])
+checked = time.perf_counter()
+print(json.dumps({'import_seconds': imported - started, 'init_seconds': ready - imported,
+                  'first_check_seconds': checked - ready}))
+'''
+
+
+def _probe_startup(options: dict, workdir: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', STARTUP_PROBE, json.dumps(options)], cwd=workdir, env=env,
+                               check=True, stdout=subprocess.PIPE, text=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started  # 包含解释器启动，到第一个用户检查完成
+    return result
+
+
+def run_startup_benchmark(args) -> dict:
+    """对比普通启动和快速启动（FAST_START）的启动耗时
+
+    先用模拟服务建立 users 个用户的状态，再分别以两种方式在新进程中启动 repeat 次，
+    报告导入、创建实例（验证 token、读取状态）和检查第一个用户的耗时中位数。
+    """
+    parent_conn, child_conn = multiprocessing.Pipe()
+    services = multiprocessing.Process(target=run_services, args=(args, child_conn), daemon=True)
+    services.start()
+    http_port, smtp_port = parent_conn.recv()
+    api_base = f'http://127.0.0.1:{http_port}'
+    token = args.token or 'bench-token'  # 需要 token 才会在启动时验证
+    workdir = tempfile.mkdtemp(prefix='github-monitor-startup-')
+    cwd = os.getcwd()
+    usernames = [f'user{u}' for u in range(args.users)]
+    result = {'config': {'users': args.users, 'repos': args.repos, 'latency': args.latency,
+                         'state_backend': args.state_backend, 'repeat': args.repeat}}
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+            args.token = token
+            monitor = build_monitor(args, api_base, smtp_port)
+            monitor._perform_check(usernames)
+            monitor.save_state()
+            monitor.http_cache.save()
+        os.chdir(cwd)
+
+        for label, fast_start in (('normal', False), ('fast', True)):
+            options = dict(token=token, username=usernames[-1], api_base=api_base,
+                           state_backend=args.state_backend, fast_start=fast_start)
+            runs = [_probe_startup(options, workdir) for _ in range(args.repeat)]
+            result[label] = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        parent_conn.send('stop')
+        services.join(timeout=5)
+    return result
+
+
+def print_startup_result(result: dict):
+    config = ', '.join(f'{k}={v}' for k, v in result['config'].items())
+    print(f"\n[启动耗时对比（中位数）: {config}]")
+    for label in ('normal', 'fast'):
+        row = result[label]
+        print(f"  {label:<6}: 导入 {row['import_seconds']}s, 创建实例 {row['init_seconds']}s, "
+              f"检查第一个用户 {row['first_check_seconds']}s, 进程启动到完成 {row['process_seconds']}s")
+    if result['normal']['process_seconds']:
+        print(f"  快速启动耗时占比: {result['fast']['process_seconds'] / result['normal']['process_seconds']:.0%}")
+
+
+def print_snapshot_result(result: dict):
+    config = ', '.join(f'{k}={v}' for k, v in result['config'].items())
+    print(f"\n[快照表示对比: {config}]")
+    for label in ('dict', 'snapshot'):
+        row = result[label]
+        print(f"  {label:<8}: 内存 {row['memory_mb']} MB, 构建 {row['build_seconds']}s, "
+              f"对比 {row['diff_seconds']}s, 变化仓库 {row['changed']}")
+    if result['snapshot']['memory_mb']:
+        print(f"  内存占比: {result['snapshot']['memory_mb'] / max(result['dict']['memory_mb'], 0.01):.0%}")
+
+
+def print_result(result: dict):
+    config = ', '.join(f'{k}={v}' for k, v in result['config'].items())
+    print(f"\n[{config}]")
+    for cycle in result['cycles']:
+        label = '冷启动' if cycle['cycle'] == 0 else f"第 {cycle['cycle']} 轮"
+        print(f"  {label}: {cycle['seconds']:.3f}s, 请求 {cycle['requests']} (304: {cycle['not_modified']}) "
+              f"{cycle['by_endpoint']}")
+    print(f"  峰值内存: {result['peak_rss_mb']} MB")
+    print(f"  通知: 产生 {result['notifications']}, 送达 {result['emails']}, 未送达 {result['undelivered']}, "
+          f"SMTP 连接 {result['smtp_connections']}, 发送速率 {result['notifications_per_second']} 封/秒")
+
+
+def print_comparison(results):
+    columns = ('warm_cycle_seconds', 'warm_cycle_requests', 'warm_not_modified_ratio', 'cold_cycle_seconds',
+               'peak_rss_mb', 'notifications_per_second')
+    print('\n' + ' | '.join(['variant'] + list(columns)))
+    for result in results:
+        changed = result.get('variant') or 'baseline'
+        print(' | '.join([changed] + [str(result[column]) for column in columns]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='GitHub Monitor 基准测试')
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads')
+    parser.add_argument('--detection-mode', dest='detection_mode', choices=('repos', 'events'), default='repos')
+    parser.add_argument('--workers', type=int, default=8, help='线程引擎的工作线程数')
+    parser.add_argument('--connection-limit', dest='connection_limit', type=int, default=100)
+    parser.add_argument('--state-backend', dest='state_backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--digest-window', dest='digest_window', type=float, default=0)
+    parser.add_argument('--spread-ratio', dest='spread_ratio', type=float, default=0)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repos', type=int, default=50, help='每个用户的仓库数')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟 API 延迟（秒）')
+    parser.add_argument('--smtp-latency', dest='smtp_latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit', dest='rate_limit', type=int, default=1000000)
+    parser.add_argument('--cycles', type=int, default=3, help='冷启动之后的检查轮数')
+    parser.add_argument('--churn', type=int, default=10, help='每轮之前推送新提交的仓库数')
+    parser.add_argument('--drain-timeout', dest='drain_timeout', type=float, default=60)
+    parser.add_argument('--token', default='', help='发送给模拟服务器的 token（为空时不验证）')
+    parser.add_argument('--variant', action='append', default=[],
+                        help='参数变体，如 engine=asyncio,detection_mode=events；可重复，每个变体在独立进程中运行')
+    parser.add_argument('--output', help='把结果追加写入 JSON Lines 文件')
+    parser.add_argument('--json', action='store_true', help='只输出 JSON 结果')
+    parser.add_argument('--verbose', action='store_true', help='显示监控程序自身的输出')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='只对比仓库状态的内存占用和对比耗时（字典 vs RepoRecord 快照），不启动模拟服务')
+    parser.add_argument('--startup', action='store_true',
+                        help='对比普通启动和快速启动的耗时（导入、创建实例、检查第一个用户）')
+    parser.add_argument('--repeat', type=int, default=5, help='--startup 模式下每种启动方式的重复次数')
+    return parser.parse_args(argv)
+
+
+def run_variant(argv, variant: str) -> dict:
+    """在独立进程中运行一个变体，保证峰值内存等指标互不影响"""
+    overrides = []
+    for item in filter(None, variant.split(',')):
+        key, _, value = item.partition('=')
+        if key not in VARIANT_KEYS:
+            raise SystemExit(f"未知的变体参数: {key}（可选: {', '.join(VARIANT_KEYS)}）")
+        overrides += [f"--{key.replace('_', '-')}", value]
+    base = [arg for arg in argv if arg != '--json']
+    cleaned, skip = [], False
+    for arg in base:
+        if skip:
+            skip = False
+            continue
+        if arg in ('--variant', '--output'):
+            skip = True
+            continue
+        if arg.startswith(('--variant=', '--output=')):
+            continue
+        cleaned.append(arg)
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), *cleaned, *overrides, '--json'],
+                               check=True, stdout=subprocess.PIPE, text=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['variant'] = variant
+    return result
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.snapshot or args.startup:
+        result = run_snapshot_benchmark(args) if args.snapshot else run_startup_benchmark(args)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(result, timestamp=time.time()), ensure_ascii=False) + '\n')
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        elif args.snapshot:
+            print_snapshot_result(result)
+        else:
+            print_startup_result(result)
+        return
+    results = [run_variant(argv, variant) for variant in args.variant] if args.variant else [run_benchmark(args)]
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(dict(result, timestamp=time.time()), ensure_ascii=False) + '\n')
+    if args.json:
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+        return
+    for result in results:
+        print_result(result)
+    if len(results) > 1:
+        print_comparison(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Dict
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """按用户名统计连续失败次数，超过阈值后在冷却时间内直接拒绝该用户的请求
+
+    冷却结束后放行一次试探请求（半开状态），成功则恢复，失败则冷却时间加倍。
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 300, max_cooldown: float = 3600):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.circuits: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """是否允许向该用户发送请求"""
+        with self.lock:
+            circuit = self.circuits.get(key)
+            if not circuit or circuit['open_until'] is None:
+                return True
+            if time.time() < circuit['open_until']:
+                return False
+            # 半开：只放行一个试探请求
+            if circuit['trial']:
+                return False
+            circuit['trial'] = True
+            return True
+
+    def record_success(self, key: str):
+        with self.lock:
+            self.circuits.pop(key, None)
+
+    def record_failure(self, key: str) -> bool:
+        """记录一次失败，熔断器因此打开时返回 True"""
+        with self.lock:
+            circuit = self.circuits.setdefault(key, {'failures': 0, 'open_until': None,
+                                                     'cooldown': self.cooldown, 'trial': False})
+            circuit['failures'] += 1
+            if circuit['trial']:
+                # 试探失败，加倍冷却时间
+                circuit['cooldown'] = min(self.max_cooldown, circuit['cooldown'] * 2)
+            elif circuit['failures'] < self.threshold:
+                return False
+            circuit['trial'] = False
+            circuit['open_until'] = time.time() + circuit['cooldown']
+            return True
+
+    def is_open(self, key: str) -> bool:
+        with self.lock:
+            circuit = self.circuits.get(key)
+            return bool(circuit and circuit['open_until'] and time.time() < circuit['open_until'])
+
+    def open_until(self, key: str) -> float:
+        with self.lock:
+            circuit = self.circuits.get(key)
+            return circuit['open_until'] if circuit and circuit['open_until'] else 0
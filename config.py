@@ -1,11 +1,91 @@
 # GitHub配置
 GITHUB_TOKEN = ""
 
+# 多个 token（可选）：配置后请求分配给剩余配额最多的 token，配额耗尽或失效的 token 暂停使用直到重置
+GITHUB_TOKENS = []
+
+# 变更检测模式: "repos" 每轮逐仓库检查提交, "events" 先检查用户事件流, 仅对有变化的仓库拉取提交
+DETECTION_MODE = "repos"
+
+# 并发检查的工作线程数（同时也是同时进行的最大 API 请求数）
+MAX_WORKERS = 8
+
+# 监控引擎: "threads" 线程池, "asyncio" 基于 aiohttp 的异步引擎（需安装 aiohttp）
+ENGINE = "threads"
+
+# 异步引擎的最大并发连接数
+CONNECTION_LIMIT = 100
+
+# 把每轮检查均匀分散到检查间隔的这一比例内（0 表示所有用户同时开始）
+SPREAD_RATIO = 0.8
+
+# API 配额紧张时可以推迟检查的低优先级用户
+LOW_PRIORITY_USERS = []
+
+# 自适应检查间隔范围（秒）：活跃用户缩短间隔，长期无变化的用户指数退避
+MIN_CHECK_INTERVAL = 300
+MAX_CHECK_INTERVAL = 21600
+
+# 状态存储后端: "json" 整文件原子写入 monitor_state.json, "sqlite" 增量写入 monitor_state.db（首次启动自动从 JSON 迁移）
+STATE_BACKEND = "json"
+
+# 邮件汇总窗口（秒）：大于 0 时把该时间内产生的通知合并为一封邮件，0 表示每条通知单独发送
+DIGEST_WINDOW = 0
+
+# 通知去重：同一用户、仓库的同一个提交 SHA 在该时间（秒）内只通知一次（保存在 notification_index.db），0 表示不去重
+NOTIFICATION_DEDUP_TTL = 604800
+
+# 把同一用户一次检查中产生的多条通知合并为一封邮件（一条更新记录）
+COALESCE_NOTIFICATIONS = True
+
+# 获取模式: "rest" 逐用户调用 REST 接口, "graphql" 用 GraphQL 批量查询多个用户的仓库和最新提交（需要 GITHUB_TOKEN，失败时自动回退 REST）
+FETCH_MODE = "rest"
+
+# API 请求超时（连接超时, 读取超时）秒，以及 5xx / 二级限流时的最大重试次数
+REQUEST_TIMEOUT = (5, 30)
+MAX_RETRIES = 3
+
+# 指标：大于 0 时在 http://127.0.0.1:<端口>/metrics 提供 Prometheus 格式指标（/metrics.json 为 JSON）；
+# METRICS_FILE 非空时每轮检查结束后把指标快照写入该 JSON 文件
+METRICS_PORT = 0
+METRICS_FILE = ""
+
+# 监控列表文件（.json / .toml / .yaml / .txt）：非空时从该文件读取要监控的用户，
+# 文件修改后（每 WATCH_LIST_INTERVAL 秒检查一次，或发送 SIGHUP）无需重启即生效
+WATCH_LIST_FILE = ""
+WATCH_LIST_INTERVAL = 30
+
+# Webhook 接收：WEBHOOK_PORT 大于 0 时在 http://<WEBHOOK_HOST>:<端口>/webhook 接收 push / repository 事件，
+# 必须设置与 GitHub webhook 相同的 WEBHOOK_SECRET；WEBHOOK_USERS 中的用户（已配置 webhook 的账号或组织）
+# 轮询间隔不低于 WEBHOOK_RECONCILE_INTERVAL 秒，仅用于补漏
+WEBHOOK_PORT = 0
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_SECRET = ""
+WEBHOOK_USERS = []
+WEBHOOK_RECONCILE_INTERVAL = 21600
+
+# 快速启动：启动时不单独请求 /user 验证 token（由第一次实际请求的响应验证），
+# 各用户的仓库状态在第一次检查该用户时才读取，适合定时任务等频繁启动的场景
+FAST_START = False
+
+# 单次运行（适合 systemd timer / Kubernetes CronJob）：检查一遍所有用户、发送通知后退出，
+# 退出码 0 全部完成，1 有用户检查出错，2 到达 RUN_ONCE_DEADLINE 秒时限仍有用户未检查（下次运行继续），
+# 3 仍有通知未发送成功（下次运行重试）。RUN_ONCE_DEADLINE 为 0 表示不限时；单次运行时不使用分片模式
+RUN_ONCE = False
+RUN_ONCE_DEADLINE = 0
+
+# 分片模式：大于 1 时启动多个工作进程，按一致性哈希分配用户，token 按进程轮流分配；
+# 各进程共享 SQLite 状态库和通知队列（自动使用 sqlite 状态存储），通知由主进程统一发送。
+# 进程退出后其余进程在 SHARD_LEASE_TTL 秒内接管它的用户。分片模式下不启动 webhook 接收
+SHARD_WORKERS = 0
+SHARD_LEASE_TTL = 30
+
 # 邮件配置
 EMAIL_CONFIG = {
     "smtp_server": "smtp.gmail.com",  # Gmail SMTP服务器
     "smtp_port": 587,                 # Gmail TLS端口
     "sender": "", # 您的Gmail邮箱地址
     "password": "",  # Gmail应用专用密码
-    "receiver": ""  # 接收通知的邮箱地址
+    "receiver": "",  # 接收通知的邮箱地址（多个地址用逗号分隔）
+    # "smtp_security": "starttls",  # 可选: starttls / ssl / none，默认按端口判断
 } 
\ No newline at end of file
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, Set, Tuple
+
+
+class DedupIndex:
+    """已经通知过的 (用户, 仓库, 提交 SHA) 索引，ttl 秒内同一个提交不再重复通知
+
+    保存在 SQLite（WAL 模式）中，重启后和分片模式的多个进程之间共享；
+    记录与判断在同一条 UPSERT 语句中完成，多个进程同时处理同一个提交时只有一个会通知。
+    """
+
+    def __init__(self, db_file: str = 'notification_index.db', ttl: float = 604800, prune_interval: float = 3600):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.prune_interval = prune_interval  # 清理过期记录的最短间隔
+        self.last_prune = 0.0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS notified ('
+                          'username TEXT NOT NULL, repo TEXT NOT NULL, sha TEXT NOT NULL, notified_at REAL NOT NULL, '
+                          'PRIMARY KEY (username, repo, sha)) WITHOUT ROWID')
+        self.conn.commit()
+
+    def claim(self, username: str, keys: Iterable[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        """登记一个用户的 (仓库, SHA)，返回其中需要通知的（没有记录或上次通知已超过 ttl）"""
+        now = time.time()
+        claimed = set()
+        with self.lock:
+            with self.conn:
+                for repo, sha in keys:
+                    cursor = self.conn.execute(
+                        'INSERT INTO notified (username, repo, sha, notified_at) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (username, repo, sha) DO UPDATE SET notified_at = excluded.notified_at '
+                        'WHERE notified.notified_at <= ?', (username, repo, sha, now, now - self.ttl))
+                    if cursor.rowcount:
+                        claimed.add((repo, sha))
+                if now - self.last_prune >= self.prune_interval:
+                    self.conn.execute('DELETE FROM notified WHERE notified_at <= ?', (now - self.ttl,))
+                    self.last_prune = now
+        return claimed
+
+    def release(self, username: str, keys: Iterable[Tuple[str, str]]):
+        """撤销 claim 登记的记录（状态保存或通知入队失败时调用），下次检查到同一提交时仍会通知"""
+        with self.lock:
+            with self.conn:
+                self.conn.executemany('DELETE FROM notified WHERE username = ? AND repo = ? AND sha = ?',
+                                      [(username, repo, sha) for repo, sha in keys])
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM notified').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class DurableQueue:
+    """基于 SQLite 的持久化通知队列
+
+    通知先写入磁盘再发送，发送失败按指数退避重试，超过最大次数后转入死信表；
+    进程重启后未完成的通知会自动重新投递。接口与 queue.Queue 的 put 保持一致。
+    """
+
+    def __init__(self, db_file: str = 'notification_queue.db', max_attempts: int = 8,
+                 base_delay: float = 30, max_delay: float = 3600, lease_timeout: float = 300,
+                 recover: bool = True, poll_interval: Optional[float] = None):
+        self.db_file = db_file
+        self.lease_timeout = lease_timeout  # 取出后未确认的通知在此时间后重新投递
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 其他进程也会写入同一个队列时（分片模式），等待时间不超过该值，以便发现新通知
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                          'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, '
+                          'attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, '
+                          'leased INTEGER NOT NULL DEFAULT 0, '
+                          'created_at REAL NOT NULL, last_error TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS dead_letter ('
+                          'id INTEGER PRIMARY KEY, payload TEXT NOT NULL, attempts INTEGER NOT NULL, '
+                          'created_at REAL NOT NULL, failed_at REAL NOT NULL, last_error TEXT)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt)')
+        if recover:
+            # 上次退出时正在发送的通知立即重新投递（只写入不发送的进程不能这样做，否则会重复发送）
+            self.conn.execute('UPDATE outbox SET leased = 0, next_attempt = MIN(next_attempt, ?) WHERE leased = 1',
+                              (time.time(),))
+        self.conn.commit()
+
+    def put(self, item: Dict):
+        """写入一条待发送的通知"""
+        now = time.time()
+        with self.not_empty:
+            with self.conn:
+                self.conn.execute('INSERT INTO outbox (payload, next_attempt, created_at) VALUES (?, ?, ?)',
+                                  (json.dumps(item, ensure_ascii=False), now, now))
+            self.not_empty.notify()
+
+    def get_batch(self, max_items: int = 50, timeout: Optional[float] = None) -> List:
+        """取出已到重试时间的一批通知，返回 [(id, item)]；超时仍没有可发送的通知时返回空列表"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.not_empty:
+            while True:
+                now = time.time()
+                rows = self.conn.execute('SELECT id, payload FROM outbox WHERE next_attempt <= ? '
+                                         'ORDER BY id LIMIT ?', (now, max_items)).fetchall()
+                if rows:
+                    with self.conn:
+                        self.conn.executemany('UPDATE outbox SET leased = 1, next_attempt = ? WHERE id = ?',
+                                              [(now + self.lease_timeout, row_id) for row_id, _ in rows])
+                    return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+                # 最近一条待重试通知的时间决定最长等待时间
+                row = self.conn.execute('SELECT MIN(next_attempt) FROM outbox').fetchone()
+                wait = None if row[0] is None else max(0.0, row[0] - now)
+                if self.poll_interval is not None:
+                    wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.not_empty.wait(wait)
+
+    def ack(self, ids: List[int]):
+        """发送成功后删除通知"""
+        if not ids:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+
+    def fail(self, ids: List[int], error: str, payloads: Optional[Dict[int, Dict]] = None):
+        """发送失败：按指数退避安排重试，超过最大次数的转入死信表
+
+        payloads 为 {id: 通知} 时同时更新通知内容（如记录已经送达的收件人）。
+        """
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                for row_id in ids:
+                    row = self.conn.execute('SELECT payload, attempts, created_at FROM outbox WHERE id = ?',
+                                            (row_id,)).fetchone()
+                    if row is None:
+                        continue
+                    payload, attempts, created_at = row
+                    if payloads and row_id in payloads:
+                        payload = json.dumps(payloads[row_id], ensure_ascii=False)
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        self.conn.execute('INSERT OR REPLACE INTO dead_letter '
+                                          '(id, payload, attempts, created_at, failed_at, last_error) '
+                                          'VALUES (?, ?, ?, ?, ?, ?)',
+                                          (row_id, payload, attempts, created_at, now, error))
+                        self.conn.execute('DELETE FROM outbox WHERE id = ?', (row_id,))
+                        continue
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                    self.conn.execute('UPDATE outbox SET payload = ?, attempts = ?, next_attempt = ?, last_error = ?, '
+                                      'leased = 0 WHERE id = ?', (payload, attempts, now + delay, error, row_id))
+
+    def replay_dead_letters(self) -> int:
+        """把死信表中的通知重新放回发送队列，返回数量"""
+        now = time.time()
+        with self.not_empty:
+            with self.conn:
+                rows = self.conn.execute('SELECT payload, created_at FROM dead_letter').fetchall()
+                self.conn.executemany('INSERT INTO outbox (payload, next_attempt, created_at) VALUES (?, ?, ?)',
+                                      [(payload, now, created_at) for payload, created_at in rows])
+                self.conn.execute('DELETE FROM dead_letter')
+            self.not_empty.notify_all()
+        return len(rows)
+
+    def qsize(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def dead_letter_count(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM dead_letter').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
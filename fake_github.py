@@ -0,0 +1,246 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+# 基准测试专用的控制接口前缀，不会与 GitHub API 路径冲突
+CONTROL_PREFIX = '/__bench__'
+
+
+class BenchmarkHTTPServer(ThreadingHTTPServer):
+    """默认的 listen 队列只有 5，大量并发连接同时建立时会被内核丢弃并在客户端重试，
+    测出的是连接排队而不是监控程序本身的开销"""
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+
+def _iso(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeGitHub:
+    """本地模拟的 GitHub REST API，用于基准测试和压力测试
+
+    生成 users × repos 个仓库，支持 ETag/304、Link 分页、X-RateLimit-* 响应头、
+    事件流和可配置的响应延迟；revoked_tokens 中的 token 一律返回 401。
+    通过控制接口可以制造推送和新建仓库，并读取请求统计：
+      GET  /__bench__/stats           请求计数
+      POST /__bench__/churn?count=N   随机选择 N 个仓库推送新提交
+      POST /__bench__/reset_stats     清零计数
+    """
+
+    def __init__(self, users: int = 10, repos: int = 50, latency: float = 0.0,
+                 rate_limit: int = 1000000, reset_after: int = 3600, poll_interval: int = 0,
+                 revoked_tokens=()):
+        self.latency = latency  # 每个请求的模拟延迟（秒）
+        self.revoked_tokens = set(revoked_tokens)  # 模拟已吊销的 token
+        self.rate_limit = rate_limit
+        self.reset_after = reset_after
+        self.poll_interval = poll_interval  # 事件流返回的 X-Poll-Interval
+        self.lock = threading.Lock()
+        self.remaining = rate_limit
+        self.reset_at = int(time.time()) + reset_after
+        self.stats = {'requests': 0, 'not_modified': 0, 'rate_limited': 0, 'unauthorized': 0, 'by_endpoint': {}}
+        self.clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.churn_counter = 0
+        self.users: Dict[str, Dict[str, Dict]] = {}
+        for u in range(users):
+            username = f'user{u}'
+            self.users[username] = {}
+            for r in range(repos):
+                self._create_repo(username, f'repo{r}', u * 1000000 + r)
+
+    def _tick(self) -> str:
+        self.clock += timedelta(seconds=1)
+        return _iso(self.clock)
+
+    def _create_repo(self, username: str, name: str, repo_id: int):
+        created = self._tick()
+        self.users[username][name] = {
+            'id': repo_id, 'name': name, 'full_name': f'{username}/{name}',
+            'html_url': f'https://github.com/{username}/{name}', 'description': None, 'fork': False,
+            'created_at': created, 'updated_at': created, 'pushed_at': created,
+            'commits': [self._commit(name, created, 'Initial commit')],
+        }
+
+    def _commit(self, repo: str, date: str, message: str) -> Dict:
+        sha = hashlib.sha1(f'{repo}{date}{message}'.encode()).hexdigest()
+        return {'sha': sha, 'commit': {'author': {'name': 'bench', 'date': date}, 'message': message},
+                'html_url': f'https://github.com/commit/{sha}'}
+
+    def churn(self, count: int) -> int:
+        """按固定顺序轮流选择仓库推送新提交，返回实际推送的数量"""
+        with self.lock:
+            repos = [(u, r) for u, user_repos in self.users.items() for r in user_repos]
+            if not repos:
+                return 0
+            for _ in range(count):
+                username, name = repos[(self.churn_counter * 7919) % len(repos)]
+                self.churn_counter += 1
+                repo = self.users[username][name]
+                when = self._tick()
+                repo['pushed_at'] = repo['updated_at'] = when
+                repo['commits'].insert(0, self._commit(name, when, f'change {self.churn_counter}'))
+                del repo['commits'][30:]
+            return min(count, len(repos))
+
+    def _events(self, username: str):
+        repos = sorted(self.users[username].values(), key=lambda r: r['pushed_at'], reverse=True)[:30]
+        return [{'id': f"{r['id']}-{r['pushed_at']}", 'type': 'PushEvent',
+                 'repo': {'name': r['full_name']}, 'created_at': r['pushed_at']} for r in repos]
+
+    def _route(self, path: str, query: Dict):
+        """返回 (状态码, 数据, 额外响应头, 接口名)"""
+        match = re.match(r'^/users/([^/]+)/repos$', path)
+        if match:
+            repos = self.users.get(match[1])
+            if repos is None:
+                return 404, {'message': 'Not Found'}, {}, 'repos'
+            per_page = int(query.get('per_page', ['30'])[0])
+            page = int(query.get('page', ['1'])[0])
+            items = list(repos.values())[(page - 1) * per_page:page * per_page]
+            data = [{k: v for k, v in repo.items() if k != 'commits'} for repo in items]
+            headers = {}
+            if page * per_page < len(repos):
+                headers['Link'] = f'<{{base}}{path}?per_page={per_page}&page={page + 1}>; rel="next"'
+            return 200, data, headers, 'repos'
+
+        match = re.match(r'^/users/([^/]+)/events$', path)
+        if match:
+            if match[1] not in self.users:
+                return 404, {'message': 'Not Found'}, {}, 'events'
+            return 200, self._events(match[1]), {'X-Poll-Interval': str(self.poll_interval)}, 'events'
+
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/commits$', path)
+        if match:
+            repo = self.users.get(match[1], {}).get(match[2])
+            if repo is None:
+                return 404, {'message': 'Not Found'}, {}, 'commits'
+            commits = repo['commits']
+            since = query.get('since', [None])[0]
+            if since:
+                commits = [c for c in commits if c['commit']['author']['date'] >= since]
+            per_page = int(query.get('per_page', ['30'])[0])
+            page = int(query.get('page', ['1'])[0])
+            headers = {}
+            if page * per_page < len(commits):
+                params = f"per_page={per_page}&page={page + 1}" + (f"&since={since}" if since else '')
+                headers['Link'] = f'<{{base}}{path}?{params}>; rel="next"'
+            return 200, commits[(page - 1) * per_page:page * per_page], headers, 'commits'
+
+        if path == '/user':
+            return 200, {'login': 'bench'}, {}, 'user'
+        if path == '/rate_limit':
+            core = {'limit': self.rate_limit, 'remaining': self.remaining, 'reset': self.reset_at}
+            return 200, {'resources': {'core': core}, 'rate': core}, {}, 'rate_limit'
+        return 404, {'message': 'Not Found'}, {}, 'other'
+
+    def handle(self, path: str, query: Dict, if_none_match: str, authorization: str = None):
+        """处理一个 API 请求，返回 (状态码, 响应体, 响应头)"""
+        with self.lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.remaining = self.rate_limit
+                self.reset_at = int(now) + self.reset_after
+            token = (authorization or '').partition(' ')[2]
+            if token in self.revoked_tokens:
+                self.stats['requests'] += 1
+                self.stats['unauthorized'] += 1
+                return 401, json.dumps({'message': 'Bad credentials'}).encode('utf-8'), {}
+            status, data, headers, endpoint = self._route(path, query)
+            body = json.dumps(data).encode('utf-8')
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            self.stats['requests'] += 1
+            self.stats['by_endpoint'][endpoint] = self.stats['by_endpoint'].get(endpoint, 0) + 1
+
+            if status == 200 and if_none_match == etag:
+                # 与 GitHub 一致：304 不消耗配额
+                status, body = 304, b''
+                self.stats['not_modified'] += 1
+            elif endpoint != 'rate_limit':
+                if self.remaining <= 0:
+                    self.stats['rate_limited'] += 1
+                    status, body = 403, json.dumps({'message': 'API rate limit exceeded'}).encode('utf-8')
+                else:
+                    self.remaining -= 1
+
+            headers = dict(headers, **{
+                'ETag': etag,
+                'X-RateLimit-Limit': str(self.rate_limit),
+                'X-RateLimit-Remaining': str(self.remaining),
+                'X-RateLimit-Reset': str(self.reset_at),
+                'X-RateLimit-Resource': 'core',
+            })
+        return status, body, headers
+
+    def snapshot_stats(self) -> Dict:
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'not_modified': 0, 'rate_limited': 0, 'unauthorized': 0, 'by_endpoint': {}}
+
+    def serve(self, port: int = 0, host: str = '127.0.0.1', extra_stats=None):
+        """在后台线程启动 HTTP 服务，返回 server；extra_stats 的结果会合并到统计接口"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive，与真实 API 一致
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Dict = None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value.replace('{base}', f'http://{self.headers["Host"]}'))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _control(self, path: str, query: Dict):
+                if path == f'{CONTROL_PREFIX}/stats':
+                    stats = fake.snapshot_stats()
+                    if extra_stats:
+                        stats.update(extra_stats())
+                    return self._send(200, json.dumps(stats).encode('utf-8'))
+                if path == f'{CONTROL_PREFIX}/churn':
+                    count = fake.churn(int(query.get('count', ['1'])[0]))
+                    return self._send(200, json.dumps({'pushed': count}).encode('utf-8'))
+                if path == f'{CONTROL_PREFIX}/reset_stats':
+                    fake.reset_stats()
+                    return self._send(200, b'{}')
+                return self._send(404, b'{}')
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.startswith(CONTROL_PREFIX):
+                    return self._control(url.path, query)
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, body, headers = fake.handle(url.path, query, self.headers.get('If-None-Match'),
+                                                    self.headers.get('Authorization'))
+                self._send(status, body, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                url = urlparse(self.path)
+                if url.path.startswith(CONTROL_PREFIX):
+                    return self._control(url.path, parse_qs(url.query))
+                self._send(404, json.dumps({'message': 'Not Found'}).encode('utf-8'))
+
+        server = BenchmarkHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
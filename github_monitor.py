@@ -1,15 +1,30 @@
 import requests
-import smtplib
-import json
 import time
 import threading
-from email.mime.text import MIMEText
-from email.header import Header
 from datetime import datetime, timezone
-from typing import Dict, List
-from queue import Queue
+from typing import Dict, Iterator, List
 import os
-import ssl
+import random
+import re
+import signal
+from contextvars import ContextVar
+from http_cache import HTTPCache
+from worker_pool import WorkerPool
+from state_store import STATE_SECTIONS, create_state_store
+from update_log import UpdateLog
+from smtp_pool import SMTPConnection
+from durable_queue import DurableQueue
+from dedup_index import DedupIndex
+from graphql_fetcher import GraphQLFetcher
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import Metrics
+from timer_scheduler import TimerScheduler
+from watch_list import WatchList
+from webhook_receiver import WebhookReceiver
+from token_pool import TokenPool
+from run_checkpoint import RunCheckpoint
+from repo_snapshot import (LazySnapshots, RepoRecord, SnapshotDiff, SnapshotDiffer, UserSnapshot, diff_snapshots,
+                           format_time, is_updated, parse_time)
 
 # Windows系统启用ANSI支持
 if os.name == 'nt':
@@ -22,113 +37,505 @@ class Colors:
     YELLOW = '\033[93m'
     ENDC = '\033[0m'  # 结束颜色
 
+# 监控只需要仓库列表中的这些字段
+REPO_FIELDS = ('id', 'name', 'created_at', 'updated_at', 'pushed_at', 'html_url')
+
+# 获取提交时返回这些状态码的仓库记为无法访问（409 为空仓库）
+INACCESSIBLE_STATUSES = (403, 404, 409, 451)
+
+# 指标中的接口标签：把用户名和仓库名替换为占位符，避免标签数量随用户增长
+ENDPOINT_PATTERNS = (
+    (re.compile(r'^/users/[^/]+/repos$'), '/users/{user}/repos'),
+    (re.compile(r'^/users/[^/]+/events$'), '/users/{user}/events'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/commits$'), '/repos/{owner}/{repo}/commits'),
+    (re.compile(r'^/users/[^/]+$'), '/users/{user}'),
+)
+
+# run_once 的退出码：全部完成 / 有用户检查出错 / 到达时限仍有用户未检查 / 仍有通知未发送成功
+EXIT_OK = 0
+EXIT_CHECK_FAILED = 1
+EXIT_DEADLINE = 2
+EXIT_UNDELIVERED = 3
+
+# 当前正在检查的用户，供统一请求层按用户熔断（线程和协程各自独立）
+current_user = ContextVar('current_user', default=None)
+
+
+class RequestCancelled(Exception):
+    """监控正在停止，放弃还在等待限流或重试的请求"""
+
+
 class GitHubMonitor:
-    def __init__(self, token, email_config):
-        self.session = requests.Session()
-        if token:
-            self.session.headers.update({'Authorization': f'token {token}'})
-            # 验证 token
-            try:
-                response = self.session.get('https://api.github.com/user')
-                if response.status_code == 200:
-                    print(f"{Colors.GREEN}GitHub Token 验证成功{Colors.ENDC}")
-                else:
-                    print(f"{Colors.RED}GitHub Token 可能无效: {response.status_code}{Colors.ENDC}")
-            except Exception as e:
-                print(f"{Colors.RED}验证 GitHub Token 时出错: {str(e)}{Colors.ENDC}")
+    def __init__(self, token, email_config, detection_mode: str = 'repos', max_workers: int = 8,
+                 api_base: str = 'https://api.github.com', spread_ratio: float = 0.0,
+                 low_priority_users: List[str] = None, min_interval: int = 300, max_interval: int = 21600,
+                 state_backend: str = 'json', digest_window: float = 0, smtp_idle_timeout: float = 60,
+                 fetch_mode: str = 'rest', request_timeout=(5, 30), max_retries: int = 3,
+                 metrics_port: int = 0, metrics_file: str = None, webhook_port: int = 0,
+                 webhook_secret: str = None, webhook_host: str = '0.0.0.0', webhook_users: List[str] = None,
+                 reconcile_interval: int = 21600, shard=None, fast_start: bool = False, dedup_ttl: float = 0,
+                 coalesce: bool = False):
+        # 分片模式下只检查一致性哈希分配给本进程的用户，状态库和通知队列与其他进程共享
+        self.shard = shard
+        if shard is not None and state_backend != 'sqlite':
+            raise ValueError("分片模式需要多个进程共享状态，必须使用 sqlite 状态存储")
+        self.api_base = api_base.rstrip('/')  # 可指向本地模拟服务器
+        # 快速启动：不在启动时请求 /user 验证 token，各用户的仓库状态在第一次用到时才读取
+        self.fast_start = fast_start
+        self.unverified_tokens = set()  # 快速启动时还没有发出过请求的 token
+        # token 可以是单个字符串或列表，每个 token 有独立的 Session 和配额状态
+        self.token_pool = TokenPool(token, pool_size=max_workers)
+        self.session = self.token_pool.clients[0].session
+        self.request_timeout = request_timeout  # (连接超时, 读取超时) 秒
+        self.max_retries = max_retries  # 5xx / 二级限流时的最大重试次数
+        self.circuit_breaker = CircuitBreaker()  # 按用户熔断，避免单个异常账号拖慢其他用户
         self.email_config = email_config
+        self.smtp = SMTPConnection(email_config, idle_timeout=smtp_idle_timeout)  # 复用的 SMTP 长连接
+        self.digest_window = digest_window  # 大于 0 时把该时间窗口内的通知合并为一封汇总邮件
         self.last_check = {}
         self.known_repos = {}
-        self.notification_queue = Queue()
-        self.update_file = 'update.json'
-        self.state_file = 'monitor_state.json'
+        # 持久化的待发送通知；分片的工作进程只写入，由协调进程发送
+        self.notification_queue = DurableQueue('notification_queue.db', recover=shard is None)
+        self.update_log = UpdateLog('update.jsonl')  # 追加写入的更新记录
+        # 大于 0 时按 (用户, 仓库, 提交 SHA) 去重，该时间内同一个提交只通知一次
+        self.dedup = DedupIndex('notification_index.db', ttl=dedup_ttl) if dedup_ttl > 0 else None
+        self.pending_claims = {}  # 本次检查在去重索引中登记、但通知还没有入队的 (仓库, SHA)
+        # 每个用户一把锁：轮询提交结果与 webhook 更新同一用户的快照时互斥
+        self.user_locks = {}
+        self.user_locks_guard = threading.Lock()
+        self.coalesce = coalesce  # 把同一用户一次检查中的多条通知合并为一条
+        self.state_store = create_state_store(state_backend)  # 'json' 或 'sqlite'
         self.inaccessible_repos = {}  # 新增：记录无法访问的仓库
+        # 条件请求缓存，分片模式下每个进程一份
+        self.http_cache = HTTPCache(f'http_cache.{shard.worker_id}.json' if shard is not None else 'http_cache.json')
+        # 变更检测模式: 'repos' 每轮逐仓库拉取提交, 'events' 先查看用户事件流
+        self.detection_mode = detection_mode
+        self.events_poll_after = {}  # 按 X-Poll-Interval 记录各用户下次允许拉取事件的时间
+        self.new_commits = {}  # 本次检查中各用户仓库游标之后的新提交，用于通知中的提交摘要
+        self.max_new_commits = 300  # 单个仓库一次最多获取的新提交数（超过时按页数截断）
+        self.commit_summary_limit = 10  # 通知中最多列出的提交数
+        self.cycle_stats = {}  # 本轮检查的统计数据
+        self.stats_lock = threading.Lock()
+        self.worker_pool = WorkerPool(max_workers)  # 固定大小的检查线程池
+        self.check_latency = {}  # 每个用户最近一次检查耗时（秒）
+        self.spread_ratio = spread_ratio  # 把一轮检查分散到检查间隔的这一比例内，0 表示同时开始
+        self.low_priority_users = set(low_priority_users or [])  # 配额紧张时可推迟检查的用户
+        self.check_interval = 1800  # 新用户的初始检查间隔，由 monitor_users 设置
+        self.min_interval = min_interval  # 活跃用户的最短检查间隔
+        self.max_interval = max_interval  # 不活跃用户退避后的最长检查间隔
+        self.recent_push_window = 86400  # 最近一次推送在此时间内视为活跃用户
+        self.schedule = {}  # 每个用户的检查间隔和下次检查时间
+        self.scheduler = TimerScheduler()  # 用户检查、状态报告和状态保存的定时任务
+        self.stop_event = threading.Event()  # 收到退出信号后不再开始新的检查
+        self.status_interval = 900  # 每15分钟显示一次状态
+        self.flush_interval = 300  # 定期保存状态和请求缓存的间隔
+        self.overdue_retry = 60  # 已到期但未被检查的用户（如退出前没来得及提交的用户）的重试间隔
+        self.round_started = 0.0  # 最近一轮检查的开始时间
+        self.round_users = None  # 正在进行的一轮检查的到期用户，None 表示没有进行中的检查
+        self.round_remaining = 0  # 本轮还没检查完的用户数
+        self.round_lock = threading.Lock()
+        self.usernames = []  # 当前监控的用户列表（分片模式下只包含本进程负责的用户）
+        self.all_usernames = []  # 监控列表中的全部用户
+        self.pending_users = []  # 分片模式下已分配给本进程、但原持有进程还没有交出的用户
+        self.watch_list = None  # 可热加载的监控列表文件
+        self.watch_interval = 30  # 检查监控列表文件是否变化的间隔
+        self.checkpoint = None  # run_once 的进度文件，每个用户检查完成后记录
+        # 获取模式: 'rest' 逐用户调用 REST 接口, 'graphql' 每轮开始时批量查询（需要 token，失败时回退到 REST）
+        self.fetch_mode = fetch_mode if self.token_pool.authenticated else 'rest'
+        self.graphql = GraphQLFetcher(self)
+        self.prefetched_states = {}  # 本轮通过 GraphQL 预先获取的用户仓库状态
+        self.metrics_port = metrics_port  # 大于 0 时在本地该端口提供 /metrics
+        self.metrics_file = metrics_file  # 每轮检查结束后导出 JSON 指标的文件
+        self.cycle_started = None
+        self.metrics = Metrics()
+        self._register_metrics()
+        # webhook 模式：webhook_users 中的用户由 webhook 实时通知，轮询只作为低频对账
+        self.webhook = WebhookReceiver(self, webhook_secret, webhook_port, webhook_host) if webhook_port else None
+        self.webhook_users = set(webhook_users or [])
+        self.reconcile_interval = reconcile_interval  # webhook 用户的最短轮询间隔
+        if self.token_pool.authenticated:
+            if fast_start:
+                self.unverified_tokens = set(self.token_pool.clients)  # 由第一次实际请求的响应完成验证
+            else:
+                self._validate_token()
         self.load_state()  # 加载上次的状态
 
+    def _register_metrics(self):
+        """声明指标说明，注册在导出时读取的仪表"""
+        m = self.metrics
+        m.describe('github_api_requests_total', 'GitHub API requests by endpoint and status')
+        m.describe('github_api_request_seconds', 'GitHub API request latency')
+        m.describe('github_cache_hits_total', 'Conditional requests answered from the local cache (304)')
+        m.describe('user_check_seconds', 'Per-user check latency')
+        m.describe('user_check_last_seconds', 'Latest check latency of each user')
+        m.describe('cycle_seconds', 'Duration of a full check cycle')
+        m.describe('email_send_seconds', 'SMTP send latency')
+        m.describe('emails_sent_total', 'Emails sent by result')
+        m.describe('notifications_total', 'Notifications produced by checks')
+        m.describe('notifications_suppressed_total', 'Notifications dropped by the dedup index')
+        m.describe('webhooks_total', 'Webhook deliveries by event and result')
+        m.describe('github_token_requests_total', 'GitHub API requests by token')
+        m.gauge_callback('rate_limit_remaining', self.token_pool.remaining)
+        m.gauge_callback('notification_queue_depth', self.notification_queue.qsize)
+        m.gauge_callback('notification_dead_letters', self.notification_queue.dead_letter_count)
+
+    def _endpoint_label(self, url: str) -> str:
+        path = url[len(self.api_base):] if url.startswith(self.api_base) else url
+        path = path.split('?', 1)[0]
+        for pattern, label in ENDPOINT_PATTERNS:
+            if pattern.match(path):
+                return label
+        return path
+
+    def _record_request(self, method: str, url: str, status, elapsed: float):
+        """记录一次 API 请求的指标，status 为 'error' 表示网络错误或超时"""
+        endpoint = self._endpoint_label(url)
+        self.metrics.inc('github_api_requests_total', method=method, endpoint=endpoint, status=status)
+        self.metrics.observe('github_api_request_seconds', elapsed, endpoint=endpoint)
+
+    def _record_check_latency(self, username: str, started: float):
+        elapsed = time.monotonic() - started
+        self.check_latency[username] = elapsed
+        self.metrics.observe('user_check_seconds', elapsed)
+        self.metrics.set('user_check_last_seconds', elapsed, user=username)
+
+    def start_metrics(self):
+        """按配置启动本地指标服务"""
+        if self.metrics_port and self.metrics.server is None:
+            self.metrics.serve(self.metrics_port)
+            print(f"{Colors.BLUE}指标服务: {Colors.YELLOW}http://127.0.0.1:{self.metrics_port}/metrics{Colors.ENDC}")
+
+    def start_webhook(self):
+        """按配置启动 webhook 接收服务"""
+        if self.webhook is not None and self.webhook.server is None:
+            self.webhook.serve()
+            print(f"{Colors.BLUE}Webhook 接收地址: {Colors.YELLOW}http://{self.webhook.host}:{self.webhook.port}"
+                  f"{self.webhook.path}{Colors.ENDC} {Colors.BLUE}(对账轮询间隔 {self.reconcile_interval}秒){Colors.ENDC}")
+
+    def _token_label(self, client) -> str:
+        return f" {client.label}" if len(self.token_pool.clients) > 1 else ''
+
+    def _validate_token(self):
+        """验证 token（配置了多个 token 时逐个验证）"""
+        for client in self.token_pool.clients:
+            label = self._token_label(client)
+            try:
+                response = self.request('GET', f'{self.api_base}/user', client=client)
+                if response.status_code == 200:
+                    print(f"{Colors.GREEN}GitHub Token{label} 验证成功{Colors.ENDC}")
+                else:
+                    print(f"{Colors.RED}GitHub Token{label} 可能无效: {response.status_code}{Colors.ENDC}")
+            except Exception as e:
+                print(f"{Colors.RED}验证 GitHub Token{label} 时出错: {str(e)}{Colors.ENDC}")
+
+    def _verify_token_response(self, client, status_code: int):
+        """快速启动模式下，token 第一次实际请求的响应代替启动时的 /user 验证（只有 401 表示无效）"""
+        with self.stats_lock:
+            if client not in self.unverified_tokens:
+                return
+            self.unverified_tokens.discard(client)
+        label = self._token_label(client)
+        if status_code == 401:
+            print(f"{Colors.RED}GitHub Token{label} 可能无效: {status_code}{Colors.ENDC}")
+        else:
+            print(f"{Colors.GREEN}GitHub Token{label} 验证成功{Colors.ENDC}")
+
     def load_state(self):
         """加载上次保存的监控状态"""
+        if self.shard is not None:
+            # 分片模式在分配到用户时才读取这些用户的状态
+            return
         try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    state = json.load(f)
-                    self.known_repos = state.get('repos', {})
-                    self.last_check = state.get('last_check', {})
-                    self.inaccessible_repos = state.get('inaccessible_repos', {})  # 加载无法访问的仓库记录
-                    print(f"{Colors.BLUE}已加载上次的监控状态{Colors.ENDC}")
+            if self.fast_start:
+                # 只读取调度等按用户保存的小状态，仓库状态在第一次检查该用户时才读取和转换
+                state = self.state_store.load(repos=False)
+                self.known_repos = LazySnapshots(self.state_store.repo_users(), self.state_store.load_repos)
+            else:
+                state = self.state_store.load()
+                self.known_repos = {username: UserSnapshot.from_state(username, repos)
+                                    for username, repos in state['repos'].items()}
+            self.last_check = state['last_check']
+            self.inaccessible_repos = state['inaccessible_repos']  # 加载无法访问的仓库记录
+            self.schedule = state['schedule']
+            if self.known_repos:
+                print(f"{Colors.BLUE}已加载上次的监控状态{Colors.ENDC}")
             else:
                 print(f"{Colors.BLUE}未找到历史状态，将创建新的监控状态{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}加载状态文件失败: {str(e)}{Colors.ENDC}")
 
-    def save_state(self):
-        """保存当前的监控状态"""
+    def _acquire_users(self, usernames: List[str]):
+        """从共享状态库读取新分配到本进程的用户状态"""
+        if not usernames:
+            return
+        state = self.state_store.load(usernames)
+        for username, repos in state['repos'].items():
+            self.known_repos[username] = UserSnapshot.from_state(username, repos)
+        for section in STATE_SECTIONS:
+            getattr(self, section).update(state[section])
+
+    def _release_users(self, usernames: List[str]):
+        """保存并丢弃交给其他进程的用户状态，避免之后用过期的状态覆盖"""
+        for username in usernames:
+            self.save_state(username)
+        for username in usernames:
+            self.known_repos.pop(username, None)
+            self.events_poll_after.pop(username, None)
+            for section in STATE_SECTIONS:
+                getattr(self, section).pop(username, None)
+        self.state_store.forget(usernames)
+        if self.shard is not None:
+            self.shard.release_users(usernames)  # 状态已经写入共享库，其他进程此后才能认领
+
+    def _sync_shard_users(self, usernames: List[str]):
+        """按哈希环重新计算本进程负责的用户，返回 (新认领的用户, 交出的用户)
+
+        先保存并释放不再负责的用户，再认领新分配的用户；原持有进程还没有释放的用户
+        暂时留在 pending_users 中，等下次心跳重试，保证同一用户同时只有一个进程在检查。
+        """
+        desired = self.shard.owned(usernames)
+        desired_set = set(desired)
+        removed = [u for u in self.usernames if u not in desired_set]
+        self._release_users(removed)
+        held = set(self.usernames) - set(removed)
+        wanted = [u for u in desired if u not in held]
+        added = self.shard.claim(wanted)
+        self._acquire_users(added)
+        held.update(added)
+        self.pending_users = [u for u in wanted if u not in held]
+        self.usernames = [u for u in desired if u in held]
+        if self.pending_users:
+            print(f"{Colors.YELLOW}等待其他进程交出 {len(self.pending_users)} 个用户后再开始检查{Colors.ENDC}")
+        return added, removed
+
+    def _shard_heartbeat_loop(self):
+        """独立的续约线程：调度线程可能被一整轮检查阻塞，续约不能等它"""
+        while not self.stop_event.wait(self.shard.heartbeat_interval):
+            try:
+                changed = self.shard.heartbeat()
+            except Exception as e:
+                print(f"{Colors.RED}续约分片租约失败: {str(e)}{Colors.ENDC}")
+                continue
+            if changed:
+                print(f"{Colors.BLUE}分片成员已变化: {Colors.YELLOW}{', '.join(self.shard.members())}{Colors.ENDC}")
+            if changed or self.pending_users:
+                # 用户的交接在调度线程中进行，不会与正在进行的检查同时修改状态
+                self.scheduler.schedule_in(0, 'shard', self._shard_job)
+
+    def _user_sections(self, username: str) -> Dict:
+        """单个用户除仓库外需要保存的状态（last_check / inaccessible_repos / schedule）"""
+        sections = {}
+        for section in STATE_SECTIONS:
+            values = getattr(self, section)
+            if username in values:
+                sections[section] = values[username]
+        return sections
+
+    def save_state(self, username: str = None) -> bool:
+        """保存当前的监控状态；指定 username 时只写入该用户发生变化的部分，返回是否保存成功"""
         try:
-            state = {
-                'repos': self.known_repos,
-                'last_check': self.last_check,
-                'inaccessible_repos': self.inaccessible_repos,  # 保存无法访问的仓库记录
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
+            if username is not None:
+                snapshot = self.known_repos.get(username)
+                self.state_store.save_user(username, snapshot.to_state() if snapshot is not None else {},
+                                           self._user_sections(username))
+                return True
+            # 快速启动时没有读取过的用户状态不会变化，保留存储中原有的内容
+            lazy = isinstance(self.known_repos, LazySnapshots)
+            snapshots = self.known_repos.loaded() if lazy else self.known_repos
+            state = {'repos': {username: snapshot.to_state() for username, snapshot in snapshots.items()}}
+            for section in STATE_SECTIONS:
+                state[section] = dict(getattr(self, section))
+            self.state_store.save_all(state, partial_repos=lazy)
             print(f"{Colors.BLUE}已保存当前监控状态{Colors.ENDC}")
+            return True
         except Exception as e:
             print(f"{Colors.RED}保存状态文件失败: {str(e)}{Colors.ENDC}")
+            return False
 
-    def load_update_history(self):
-        """加载历史更新记录"""
-        try:
-            if os.path.exists(self.update_file):
-                with open(self.update_file, 'r', encoding='utf-8') as f:
-                    self.update_history = json.load(f)
-            else:
-                self.update_history = []
-        except Exception as e:
-            print(f"{Colors.RED}加载更新历史记录失败: {str(e)}{Colors.ENDC}")
-            self.update_history = []
+    def query_updates(self, username: str = None, since=None, until=None) -> Iterator[Dict]:
+        """流式读取历史更新记录，可按用户和时间范围过滤"""
+        return self.update_log.iter_records(username=username, since=since, until=until)
 
     def save_update(self, update_info):
-        """保存更新信息到JSON文件"""
+        """追加更新信息到 JSON Lines 日志"""
         try:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             update_record = {
                 'timestamp': current_time,
+                'username': update_info.get('username'),
                 'subject': update_info['subject'],
                 'content': update_info['content']
             }
+            self.update_log.append(update_record)
             
-            # 添加新的更新记录
-            self.update_history.append(update_record)
-            
-            # 保存到文件
-            with open(self.update_file, 'w', encoding='utf-8') as f:
-                json.dump(self.update_history, f, ensure_ascii=False, indent=2)
-            
-            print(f"{Colors.BLUE}更新信息已保存到 {Colors.YELLOW}{self.update_file}{Colors.ENDC}")
+            print(f"{Colors.BLUE}更新信息已保存到 {Colors.YELLOW}{self.update_log.log_file}{Colors.ENDC}")
         except Exception as e:
             print(f"{Colors.RED}保存更新信息失败: {str(e)}{Colors.ENDC}")
 
+    @staticmethod
+    def is_retryable(status_code: int, headers, text: str = '') -> bool:
+        """5xx、429 和二级限流（带 Retry-After 的 403）可以重试；普通配额耗尽交给限速器等待重置"""
+        if status_code >= 500 or status_code == 429:
+            return True
+        if status_code == 403:
+            return 'Retry-After' in headers or 'secondary rate limit' in text.lower()
+        return False
+
+    @staticmethod
+    def retry_delay(headers, attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+        """优先使用 Retry-After，否则指数退避，并加入随机抖动"""
+        retry_after = headers.get('Retry-After') if headers else None
+        if retry_after and retry_after.isdigit():
+            return int(retry_after) + random.uniform(0, base)
+        return min(cap, base * 2 ** attempt) + random.uniform(0, base)
+
+    def _breaker_check(self):
+        username = current_user.get()
+        if username and not self.circuit_breaker.allow(username):
+            raise CircuitOpenError(f"用户 {username} 的请求已熔断")
+        return username
+
+    def _breaker_record(self, username: str, failed: bool):
+        if not username:
+            return
+        if not failed:
+            self.circuit_breaker.record_success(username)
+        elif self.circuit_breaker.record_failure(username):
+            until = datetime.fromtimestamp(self.circuit_breaker.open_until(username)).strftime('%H:%M:%S')
+            print(f"{Colors.RED}用户 {username} 连续请求失败，暂停检查至 {until}{Colors.ENDC}")
+
+    def request(self, method: str, url: str, params: Dict = None, headers: Dict = None, json_body=None,
+                max_retries: int = None, retry_base: float = 1.0, client=None):
+        """所有 GitHub API 调用的统一入口
+
+        设置连接/读取超时，对 5xx 和二级限流按 Retry-After 加随机抖动重试，
+        同时更新限速器，并按当前检查的用户记录熔断状态。
+        请求交给剩余配额最多的 token；指定 client 时固定使用该 token。
+        """
+        username = self._breaker_check()
+        max_retries = self.max_retries if max_retries is None else max_retries
+        pinned = client
+        for attempt in range(max_retries + 1):
+            client, delay = self.token_pool.reserve(pinned)
+            if delay > 0:
+                self._wait_or_cancel(delay)
+            started = time.monotonic()
+            try:
+                response = client.session.request(method, url, params=params, headers=headers, json=json_body,
+                                                  timeout=self.request_timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_request(method, url, 'error', time.monotonic() - started)
+                if attempt >= max_retries:
+                    self._breaker_record(username, True)
+                    raise
+                self._wait_or_cancel(self.retry_delay(None, attempt, retry_base))
+                continue
+
+            self._record_request(method, url, response.status_code, time.monotonic() - started)
+            self.metrics.inc('github_token_requests_total', token=client.label)
+            text = response.text if response.status_code == 403 else ''
+            if self._report_token(client, response.status_code, response.headers, text):
+                if pinned is None and attempt < max_retries and self.token_pool.has_available():
+                    continue  # 换一个 token 立即重试
+            if self.is_retryable(response.status_code, response.headers, text):
+                if attempt < max_retries:
+                    self._wait_or_cancel(self.retry_delay(response.headers, attempt, retry_base))
+                    continue
+                self._breaker_record(username, True)
+                return response
+
+            self._breaker_record(username, False)
+            return response
+
+    def _wait_or_cancel(self, delay: float):
+        """等待限流或重试间隔，期间收到停止请求（Ctrl+C、run_once 时限）时放弃本次请求"""
+        if self.stop_event.wait(delay):
+            raise RequestCancelled('监控正在停止，放弃等待中的请求')
+
+    def _report_token(self, client, status_code: int, headers, text: str = '') -> bool:
+        """记录 token 的响应，token 被移出轮换时输出提示并返回 True"""
+        if self.unverified_tokens:
+            self._verify_token_response(client, status_code)
+        if not self.token_pool.report(client, status_code, headers, text):
+            return False
+        until = datetime.fromtimestamp(client.disabled_until).strftime('%H:%M:%S')
+        print(f"{Colors.YELLOW}Token {client.label} {client.disabled_reason}，暂停使用至 {until}{Colors.ENDC}")
+        return True
+
+    def cached_get(self, url: str, params: Dict = None, trim=None):
+        """带 ETag / If-Modified-Since 的条件 GET 请求，304 时返回缓存内容
+
+        返回 (response, data)，状态码为 200 或 304 时 data 为解析后的内容；
+        trim 可在写入缓存前对内容做精简
+        """
+        key = HTTPCache.make_key(url, params, trim)
+        headers = self.http_cache.conditional_headers(key)
+        response = self.request('GET', url, params=params, headers=headers)
+
+        if response.status_code == 304:
+            entry = self.http_cache.get(key)
+            if entry is not None:
+                self.metrics.inc('github_cache_hits_total')
+                if entry.get('link') and 'Link' not in response.headers:
+                    response.headers['Link'] = entry['link']
+                return response, entry['data']
+            # 缓存条目丢失时退回无条件请求
+            response = self.request('GET', url, params=params)
+
+        if response.status_code != 200:
+            return response, None
+
+        data = response.json()
+        if trim:
+            data = trim(data)
+        self.http_cache.store(key, response, data)
+        return response, data
+
+    def iter_paginated(self, url: str, params: Dict = None, trim=None) -> Iterator[Dict]:
+        """按 Link: rel=next 逐页遍历列表接口，逐条产出结果
+
+        每页请求 per_page=100，只在内存中保留当前页；trim 用于在缓存前精简每页内容。
+        任意一页失败都会抛出异常，避免调用方把不完整的列表当作完整结果。
+        """
+        params = dict(params or {})
+        params.setdefault('per_page', 100)
+        while url:
+            response, data = self.cached_get(url, params=params, trim=trim)
+            if data is None:
+                raise requests.HTTPError(
+                    f"请求 {url} 失败 (状态码: {response.status_code}): {response.text}", response=response)
+            yield from data
+            # next 链接中已包含分页参数
+            url = response.links.get('next', {}).get('url')
+            params = None
+
+    def iter_user_repos(self, username: str, compact: bool = True) -> Iterator[Dict]:
+        """流式遍历用户的所有仓库，compact 时只保留监控需要的字段"""
+        url = f'{self.api_base}/users/{username}/repos'
+        trim = self._compact_repos if compact else None
+        return self.iter_paginated(url, trim=trim)
+
+    @staticmethod
+    def _compact_repos(repos: List[Dict]) -> List[Dict]:
+        """只保留监控用到的仓库字段，减少缓存和内存占用"""
+        return [{field: repo.get(field) for field in REPO_FIELDS} for repo in repos]
+
     def get_user_repos(self, username: str) -> List[Dict]:
         """获取用户的所有仓库"""
-        url = f'https://api.github.com/users/{username}/repos'
         try:
-            response = self.session.get(url)
-            
+            return list(self.iter_user_repos(username, compact=False))
+        except requests.HTTPError as e:
             # 添加详细的错误信息输出
-            if response.status_code != 200:
-                print(f"{Colors.RED}获取用户 {username} 仓库失败:")
-                print(f"状态码: {response.status_code}")
-                print(f"响应内容: {response.text}{Colors.ENDC}")
-                return []
-            
-            return response.json()
+            print(f"{Colors.RED}获取用户 {username} 仓库失败:")
+            print(f"{str(e)}{Colors.ENDC}")
+            return []
         except Exception as e:
             print(f"{Colors.RED}获取用户 {username} 仓库时出错: {str(e)}{Colors.ENDC}")
             return []
 
     def get_repo_commits(self, username: str, repo: str, since: str = None, limit: int = None) -> List[Dict]:
         """获取仓库的提交记录"""
-        url = f'https://api.github.com/repos/{username}/{repo}/commits'
+        url = f'{self.api_base}/repos/{username}/{repo}/commits'
         params = {}
         if since:
             params['since'] = since
@@ -136,175 +543,670 @@ class GitHubMonitor:
             params['per_page'] = limit
         
         try:
-            response = self.session.get(url, params=params)
+            response, data = self.cached_get(url, params=params)
+            self._record_repo_access(username, repo, response.status_code)
             
             # 只在出错时显示详细信息
-            if response.status_code != 200:
+            if data is None:
                 print(f"{Colors.RED}获取仓库 {repo} 提交记录失败 (状态码: {response.status_code}){Colors.ENDC}")
                 return []
             
-            return response.json()
+            return data
+        except (CircuitOpenError, RequestCancelled):
+            raise
         except Exception as e:
             print(f"{Colors.RED}获取仓库 {repo} 提交记录时出错{Colors.ENDC}")
             return []
 
-    def send_email(self, subject: str, content: str):
-        """发送邮件通知"""
+    @staticmethod
+    def _compact_commits(commits: List[Dict]) -> List[Dict]:
+        """只保留提交摘要需要的字段（SHA、作者、时间和提交说明的第一行）"""
+        compact = []
+        for item in commits:
+            commit = item.get('commit') or {}
+            author = commit.get('author') or {}
+            compact.append({
+                'sha': item.get('sha'),
+                'commit': {
+                    'author': {'name': author.get('name'), 'date': author.get('date')},
+                    'message': (commit.get('message') or '').split('\n', 1)[0],
+                },
+            })
+        return compact
+
+    def _commit_cursor(self, username: str, old_state: RepoRecord = None) -> Dict:
+        """增量获取提交的查询参数：有游标时只取游标之后的提交，新仓库只取最新一个提交"""
+        if old_state is None:
+            return {'per_page': 1}
+        since = old_state.latest_commit
+        if since is None:
+            # 之前没有获取到提交（如空仓库），从上次检查时间开始
+            since = parse_time(self.last_check.get(username))
+        if since is None:
+            return {'per_page': 1}
+        return {'since': format_time(since), 'per_page': 100}
+
+    def _take_new_commits(self, page: List[Dict], old_state: RepoRecord, collected: List[Dict]) -> bool:
+        """把一页提交中游标之后的部分加入 collected，遇到游标或达到上限时返回 True"""
+        cursor = old_state.sha if old_state is not None else None
+        for commit in page:
+            if cursor and commit.get('sha') == cursor:
+                return True
+            collected.append(commit)
+            if len(collected) >= self.max_new_commits:
+                return True
+        return False
+
+    def _first_commit_keys(self, url: str) -> List[str]:
+        """只取最新一个提交的缓存键：首次检查（精简）和 since 查询为空时的退回请求（未精简）"""
+        return [HTTPCache.make_key(url, {'per_page': 1}, self._compact_commits), HTTPCache.make_key(url, {'per_page': 1})]
+
+    def _finish_commit_fetch(self, url: str, params: Dict, page_keys: List[str], head: Dict,
+                             new_commits: List[Dict]):
+        """整理增量获取结果，返回 (最新提交列表, 游标之后的新提交)"""
+        if 'since' not in params:
+            return ([head] if head else []), []
+        # 有了游标之后只取最新提交的请求不会再用到
+        for key in self._first_commit_keys(url):
+            self.http_cache.discard(key)
+        if new_commits:
+            # 游标前进后旧的 since 查询（包括翻过的每一页）不会再用到
+            for key in page_keys:
+                self.http_cache.discard(key)
+        return [head], new_commits
+
+    def get_new_commits(self, username: str, repo: str, old_state: RepoRecord = None):
+        """按游标增量获取提交，返回 (最新提交列表, 游标之后的新提交)
+
+        只请求游标时间之后的提交，推送较多时按 Link 翻页直到遇到游标（最多 max_new_commits 个）；
+        仓库没有变化时条件请求返回 304，不消耗配额。
+        """
+        url = f'{self.api_base}/repos/{username}/{repo}/commits'
+        params = self._commit_cursor(username, old_state)
+        head, new_commits, page_keys = None, [], []
+        page_url, page_params = url, params
+        try:
+            while page_url:
+                page_keys.append(HTTPCache.make_key(page_url, page_params, self._compact_commits))
+                response, data = self.cached_get(page_url, params=page_params, trim=self._compact_commits)
+                self._record_repo_access(username, repo, response.status_code)
+                if data is None:
+                    print(f"{Colors.RED}获取仓库 {repo} 提交记录失败 (状态码: {response.status_code}){Colors.ENDC}")
+                    return [], []
+                head = head or (data[0] if data else None)
+                if 'since' not in params or self._take_new_commits(data, old_state, new_commits):
+                    break
+                page_url = response.links.get('next', {}).get('url')
+                page_params = None
+        except (CircuitOpenError, RequestCancelled):
+            raise
+        except Exception:
+            print(f"{Colors.RED}获取仓库 {repo} 提交记录时出错{Colors.ENDC}")
+            return [], []
+        if head is None and 'since' in params:
+            # 游标之后没有任何提交（如强制推送到更早的提交），退回只取最新提交
+            self.http_cache.discard(self._first_commit_keys(url)[0])
+            return self.get_repo_commits(username, repo, limit=1), []
+        return self._finish_commit_fetch(url, params, page_keys, head, new_commits)
+
+    def _record_repo_access(self, username: str, repo: str, status_code: int):
+        """根据提交接口的状态码维护 inaccessible_repos"""
+        if status_code in INACCESSIBLE_STATUSES:
+            repos = self.inaccessible_repos.setdefault(username, {})
+            record = repos.setdefault(repo, {'since': datetime.now(timezone.utc).isoformat(), 'failures': 0})
+            record['status'] = status_code
+            record['failures'] += 1
+        elif status_code in (200, 304):
+            repos = self.inaccessible_repos.get(username)
+            if repos and repos.pop(repo, None) is not None and not repos:
+                del self.inaccessible_repos[username]
+
+    def _is_known_inaccessible(self, username: str, repo: Dict) -> bool:
+        """仓库已记为无法访问且之后没有新的推送时，跳过提交请求"""
+        record = self.inaccessible_repos.get(username, {}).get(repo['name'])
+        return bool(record) and record.get('pushed_at') == repo.get('pushed_at')
+
+    def _mark_inaccessible_pushed_at(self, username: str, repo: Dict):
+        """记录仓库被标记为无法访问时的 pushed_at，推送变化后会重新尝试"""
+        record = self.inaccessible_repos.get(username, {}).get(repo['name'])
+        if record is not None:
+            record['pushed_at'] = repo.get('pushed_at')
+
+    def send_email(self, subject: str, content: str, receiver: str = None) -> bool:
+        """发送邮件通知，复用已建立的 SMTP 连接"""
+        from email.header import Header  # 邮件相关模块在第一次发送时才导入，加快启动
+        from email.mime.text import MIMEText
+
         msg = MIMEText(content, 'plain', 'utf-8')
         msg['Subject'] = Header(subject, 'utf-8')
         msg['From'] = self.email_config['sender']
-        msg['To'] = self.email_config['receiver']
+        msg['To'] = receiver or self.email_config['receiver']
 
+        started = time.monotonic()
         try:
-            if self.email_config['smtp_port'] == 587:
-                # 使用 STARTTLS
-                server = smtplib.SMTP(self.email_config['smtp_server'], 587)
-                server.starttls()  # 升级到 TLS 连接
-            else:
-                # 使用 SSL
-                server = smtplib.SMTP_SSL(self.email_config['smtp_server'], 465)
-            
-            # 登录并发送
-            server.login(self.email_config['sender'], self.email_config['password'])
-            server.send_message(msg)
-            server.quit()
+            self.smtp.send(msg)
+            self.metrics.observe('email_send_seconds', time.monotonic() - started)
+            self.metrics.inc('emails_sent_total', result='success')
             
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{current_time}] 邮件发送成功: {subject}")
+            return True
             
         except Exception as e:
+            self.metrics.inc('emails_sent_total', result='failure')
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{current_time}] 邮件发送失败: {str(e)}")
+            return False
+
+    def _receivers(self) -> List[str]:
+        """收件人列表，receiver 可以是逗号分隔的字符串或列表"""
+        receiver = self.email_config['receiver']
+        if isinstance(receiver, str):
+            receiver = receiver.split(',')
+        return [r.strip() for r in receiver if r.strip()]
+
+    def send_digest(self, notifications: List[Dict], receiver: str) -> bool:
+        """把多条通知合并为一封汇总邮件发给一个收件人"""
+        subject = f"GitHub监控汇总: {len(notifications)} 条更新"
+        sections = [f"[{i}] {n['subject']}\n{n['content']}" for i, n in enumerate(notifications, 1)]
+        content = '\n\n'.join(sections)
+        return self.send_email(subject, content, receiver=receiver)
+
+    def _count(self, key: str, amount: int = 1):
+        """累加本轮检查的统计计数"""
+        with self.stats_lock:
+            self.cycle_stats[key] = self.cycle_stats.get(key, 0) + amount
+
+    def has_new_events(self, username: str) -> bool:
+        """通过用户事件流判断自上次检查以来是否有新活动
+
+        事件流未变化时返回 304，不消耗配额；请求失败时返回 True 以回退到完整检查
+        """
+        if time.time() < self.events_poll_after.get(username, 0):
+            return False
 
-    def check_user_activity(self, username):
-        """检查用户活动，包括新建仓库和更新"""
         try:
-            response = self.session.get(f"https://api.github.com/users/{username}/repos")
-            if response.status_code != 200:
-                return []
-                
-            current_repos = response.json()
-            notifications = []
-            
-            # 获取当前所有仓库的最新状态
-            current_state = {}
-            for repo in current_repos:
-                repo_name = repo['name']
-                
-                # 获取仓库的最后更新时间
-                last_updated = repo['updated_at']
-                
-                # 获取提交记录
-                commits = self.get_repo_commits(username, repo_name, limit=5)
-                if not commits:  # 如果获取失败，使用仓库的更新时间
-                    current_state[repo_name] = {
-                        'created_at': repo['created_at'],
-                        'updated_at': last_updated,
-                        'html_url': repo['html_url'],
-                        'has_commits': False
-                    }
-                    continue
-                
-                # 记录仓库状态
-                current_state[repo_name] = {
-                    'created_at': repo['created_at'],
-                    'updated_at': last_updated,
-                    'html_url': repo['html_url'],
-                    'has_commits': True,
-                    'latest_commit': commits[0]['commit']['author']['date'] if commits else None
-                }
-            
-            # 首次运行时，只记录状态不发送通知
-            if username not in self.known_repos:
-                print(f"{Colors.BLUE}首次运行，记录用户 {username} 的初始状态{Colors.ENDC}")
-                self.known_repos[username] = current_state
-                self.save_state()
-                return []
-            
-            # 对比状态并生成通知
-            for repo_name, repo_state in current_state.items():
-                # 检查新仓库
-                if repo_name not in self.known_repos[username]:
-                    notifications.append((
-                        f"GitHub通知: {username} 创建了新仓库 {repo_name}",
-                        f"新仓库信息:\n仓库名称: {repo_name}\n创建时间: {repo_state['created_at']}\n仓库地址: {repo_state['html_url']}"
-                    ))
-                    continue
-                
-                # 检查更新
-                old_state = self.known_repos[username][repo_name]
-                
-                # 比较更新时间
-                if repo_state['updated_at'] > old_state['updated_at']:
-                    # 确认是真实更新
-                    if (repo_state['has_commits'] and 
-                        (not old_state.get('latest_commit') or 
-                         repo_state['latest_commit'] > old_state.get('latest_commit', ''))):
-                        notifications.append((
-                            f"GitHub更新通知: {username}/{repo_name}",
-                            f"仓库有新的更新\n仓库地址: {repo_state['html_url']}\n"
-                            f"更新时间: {repo_state['updated_at']}"
-                        ))
-            
-            # 更新状态
-            self.known_repos[username] = current_state
-            self.save_state()
-            
-            return notifications
-            
+            response, _ = self.cached_get(self._events_url(username), trim=self._drop_events)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            print(f"{Colors.RED}获取用户 {username} 事件流时出错: {str(e)}{Colors.ENDC}")
+            return True
+
+        return self._events_changed(username, response.status_code, response.headers)
+
+    def _events_url(self, username: str) -> str:
+        return f"{self.api_base}/users/{username}/events"
+
+    @staticmethod
+    def _drop_events(events: List[Dict]) -> List[Dict]:
+        """事件流只用来判断有没有变化，缓存中只保留 ETag，不保存事件内容"""
+        return []
+
+    def _discard_events_etag(self, username: str):
+        """检查失败时丢弃事件流缓存：新的 ETag 已在检查开始时写入，
+        保留它会让下次轮询得到 304 而跳过这次没有处理完的变化"""
+        self.http_cache.discard(HTTPCache.make_key(self._events_url(username), trim=self._drop_events))
+
+    def _events_changed(self, username: str, status_code: int, headers) -> bool:
+        """记录 X-Poll-Interval，并根据事件流响应判断是否有新活动"""
+        poll_interval = headers.get('X-Poll-Interval')
+        if poll_interval and poll_interval.isdigit():
+            self.events_poll_after[username] = time.time() + int(poll_interval)
+
+        return status_code != 304
+
+    def _build_repo_state(self, username: str, repo: Dict, old_state: RepoRecord = None,
+                          reuse: bool = False) -> RepoRecord:
+        """根据仓库信息生成用于对比的状态，必要时从游标开始增量拉取提交"""
+        # 事件模式下，pushed_at / updated_at 未变化的仓库直接沿用已知状态
+        if reuse and self._can_reuse_state(repo, old_state):
+            self._count('api_calls_saved')
+            return old_state
+
+        # 无法访问且没有新推送的仓库不再请求提交
+        if self._is_known_inaccessible(username, repo):
+            self._count('inaccessible_skipped')
+            return self._repo_state(username, repo, [])
+        
+        # 获取游标之后的提交记录
+        commits, new_commits = self.get_new_commits(username, repo['name'], old_state)
+        self._mark_inaccessible_pushed_at(username, repo)
+        self._stash_new_commits(username, repo['name'], new_commits)
+        return self._repo_state(username, repo, commits)
+
+    def _stash_new_commits(self, username: str, repo_name: str, new_commits: List[Dict]):
+        """暂存本次检查发现的新提交，生成通知时附上摘要"""
+        if new_commits:
+            self.new_commits.setdefault(username, {})[repo_name] = new_commits
+
+    @staticmethod
+    def _can_reuse_state(repo: Dict, reusable_state: RepoRecord = None) -> bool:
+        """仓库的 pushed_at / updated_at 与已知状态一致时无需重新拉取提交"""
+        return reusable_state is not None and reusable_state.matches(repo)
+
+    @staticmethod
+    def _repo_state(username: str, repo: Dict, commits: List[Dict]) -> RepoRecord:
+        """由仓库信息和最新提交生成仓库状态，没有提交时以仓库的更新时间为准"""
+        return RepoRecord.from_api(username, repo, commits)
+
+    @staticmethod
+    def _created_notification(username: str, record: RepoRecord):
+        return (
+            f"GitHub通知: {username} 创建了新仓库 {record.name}",
+            f"新仓库信息:\n仓库名称: {record.name}\n创建时间: {format_time(record.created_at)}\n"
+            f"仓库地址: {record.url(username)}"
+        )
+
+    def _commit_summary(self, commits: List[Dict]) -> str:
+        """新提交的摘要：每个提交一行，最多 commit_summary_limit 行"""
+        lines = []
+        for item in commits[:self.commit_summary_limit]:
+            commit = item.get('commit') or {}
+            author = commit.get('author') or {}
+            message = (commit.get('message') or '').split('\n', 1)[0]
+            sha = (item.get('sha') or '')[:7]
+            lines.append(f"- {sha} {message} ({author.get('name') or '未知作者'}, {author.get('date')})")
+        more = len(commits) - self.commit_summary_limit
+        if more > 0:
+            lines.append(f"- ... 还有 {more} 个提交")
+        total = f"{len(commits)}+" if len(commits) >= self.max_new_commits else len(commits)
+        return f"新提交 ({total}):\n" + '\n'.join(lines)
+
+    def _updated_notification(self, username: str, record: RepoRecord, commits: List[Dict] = None):
+        content = (f"仓库有新的更新\n仓库地址: {record.url(username)}\n"
+                   f"更新时间: {format_time(record.updated_at)}")
+        if commits:
+            content += '\n\n' + self._commit_summary(commits)
+        return f"GitHub更新通知: {username}/{record.name}", content
+
+    def _diff_repo(self, username: str, repo_state: RepoRecord, old_state: RepoRecord = None,
+                   commits: List[Dict] = None):
+        """对比单个仓库的新旧状态，需要通知时返回 (subject, content)"""
+        if old_state is not None and not is_updated(old_state, repo_state):
+            return None
+        if not self._not_yet_notified(username, [repo_state]):
+            return None
+        if old_state is None:
+            return self._created_notification(username, repo_state)
+        return self._updated_notification(username, repo_state, commits)
+
+    def _not_yet_notified(self, username: str, records: List[RepoRecord]) -> List[RepoRecord]:
+        """去掉去重索引中已经通知过同一提交的仓库（没有提交 SHA 的仓库无法判断，总是保留）"""
+        if self.dedup is None or not records:
+            return records
+        keys = [(record.name, record.sha) for record in records if record.sha]
+        claimed = self.dedup.claim(username, keys)
+        self.pending_claims.setdefault(username, set()).update(claimed)
+        kept = [record for record in records if not record.sha or (record.name, record.sha) in claimed]
+        if len(kept) < len(records):
+            self._count('duplicates_suppressed', len(records) - len(kept))
+            self.metrics.inc('notifications_suppressed_total', len(records) - len(kept))
+        return kept
+
+    def _release_claims(self, username: str):
+        """检查没有完成时撤销本次在去重索引中的登记，否则重新检测到的变化会被当作已通知而丢弃"""
+        claimed = self.pending_claims.pop(username, None)
+        if claimed and self.dedup is not None:
+            self.dedup.release(username, claimed)
+
+    def _diff_notifications(self, username: str, diff: SnapshotDiff, commits: Dict = None) -> List:
+        """把快照差异转换为通知；改名和删除只记录日志"""
+        for old, new in diff.renamed:
+            print(f"{Colors.BLUE}{username} 的仓库 {old.name} 已改名为 {new.name}{Colors.ENDC}")
+        for record in diff.deleted:
+            print(f"{Colors.YELLOW}{username} 的仓库 {record.name} 已删除或不再公开{Colors.ENDC}")
+        if diff.renamed:
+            self._count('repos_renamed', len(diff.renamed))
+        if diff.deleted:
+            self._count('repos_deleted', len(diff.deleted))
+        created = self._not_yet_notified(username, diff.created)
+        updated = self._not_yet_notified(username, diff.updated)
+        notifications = [self._created_notification(username, record) for record in created]
+        commits = commits or {}
+        notifications += [self._updated_notification(username, record, commits.get(record.name))
+                          for record in updated]
+        return notifications
+
+    def user_lock(self, username: str) -> threading.Lock:
+        """返回该用户的锁，替换 known_repos 中的快照前必须持有"""
+        with self.user_locks_guard:
+            return self.user_locks.setdefault(username, threading.Lock())
+
+    def _store_snapshot(self, username: str, snapshot: UserSnapshot, previous: UserSnapshot = None):
+        """替换并保存用户的快照，保存失败时恢复原来的快照并抛出异常（调用方持有该用户的锁）"""
+        self.known_repos[username] = snapshot
+        if not self.save_state(username):
+            if previous is None:
+                self.known_repos.pop(username, None)
+            else:
+                self.known_repos[username] = previous
+            raise RuntimeError(f"保存用户 {username} 的状态失败")
+
+    @staticmethod
+    def _merge_webhook_changes(base: UserSnapshot, known: UserSnapshot, current_state: UserSnapshot):
+        """检查期间 webhook 已经替换了该用户的快照（base 为检查开始时的快照，known 为现在的）：
+        把 webhook 带来的较新状态合并进本轮结果，避免覆盖它，也避免同一变化再通知一次"""
+        for name, record in known.repos.items():
+            polled = current_state.get(name)
+            if polled is None:
+                if name not in base:
+                    current_state.add(record)  # webhook 新建或改名得到的仓库，本轮列表中还没有
+            elif base.get(name) is not record and (record.pushed_at or 0) > (polled.pushed_at or 0):
+                current_state.add(record)
+        for name in base:
+            if name not in known and name in current_state:
+                current_state.pop(name)  # webhook 删除或改名前的仓库
+
+    def _commit_user_state(self, username: str, current_state: UserSnapshot, differ: SnapshotDiffer = None) -> List:
+        """对比并保存用户本轮的仓库快照，首次运行时不返回通知
+
+        differ 为获取仓库列表时逐页对比的结果，没有时整体对比两个快照；检查期间 webhook
+        更新过该用户时先合并 webhook 的结果，再与最新的快照整体对比。
+        保存失败时恢复原来的快照并抛出异常，下次检查重新对比，变化不会丢失。
+        """
+        with self.user_lock(username):
+            known = self.known_repos.get(username)
+            new_commits = self.new_commits.pop(username, None)
+            if differ is not None and differ.old is not known:
+                if known is not None:
+                    self._merge_webhook_changes(differ.old, known, current_state)
+                differ = None
+            try:
+                if known is None:
+                    print(f"{Colors.BLUE}首次运行，记录用户 {username} 的初始状态{Colors.ENDC}")
+                    notifications = []
+                else:
+                    diff = differ.finish() if differ is not None else diff_snapshots(known, current_state)
+                    notifications = self._diff_notifications(username, diff, new_commits)
+                # 更新状态
+                self._store_snapshot(username, current_state, known)
+            except BaseException:
+                self._release_claims(username)
+                raise
+        
+        return notifications
+
+    def prefetch_states(self, usernames: List[str]):
+        """GraphQL 模式下在一轮检查开始时批量获取所有用户的仓库状态"""
+        self.prefetched_states = {}
+        if self.fetch_mode != 'graphql' or not usernames:
+            return
+        try:
+            self.prefetched_states = self.graphql.fetch_states(usernames)
         except Exception as e:
-            print(f"{Colors.RED}检查用户 {username} 时出错: {str(e)}{Colors.ENDC}")
+            print(f"{Colors.RED}GraphQL 批量查询失败，回退到 REST: {str(e)}{Colors.ENDC}")
+        fallback = len(usernames) - len(self.prefetched_states)
+        if fallback:
+            self._count('graphql_fallback_users', fallback)
+
+    def check_user_activity(self, username):
+        """检查用户活动，包括新建仓库和更新
+
+        检查失败时抛出异常（由调用方计入失败用户），不会当作“没有更新”处理。
+        """
+        prefetched = self.prefetched_states.pop(username, None)
+        if prefetched is not None:
+            return self._commit_user_state(username, prefetched)
+
+        known = self.known_repos.get(username)
+        use_events = self.detection_mode == 'events' and known is not None
+
+        # 事件流无变化时跳过仓库列表和所有提交请求
+        if use_events and not self.has_new_events(username):
+            self._count('api_calls_saved', 1 + len(known))
             return []
 
+        # 逐页获取仓库并当场与已知快照对比，最后一页到达后再识别改名和删除
+        current_state = UserSnapshot(username)
+        differ = SnapshotDiffer(known) if known is not None else None
+        try:
+            for repo in self.iter_user_repos(username):
+                old_state = known.get(repo['name']) if known is not None else None
+                record = self._build_repo_state(username, repo, old_state, reuse=use_events)
+                current_state.add(record)
+                if differ is not None:
+                    differ.add(record)
+
+            return self._commit_user_state(username, current_state, differ)
+        except BaseException:
+            if use_events:
+                self._discard_events_etag(username)
+            raise
+
+    def _has_recent_push(self, username: str) -> bool:
+        """用户是否有仓库在 recent_push_window 内推送过"""
+        snapshot = self.known_repos.get(username)
+        latest = snapshot.latest_push() if snapshot is not None else None
+        return latest is not None and latest >= time.time() - self.recent_push_window
+
+    def _reschedule(self, username: str, had_updates: bool):
+        """根据本次检查结果调整该用户的检查间隔
+
+        有更新或最近有推送时间隔减半，没有变化时指数退避，始终限制在最短和最长间隔之间
+        """
+        interval = self.schedule.get(username, {}).get('interval', self.check_interval)
+        if had_updates or self._has_recent_push(username):
+            interval = interval / 2
+        else:
+            interval = interval * 2
+        interval = int(min(self.max_interval, max(self.min_interval, interval)))
+        if username in self.webhook_users:
+            # 变化由 webhook 实时送达，轮询只用于补漏
+            interval = max(interval, self.reconcile_interval)
+        next_check = datetime.now(timezone.utc).timestamp() + interval
+        self.schedule[username] = {
+            'interval': interval,
+            'next_check': datetime.fromtimestamp(next_check, timezone.utc).isoformat()
+        }
+
+    def next_check_time(self, username: str) -> float:
+        """返回用户下次检查的时间戳，没有记录的用户立即检查"""
+        entry = self.schedule.get(username)
+        if not entry:
+            return 0
+        return datetime.fromisoformat(entry['next_check']).timestamp()
+
+    def due_users(self, usernames: List[str]) -> List[str]:
+        """返回已经到达下次检查时间的用户"""
+        now = time.time()
+        return [u for u in usernames if self.next_check_time(u) <= now]
+
     def check_user_updates(self, username: str):
         """检查单个用户的更新，包括新仓库和现有仓库的更新"""
+        if self.stop_event.is_set():
+            return  # 正在退出，排队中的用户留到下次启动再检查
+        started = time.monotonic()
+        notifications = []
+        token = current_user.set(username)
         try:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}正在检查用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.BLUE}的活动...{Colors.ENDC}")
+            if self._skip_open_circuit(username):
+                return
+            self._announce_check(username)
             
             # 检查新建仓库和更新
             notifications = self.check_user_activity(username)
+            self._dispatch_notifications(username, notifications)
             
-            # 处理所有通知
+        except RequestCancelled:
+            # 不计入失败：用户没有记录进度，run_once 按未检查处理
+            print(f"{Colors.YELLOW}监控正在停止，放弃检查用户 {username}{Colors.ENDC}")
+        except Exception as e:
+            self._count('failed_users')
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.RED}检查用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.RED}时出错: {str(e)}{Colors.ENDC}")
+        finally:
+            current_user.reset(token)
+            self._record_check_latency(username, started)
+            self._reschedule(username, bool(notifications))
+
+    def _skip_open_circuit(self, username: str) -> bool:
+        """用户熔断期间跳过本次检查"""
+        if not self.circuit_breaker.is_open(username):
+            return False
+        until = datetime.fromtimestamp(self.circuit_breaker.open_until(username)).strftime('%H:%M:%S')
+        print(f"{Colors.YELLOW}用户 {username} 处于熔断状态，跳过检查（至 {until}）{Colors.ENDC}")
+        self._count('circuit_open_users')
+        return True
+
+    def _announce_check(self, username: str):
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}正在检查用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.BLUE}的活动...{Colors.ENDC}")
+
+    def _dispatch_notifications(self, username: str, notifications: List):
+        """保存通知、加入邮件队列并更新最后检查时间（只在用户检查成功、状态已提交后调用）"""
+        if notifications:
+            self.metrics.inc('notifications_total', len(notifications))
+        if self.coalesce and len(notifications) > 1:
+            notifications = [self._coalesce_notifications(username, notifications)]
+        # 处理所有通知
+        try:
             for subject, content in notifications:
                 update_info = {
+                    'username': username,
                     'subject': subject,
                     'content': content
                 }
-                # 保存到JSON文件
+                # 追加到更新日志
                 self.save_update(update_info)
                 # 加入邮件队列
                 self.notification_queue.put(update_info)
-            
-            # 更新最后检查时间
-            self.last_check[username] = datetime.now(timezone.utc).isoformat()
-            
-            if not notifications:
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.BLUE}没有新的更新{Colors.ENDC}")
-            
-        except Exception as e:
+        except BaseException:
+            self._release_claims(username)
+            raise
+        self.pending_claims.pop(username, None)  # 通知已经入队，去重记录生效
+        
+        # 更新最后检查时间（单次运行时同时记录进度）
+        self.last_check[username] = datetime.now(timezone.utc).isoformat()
+        if self.checkpoint is not None:
+            self.checkpoint.mark_done(username)
+        
+        if not notifications:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.RED}检查用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.RED}时出错: {str(e)}{Colors.ENDC}")
+            print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}用户 {Colors.YELLOW}{username}{Colors.ENDC} {Colors.BLUE}没有新的更新{Colors.ENDC}")
+
+    @staticmethod
+    def _coalesce_notifications(username: str, notifications: List):
+        """把同一用户本次检查的多条通知合并为一条（一封邮件、一条更新记录）"""
+        subject = f"GitHub通知: {username} 有 {len(notifications)} 条更新"
+        content = '\n\n'.join(f"[{i}] {title}\n{body}" for i, (title, body) in enumerate(notifications, 1))
+        return subject, content
 
     def notification_sender(self):
-        """处理通知队列的线程"""
+        """处理通知队列的线程：批量取出通知发送，失败的按退避重试，开启汇总模式时合并 digest_window 内的通知"""
+        pending = self.notification_queue.qsize()
+        if pending:
+            print(f"{Colors.BLUE}恢复上次未发送的通知: {Colors.YELLOW}{pending}{Colors.ENDC}")
         while True:
             try:
-                notification = self.notification_queue.get()
-                self.send_email(notification['subject'], notification['content'])
-                self.notification_queue.task_done()
+                batch = self.notification_queue.get_batch(timeout=self.smtp.idle_timeout)
+                if not batch:
+                    self.smtp.close_if_idle()
+                    continue
+
+                if self.digest_window > 0:
+                    deadline = time.monotonic() + self.digest_window
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        batch.extend(self.notification_queue.get_batch(timeout=remaining))
+                self._deliver(batch)
             except Exception as e:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 print(f"[{current_time}] 发送通知时出错: {str(e)}")
+                time.sleep(5)
+
+    def _deliver(self, batch: List):
+        """发送一批通知：汇总模式下合并为一封邮件，否则逐条发送；成功的确认，失败的按退避重试"""
+        if self.digest_window > 0:
+            self._deliver_digest(batch)
+            return
+
+        sent = []
+        for row_id, notification in batch:
+            if self.send_email(notification['subject'], notification['content']):
+                sent.append(row_id)
+            else:
+                self.notification_queue.fail([row_id], '邮件发送失败')
+        self.notification_queue.ack(sent)
+
+    def _deliver_digest(self, batch: List):
+        """逐个收件人发送汇总邮件，每条通知记录已经送达的收件人（delivered_to）
 
-    def monitor_users(self, usernames: List[str], check_interval: int = 1800):
-        """使用多线程监控多个用户的仓库更新"""
+        部分收件人发送失败时只对这些收件人重试，已经收到的收件人不会再收到重复的汇总。
+        """
+        ids = [row_id for row_id, _ in batch]
+        failed = []
+        for receiver in self._receivers():
+            pending = [item for _, item in batch if receiver not in item.get('delivered_to', ())]
+            if not pending:
+                continue
+            if self.send_digest(pending, receiver):
+                for item in pending:
+                    item.setdefault('delivered_to', []).append(receiver)
+            else:
+                failed.append(receiver)
+        if failed:
+            self.notification_queue.fail(ids, f"汇总邮件发送失败: {', '.join(failed)}",
+                                         payloads=dict(batch))
+        else:
+            self.notification_queue.ack(ids)
+
+    def flush_notifications(self, timeout: float = 60) -> int:
+        """在当前线程发送队列中所有已到发送时间的通知（汇总模式下不再等待窗口），返回仍未发送的数量
+
+        发送失败的通知按退避时间留在队列中，由下次运行继续发送。
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            batch = self.notification_queue.get_batch(timeout=0)
+            if not batch:
+                break
+            if self.digest_window > 0:
+                while True:
+                    more = self.notification_queue.get_batch(timeout=0)
+                    if not more:
+                        break
+                    batch.extend(more)
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                print(f"{Colors.RED}发送通知时出错: {str(e)}{Colors.ENDC}")
+                break
+        return self.notification_queue.qsize()
+
+    def monitor_users(self, usernames: List[str] = None, check_interval: int = 1800,
+                      watch_list: str = None, watch_interval: float = 30):
+        """使用多线程监控多个用户的仓库更新，每个用户按各自的自适应间隔检查
+
+        主循环由定时调度器驱动，只在下一个任务（用户检查、状态报告、状态保存）到期时醒来；
+        收到 SIGTERM / SIGINT 后停止调度，保存状态后退出。
+        指定 watch_list 时从该文件读取用户列表，文件变化（或收到 SIGHUP）后不重启即生效。
+        """
+        self.check_interval = check_interval
+        self.watch_interval = watch_interval
+        if watch_list:
+            self.watch_list = WatchList(watch_list)
+            loaded = self.watch_list.load()
+            usernames = loaded['users']
+            self.apply_settings(loaded['settings'])
+        self.all_usernames = list(usernames or [])
+        if self.shard is not None:
+            self.shard.heartbeat()
+            self.shard.release_except(self.shard.owned(self.all_usernames))  # 上次运行遗留的认领
+            self._sync_shard_users(self.all_usernames)
+            threading.Thread(target=self._shard_heartbeat_loop, daemon=True).start()
+        else:
+            self.usernames = list(usernames or [])
+        usernames = self.usernames
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}开始监控以下用户:{Colors.ENDC}")
+        shard_label = f" ({self.shard.worker_id}，共 {len(self.all_usernames)} 个用户)" if self.shard else ''
+        print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}开始监控以下用户{shard_label}:{Colors.ENDC}")
         for username in usernames:
             print(f"- {Colors.YELLOW}{username}{Colors.ENDC}")
-        print(f"{Colors.BLUE}检查间隔: {check_interval}秒{Colors.ENDC}")
+        print(f"{Colors.BLUE}初始检查间隔: {check_interval}秒 "
+              f"(自适应范围 {self.min_interval}-{self.max_interval}秒){Colors.ENDC}")
         print(f"{Colors.BLUE}程序已成功启动...{Colors.ENDC}\n")
         
         # 初始化所有用户的最后检查时间
@@ -312,122 +1214,469 @@ class GitHubMonitor:
             if username not in self.last_check:
                 self.last_check[username] = datetime.now(timezone.utc).isoformat()
 
-        # 启动通知发送线程
-        notification_thread = threading.Thread(target=self.notification_sender, daemon=True)
-        notification_thread.start()
+        self.start_metrics()
+        self.start_webhook()
+        self._install_signal_handlers()
 
-        status_interval = 900  # 每15分钟显示一次状态（900秒）
-        last_status_time = time.time()
-        last_check_time = time.time()
+        # 启动通知发送线程（分片模式由协调进程统一发送）
+        if self.shard is None:
+            notification_thread = threading.Thread(target=self.notification_sender, daemon=True)
+            notification_thread.start()
 
-        # 立即进行第一次检查
-        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}正在进行首次检查...{Colors.ENDC}")
-        self._perform_check(usernames)
-        last_check_time = time.time()
-        next_check_time = datetime.fromtimestamp(last_check_time + check_interval)
-        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}首次检查完成{Colors.ENDC}")
-        print(f"{Colors.BLUE}下次检查时间: {Colors.YELLOW}{next_check_time.strftime('%Y-%m-%d %H:%M:%S')}{Colors.ENDC}\n")
+        # 获取当前配额，作为限速器的初始状态
+        self.check_rate_limit()
 
-        while True:
-            try:
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                # 每15分钟显示运行状态
-                if time.time() - last_status_time >= status_interval:
-                    print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}监控程序正在运行中...{Colors.ENDC}")
-                    print(f"{Colors.BLUE}监控用户: {Colors.YELLOW}{', '.join(usernames)}{Colors.ENDC}")
-                    
-                    # 计算下次检查时间
-                    next_check_time = datetime.fromtimestamp(last_check_time + check_interval)
-                    time_until_next_check = (next_check_time - datetime.now()).total_seconds()
-                    hours = int(time_until_next_check // 3600)
-                    minutes = int((time_until_next_check % 3600) // 60)
-                    seconds = int(time_until_next_check % 60)
-                    
-                    print(f"{Colors.BLUE}下次检查时间: {Colors.YELLOW}{next_check_time.strftime('%Y-%m-%d %H:%M:%S')}{Colors.ENDC}")
-                    print(f"{Colors.BLUE}距离下次检查还有: {Colors.YELLOW}{hours:02d}:{minutes:02d}:{seconds:02d}{Colors.ENDC}")
-                    print(f"{Colors.BLUE}程序运行正常...{Colors.ENDC}\n")
-                    
-                    last_status_time = time.time()
-
-                # 检查是否到达检查间隔时间
-                if time.time() - last_check_time >= check_interval:
-                    print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}开始新一轮检查...{Colors.ENDC}")
-                    self._perform_check(usernames)
-                    last_check_time = time.time()
-                    next_check_time = datetime.fromtimestamp(last_check_time + check_interval)
-                    print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}本轮检查完成{Colors.ENDC}")
-                    print(f"{Colors.BLUE}下次检查时间: {Colors.YELLOW}{next_check_time.strftime('%Y-%m-%d %H:%M:%S')}{Colors.ENDC}")
-                    
-                    # 显示初始倒计时
-                    time_until_next_check = check_interval
-                    hours = int(time_until_next_check // 3600)
-                    minutes = int((time_until_next_check % 3600) // 60)
-                    seconds = int(time_until_next_check % 60)
-                    print(f"{Colors.BLUE}距离下次检查还有: {Colors.YELLOW}{hours:02d}:{minutes:02d}:{seconds:02d}{Colors.ENDC}\n")
-                
-                # 短暂休眠以减少CPU使用
-                time.sleep(10)
-                
-            except Exception as e:
+        # 调度器启动后立即检查没有调度记录或已到期的用户
+        self.reschedule_checks(immediate=True)
+        self.scheduler.schedule_in(self.status_interval, 'status', self._status_job, deadline=self.status_interval)
+        self.scheduler.schedule_in(self.flush_interval, 'flush', self._flush_job)
+        if self.watch_list:
+            self.scheduler.schedule_in(self.watch_interval, 'watch_list', self._watch_list_job)
+        try:
+            self.scheduler.run(on_error=self._on_job_error, on_skip=self._on_job_skipped)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_event.set()
+            self.worker_pool.wait()  # 等正在进行的检查完成，排队中的用户直接跳过
+            self.shutdown()
+
+    def run_once(self, usernames: List[str] = None, watch_list: str = None, deadline: float = None,
+                 flush_timeout: float = 60) -> int:
+        """单次运行（systemd timer / Kubernetes CronJob）：检查一遍所有用户，发送通知后返回退出码
+
+        deadline 秒后不再开始新的用户检查（正在进行的检查会完成，但不再等待限流和重试），未检查的用户记录在进度文件中，
+        下次运行时优先继续；每个用户的状态在检查完成后立即保存。
+        退出码见 EXIT_OK / EXIT_CHECK_FAILED / EXIT_DEADLINE / EXIT_UNDELIVERED。
+        """
+        if self.shard is not None:
+            raise ValueError("分片模式不支持单次运行")
+        started = time.monotonic()
+        if watch_list:
+            loaded = WatchList(watch_list).load()
+            usernames = loaded['users']
+            self.apply_settings(loaded['settings'])
+        self.all_usernames = list(usernames or [])
+        self.usernames = list(self.all_usernames)
+        self.checkpoint = RunCheckpoint()
+        pending = self.checkpoint.resume(self.usernames)
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        resumed = len(self.usernames) - len(pending)
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}单次运行: 检查 "
+              f"{Colors.YELLOW}{len(pending)}{Colors.ENDC} {Colors.BLUE}个用户"
+              f"{f'（继续上次中断的运行，跳过已完成的 {resumed} 个）' if resumed else ''}"
+              f"{f'，时限 {deadline:.0f} 秒' if deadline else ''}{Colors.ENDC}")
+
+        self._install_signal_handlers()
+        timer = None
+        if deadline:
+            timer = threading.Timer(deadline, self._deadline_reached)
+            timer.daemon = True
+            timer.start()
+        try:
+            if pending:
+                self.check_rate_limit()
+                self.round_started = time.time()
+                self._perform_check(pending)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        failed = self.cycle_stats.get('failed_users', 0)
+        unchecked = [username for username in pending if not self.checkpoint.is_done(username)]
+        if not unchecked:
+            self.checkpoint.clear()
+
+        # 在退出前把本次产生的（以及之前积压的）通知发送出去
+        undelivered = self.flush_notifications(flush_timeout)
+        self.shutdown()
+
+        # 检查失败的用户同样没有记录进度，下次运行重新检查；只有还没开始检查的用户才算超时
+        if len(unchecked) > failed:
+            code = EXIT_DEADLINE
+        elif failed:
+            code = EXIT_CHECK_FAILED
+        elif undelivered:
+            code = EXIT_UNDELIVERED
+        else:
+            code = EXIT_OK
+        elapsed = time.monotonic() - started
+        checked = len(pending) - len(unchecked)  # 不含检查失败的用户
+        print(f"{Colors.BLUE}单次运行结束: 耗时 {Colors.YELLOW}{elapsed:.1f}s{Colors.ENDC} "
+              f"{Colors.BLUE}检查完成 {Colors.YELLOW}{checked}{Colors.ENDC} "
+              f"{Colors.BLUE}({checked / elapsed if elapsed else 0:.1f} 用户/秒){Colors.ENDC} "
+              f"{Colors.BLUE}未检查 {Colors.YELLOW}{len(unchecked) - failed}{Colors.ENDC} "
+              f"{Colors.BLUE}出错 {Colors.YELLOW}{failed}{Colors.ENDC} "
+              f"{Colors.BLUE}未发送通知 {Colors.YELLOW}{undelivered}{Colors.ENDC} "
+              f"{Colors.BLUE}退出码 {Colors.YELLOW}{code}{Colors.ENDC}")
+        return code
+
+    def _deadline_reached(self):
+        print(f"{Colors.YELLOW}已到达单次运行的时限，不再开始新的用户检查，剩余用户留到下次运行{Colors.ENDC}")
+        self.stop()
+
+    def _install_signal_handlers(self):
+        """SIGTERM / SIGINT 时停止调度并保存状态（只能在主线程注册）"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._handle_signal)
+        if hasattr(signal, 'SIGHUP'):  # Windows 没有 SIGHUP
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.scheduler.call_soon(self.reload_watch_list))
+
+    def _handle_signal(self, signum, frame):
+        print(f"\n{Colors.YELLOW}收到退出信号 ({signal.Signals(signum).name})，正在保存状态...{Colors.ENDC}")
+        self.stop()
+
+    def stop(self):
+        """请求停止监控：不再开始新的用户检查，放弃正在等待限流或重试的请求，正在进行的检查完成后退出主循环"""
+        self.stop_event.set()
+        self.scheduler.stop()
+
+    def shutdown(self):
+        """保存状态和请求缓存，关闭后台资源"""
+        self.stop_event.set()
+        self.scheduler.stop()
+        try:
+            self.save_state()
+            self.http_cache.save()
+        except Exception as e:
+            print(f"{Colors.RED}退出时保存状态失败: {str(e)}{Colors.ENDC}")
+        self.smtp.close()
+        self.metrics.shutdown()
+        if self.webhook is not None:
+            self.webhook.shutdown()
+        if self.shard is not None:
+            self.shard.leave()
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}监控已停止，状态已保存{Colors.ENDC}")
+
+    def reschedule_checks(self, immediate: bool = False):
+        """按所有用户中最早的下次检查时间安排检查任务（用户列表或调度变化后调用）"""
+        if not self.usernames:
+            self.scheduler.cancel('check')
+            return
+        now = time.time()
+        if immediate:
+            earliest = now
+        else:
+            # 上一轮开始前就已到期却仍没检查的用户稍后再试，避免空转（被推迟的用户已按自己的间隔重新安排）；
+            # 检查进行期间才到期的用户照常立即检查
+            earliest = min(now + self.overdue_retry if when <= self.round_started else when
+                           for when in map(self.next_check_time, self.usernames))
+        self.scheduler.schedule(earliest, 'check', self._check_job)
+
+    def _check_job(self):
+        if self.round_users is not None:
+            return  # 上一轮还在进行，结束时会重新安排
+        started = False
+        try:
+            if self.due_users(self.usernames):
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.RED}监控过程中出现错误: {str(e)}{Colors.ENDC}")
-                print(f"{Colors.YELLOW}程序将在60秒后重试...{Colors.ENDC}")
-                time.sleep(60)
+                print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}开始新一轮检查...{Colors.ENDC}")
+                started = self._check_due_users(self.usernames)
+        finally:
+            if not started and not self.stop_event.is_set():
+                self.reschedule_checks()
+
+    def _status_job(self):
+        """定期显示运行状态"""
+        self.scheduler.schedule_in(self.status_interval, 'status', self._status_job, deadline=self.status_interval)
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\n[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}监控程序正在运行中...{Colors.ENDC}")
+        print(f"{Colors.BLUE}监控用户: {Colors.YELLOW}{', '.join(self.usernames)}{Colors.ENDC}")
+        if self.round_users is not None:
+            print(f"{Colors.BLUE}本轮检查进行中: {Colors.YELLOW}{len(self.round_users)}{Colors.ENDC} {Colors.BLUE}个到期用户{Colors.ENDC}")
+        else:
+            self._print_next_check(self.usernames)
+        print(f"{Colors.BLUE}程序运行正常...{Colors.ENDC}\n")
+
+    def _flush_job(self):
+        """定期保存状态和请求缓存"""
+        self.scheduler.schedule_in(self.flush_interval, 'flush', self._flush_job)
+        if self.round_users is None:  # 检查进行中时各用户完成后已单独保存，本轮结束时再整体保存
+            self.save_state()
+        self.http_cache.save()
+
+    def _watch_list_job(self):
+        """定期检查监控列表文件是否变化"""
+        self.scheduler.schedule_in(self.watch_interval, 'watch_list', self._watch_list_job)
+        if self.watch_list.changed():
+            self.reload_watch_list()
+
+    def _shard_job(self):
+        """有进程加入或离开、或仍有待认领的用户时重新分配用户（由续约线程安排）"""
+        self.update_watch_list(self.all_usernames)
+
+    def reload_watch_list(self):
+        """重新读取监控列表文件，解析失败时保留当前列表"""
+        if self.watch_list is None:
+            return
+        try:
+            loaded = self.watch_list.load()
+            self.apply_settings(loaded['settings'])
+        except Exception as e:
+            print(f"{Colors.RED}重新加载监控列表 {self.watch_list.path} 失败，继续使用当前列表和设置: {str(e)}{Colors.ENDC}")
+            return
+        self.update_watch_list(loaded['users'])
+
+    def update_watch_list(self, usernames: List[str]):
+        """在运行中替换监控的用户列表
+
+        新增的用户没有调度记录，会在下一次调度时立即检查（首次检查只建立基线）；
+        移除的用户不再调度，已保存的状态保留，重新加入时从上次的状态继续对比。
+        分片模式下只保留分配给本进程的用户，其余用户的状态交还共享状态库。
+        """
+        self.all_usernames = list(usernames)
+        if self.shard is not None:
+            added, removed = self._sync_shard_users(usernames)
+        else:
+            current = set(self.usernames)
+            added = [u for u in usernames if u not in current]
+            removed = [u for u in self.usernames if u not in set(usernames)]
+            self.usernames = list(usernames)
+        if not added and not removed:
+            return
+
+        now = datetime.now(timezone.utc).isoformat()
+        for username in added:
+            self.last_check.setdefault(username, now)
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}监控列表已更新: "
+              f"新增 {Colors.YELLOW}{len(added)}{Colors.ENDC} {Colors.BLUE}个用户，"
+              f"移除 {Colors.YELLOW}{len(removed)}{Colors.ENDC} {Colors.BLUE}个用户，"
+              f"共 {Colors.YELLOW}{len(self.usernames)}{Colors.ENDC} {Colors.BLUE}个{Colors.ENDC}")
+        if not self.stop_event.is_set():
+            self.reschedule_checks(immediate=bool(added))
+
+    def apply_settings(self, settings: Dict):
+        """应用监控列表文件中可热加载的设置；只修改一端时与当前的另一端冲突则整体拒绝"""
+        min_interval = settings.get('min_interval', self.min_interval)
+        max_interval = settings.get('max_interval', self.max_interval)
+        if min_interval > max_interval:
+            raise ValueError(f"min_interval ({min_interval}) 不能大于 max_interval ({max_interval})")
+        for key, value in settings.items():
+            if key in ('low_priority_users', 'webhook_users'):
+                value = set(value or [])
+            if getattr(self, key, None) != value:
+                setattr(self, key, value)
+                print(f"{Colors.BLUE}设置已更新: {Colors.YELLOW}{key} = {value}{Colors.ENDC}")
+
+    def _on_job_error(self, name: str, error: Exception):
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.RED}任务 {name} 出现错误: {str(error)}{Colors.ENDC}")
+
+    def _on_job_skipped(self, name: str, lateness: float):
+        print(f"{Colors.YELLOW}任务 {name} 已延迟 {lateness:.0f} 秒，超过期限，本次跳过{Colors.ENDC}")
+
+    def _check_due_users(self, usernames: List[str]) -> bool:
+        """开始检查所有到期的用户，返回是否开始了新一轮检查
+
+        检查提交后立即返回，不占用调度线程；全部用户检查完成后由 _finish_round 保存新的调度时间。
+        """
+        self.round_started = time.time()
+        due = self.due_users(usernames)
+        if not due:
+            return False
+        # 分散窗口以到期用户中最短的检查间隔为准，避免拖过下一次检查
+        shortest = min(self.schedule.get(u, {}).get('interval', self.check_interval) for u in due)
+        ordered = self._schedule_order(due)
+        self._begin_cycle(ordered)
+        self.round_users = due
+        if not ordered:
+            self._finish_round()
+            return True
+        self._start_round(ordered, shortest * self.spread_ratio)
+        return True
+
+    def _start_round(self, ordered: List[str], spread_window: float):
+        """通过调度器把各用户的检查均匀分散到 spread_window 内提交给线程池"""
+        with self.round_lock:
+            self.round_remaining = len(ordered)
+        delay = spread_window / len(ordered) if spread_window else 0
+        for position, username in enumerate(ordered):
+            if position and delay:
+                self.scheduler.schedule_in(position * delay, f'check:{username}', self._submit_round_check,
+                                           username, position)
+            else:
+                self._submit_round_check(username, position)
+
+    def _submit_round_check(self, username: str, position: int):
+        self.worker_pool.submit(self._round_check, username, priority=position)
+
+    def _round_check(self, username: str):
+        """线程池中检查一个用户，本轮最后一个用户检查完成后回到调度线程结束本轮"""
+        try:
+            self.check_user_updates(username)
+        finally:
+            with self.round_lock:
+                self.round_remaining -= 1
+                finished = self.round_remaining == 0
+            if finished:
+                self.scheduler.call_soon(self._finish_round)
+
+    def _finish_round(self):
+        """输出本轮统计，保存新的调度时间并安排下一轮检查"""
+        usernames, self.round_users = self.round_users, None
+        self._end_cycle(usernames)
+        self.save_state()
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}本轮检查完成{Colors.ENDC}")
+        self._print_next_check(self.usernames)
+        if not self.stop_event.is_set():
+            self.reschedule_checks()
+
+    def _print_next_check(self, usernames: List[str]):
+        """显示最近一次到期的检查时间和倒计时"""
+        if not usernames:
+            return
+        username = min(usernames, key=self.next_check_time)
+        next_check_time = datetime.fromtimestamp(self.next_check_time(username))
+        time_until_next_check = max(0, (next_check_time - datetime.now()).total_seconds())
+        hours = int(time_until_next_check // 3600)
+        minutes = int((time_until_next_check % 3600) // 60)
+        seconds = int(time_until_next_check % 60)
+        print(f"{Colors.BLUE}下次检查时间: {Colors.YELLOW}{next_check_time.strftime('%Y-%m-%d %H:%M:%S')}"
+              f"{Colors.ENDC} {Colors.BLUE}({username}){Colors.ENDC}")
+        print(f"{Colors.BLUE}距离下次检查还有: {Colors.YELLOW}{hours:02d}:{minutes:02d}:{seconds:02d}{Colors.ENDC}\n")
 
     def _perform_check(self, usernames):
-        """执行实际的检查操作"""
-        threads = []
-        for username in usernames:
-            thread = threading.Thread(target=self.check_user_updates, args=(username,))
-            threads.append(thread)
-            thread.start()
+        """检查一遍所有用户并等待完成（单次运行和基准测试使用）"""
+        ordered = self._schedule_order(usernames)
+        self._begin_cycle(ordered)
 
-        # 等待所有线程完成
-        for thread in threads:
-            thread.join()
+        for position, username in enumerate(ordered):
+            self.worker_pool.submit(self.check_user_updates, username, priority=position)
 
-    def check_rate_limit(self):
-        """检查 API 速率限制"""
+        # 等待所有任务完成
+        self.worker_pool.wait()
+
+        self._end_cycle(usernames)
+
+    def _schedule_order(self, usernames) -> List[str]:
+        """确定本轮检查顺序：配额紧张时推迟低优先级用户，其余按上一轮耗时从长到短排列"""
+        if self.token_pool.is_low():
+            deferred = [u for u in usernames if u in self.low_priority_users]
+            if deferred:
+                print(f"{Colors.YELLOW}API 配额紧张 ({self.token_pool.status()})，"
+                      f"推迟检查低优先级用户: {', '.join(deferred)}{Colors.ENDC}")
+                self._count('deferred_users', len(deferred))
+                for username in deferred:
+                    self._defer_check(username)
+            usernames = [u for u in usernames if u not in self.low_priority_users]
+
+        # 上一轮耗时越长的用户越先执行，缩短整轮检查的总时间
+        return sorted(usernames, key=lambda u: -self.check_latency.get(u, 0))
+
+    def _defer_check(self, username: str):
+        """被推迟的用户按自己的检查间隔安排下次检查，而不是每隔 overdue_retry 秒重试"""
+        interval = self.schedule.get(username, {}).get('interval', self.check_interval)
+        next_check = datetime.now(timezone.utc).timestamp() + interval
+        self.schedule[username] = {
+            'interval': interval,
+            'next_check': datetime.fromtimestamp(next_check, timezone.utc).isoformat()
+        }
+
+    def _begin_cycle(self, usernames: List[str] = ()):
+        """开始新一轮检查前清零统计，GraphQL 模式下批量预取仓库状态"""
+        self.http_cache.reset_stats()
+        self.cycle_started = time.monotonic()
+        with self.stats_lock:
+            self.cycle_stats = {}
+        self.prefetch_states(list(usernames))
+
+    def _end_cycle(self, usernames):
+        """输出本轮统计并持久化缓存"""
+        if self.cycle_started is not None:
+            self.metrics.observe('cycle_seconds', time.monotonic() - self.cycle_started)
+        self._report_cycle_stats()
+        self._report_slow_users(usernames)
         try:
-            response = self.session.get('https://api.github.com/rate_limit')
-            if response.status_code == 200:
+            self.state_store.flush()  # JSON 存储在检查过程中合并写入，本轮结束时写入剩余的更新
+        except Exception as e:
+            print(f"{Colors.RED}保存状态文件失败: {str(e)}{Colors.ENDC}")
+        if self.metrics_file:
+            try:
+                self.metrics.dump_json(self.metrics_file)
+            except Exception as e:
+                print(f"{Colors.RED}导出指标失败: {str(e)}{Colors.ENDC}")
+
+    def _report_slow_users(self, usernames, top: int = 5):
+        """输出本轮检查耗时最长的用户"""
+        latencies = sorted(((self.check_latency[u], u) for u in usernames if u in self.check_latency),
+                           reverse=True)[:top]
+        if not latencies:
+            return
+        slowest = ', '.join(f"{username} {seconds:.1f}s" for seconds, username in latencies)
+        print(f"{Colors.BLUE}检查耗时最长的用户: {Colors.YELLOW}{slowest}{Colors.ENDC}")
+
+    def _report_cycle_stats(self):
+        """输出本轮请求数、条件请求缓存命中和节省的 API 调用，并持久化缓存"""
+        stats = self.http_cache.stats
+        print(f"{Colors.BLUE}本轮 API 请求: {Colors.YELLOW}{stats['requests']}{Colors.ENDC} "
+              f"{Colors.BLUE}条件请求: {Colors.YELLOW}{stats['conditional']}{Colors.ENDC} "
+              f"{Colors.BLUE}304 命中: {Colors.YELLOW}{stats['not_modified']}{Colors.ENDC}")
+        if self.detection_mode == 'events':
+            saved = self.cycle_stats.get('api_calls_saved', 0)
+            print(f"{Colors.BLUE}事件流模式节省 API 调用: {Colors.YELLOW}{saved}{Colors.ENDC}")
+        if self.fetch_mode == 'graphql':
+            print(f"{Colors.BLUE}GraphQL 查询: {Colors.YELLOW}{self.cycle_stats.get('graphql_queries', 0)}{Colors.ENDC} "
+                  f"{Colors.BLUE}消耗点数: {Colors.YELLOW}{self.cycle_stats.get('graphql_cost', 0)}{Colors.ENDC} "
+                  f"{Colors.BLUE}回退 REST 的用户: {Colors.YELLOW}{self.cycle_stats.get('graphql_fallback_users', 0)}{Colors.ENDC}")
+        duplicates = self.cycle_stats.get('duplicates_suppressed', 0)
+        if duplicates:
+            print(f"{Colors.BLUE}去重跳过的重复通知: {Colors.YELLOW}{duplicates}{Colors.ENDC}")
+        skipped = self.cycle_stats.get('circuit_open_users', 0)
+        inaccessible = self.cycle_stats.get('inaccessible_skipped', 0)
+        if skipped or inaccessible:
+            print(f"{Colors.BLUE}熔断跳过的用户: {Colors.YELLOW}{skipped}{Colors.ENDC} "
+                  f"{Colors.BLUE}跳过的无法访问仓库: {Colors.YELLOW}{inaccessible}{Colors.ENDC}")
+        print(f"{Colors.BLUE}API 剩余配额: {Colors.YELLOW}{self.token_pool.status()}{Colors.ENDC}")
+        if len(self.token_pool.clients) > 1:
+            usage = ', '.join(f"{u['token']} {u['requests']}次 ({u['remaining']}"
+                              f"{'，' + u['disabled_reason'] if u['disabled_reason'] else ''})"
+                              for u in self.token_pool.usage())
+            print(f"{Colors.BLUE}各 Token 使用情况: {Colors.YELLOW}{usage}{Colors.ENDC}")
+        try:
+            self.http_cache.save()
+        except Exception as e:
+            print(f"{Colors.RED}保存请求缓存失败: {str(e)}{Colors.ENDC}")
+
+    def check_rate_limit(self):
+        """检查 API 速率限制（每个 token 分别查询）"""
+        available = False
+        for client in self.token_pool.clients:
+            try:
+                response = self.request('GET', f'{self.api_base}/rate_limit', client=client)
+                if response.status_code != 200:
+                    continue
                 limits = response.json()
                 core_limit = limits['resources']['core']
+                client.rate_limiter.update_from_rate_limit(core_limit)
                 remaining = core_limit['remaining']
                 limit = core_limit['limit']
                 reset_time = datetime.fromtimestamp(core_limit['reset']).strftime('%Y-%m-%d %H:%M:%S')
                 
-                print(f"\n{Colors.BLUE}API 速率限制状态:{Colors.ENDC}")
+                label = f" ({client.label})" if len(self.token_pool.clients) > 1 else ''
+                print(f"\n{Colors.BLUE}API 速率限制状态{label}:{Colors.ENDC}")
                 print(f"剩余请求次数: {remaining}/{limit}")
                 print(f"重置时间: {reset_time}")
                 
                 if remaining < 10:  # 当剩余请求次数较少时发出警告
                     print(f"{Colors.RED}警告: API 请求次数即将用尽！{Colors.ENDC}")
-                    
-                return remaining > 0
-        except Exception as e:
-            print(f"{Colors.RED}检查 API 速率限制时出错: {str(e)}{Colors.ENDC}")
-            return True  # 出错时默认继续执行
+                available = available or remaining > 0
+            except Exception as e:
+                print(f"{Colors.RED}检查 API 速率限制时出错: {str(e)}{Colors.ENDC}")
+                return True  # 出错时默认继续执行
+        return available
 
     def get_with_retry(self, url, params=None, max_retries=3, retry_delay=5):
-        """带重试机制的 GET 请求"""
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(url, params=params)
-                
-                if response.status_code == 403 and 'rate limit exceeded' in response.text.lower():
-                    print(f"{Colors.RED}API 速率限制已达到，等待重置...{Colors.ENDC}")
-                    self.check_rate_limit()  # 显示限制信息
-                    return None
-                    
-                response.raise_for_status()
-                return response
-                
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    print(f"{Colors.YELLOW}请求失败，{retry_delay}秒后重试... ({attempt + 1}/{max_retries}){Colors.ENDC}")
-                    time.sleep(retry_delay)
-                else:
-                    print(f"{Colors.RED}请求失败，已达到最大重试次数{Colors.ENDC}")
-                    raise 
\ No newline at end of file
+        """带重试机制的 GET 请求（重试、超时和熔断由统一请求层处理）"""
+        response = self.request('GET', url, params=params, max_retries=max_retries, retry_base=retry_delay)
+        
+        if response.status_code == 403 and 'rate limit exceeded' in response.text.lower():
+            print(f"{Colors.RED}API 速率限制已达到，等待重置...{Colors.ENDC}")
+            self.check_rate_limit()  # 显示限制信息
+            return None
+            
+        response.raise_for_status()
+        return response
@@ -0,0 +1,118 @@
+import json
+from typing import Dict, List, Tuple
+
+from repo_snapshot import RepoRecord, UserSnapshot
+
+REPO_FIELDS_QUERY = '''
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          databaseId name createdAt updatedAt pushedAt url
+          defaultBranchRef { target { ... on Commit { history(first: 1) { nodes { authoredDate oid } } } } }
+        }'''
+
+
+class GraphQLFetcher:
+    """使用 GraphQL v4 别名批量查询多个用户的仓库及默认分支最新提交
+
+    一次查询覆盖多个用户，结果转换为与 check_user_activity 相同的 UserSnapshot 快照。
+    批大小按节点上限估算，查询超时或出错时自动减半；每次查询的 cost 计入统计。
+    """
+
+    # GitHub 单次查询最多 500,000 个节点
+    NODE_LIMIT = 500000
+
+    def __init__(self, monitor, repos_per_page: int = 100, max_batch: int = 25):
+        self.monitor = monitor
+        self.repos_per_page = repos_per_page
+        self.max_batch = max_batch
+        # 每个用户的节点数：仓库本身 + 每个仓库 1 个提交
+        nodes_per_user = repos_per_page * 2
+        self.batch_size = max(1, min(max_batch, self.NODE_LIMIT // nodes_per_user))
+        self.total_cost = 0
+
+    def _build_query(self, cursors: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+        """构造别名批量查询，返回 (query, 别名到用户名的映射)"""
+        aliases = {}
+        parts = ['rateLimit { cost remaining resetAt }']
+        for index, (username, cursor) in enumerate(cursors.items()):
+            alias = f'u{index}'
+            aliases[alias] = username
+            after = f', after: {json.dumps(cursor)}' if cursor else ''
+            parts.append(
+                f'{alias}: repositoryOwner(login: {json.dumps(username)}) {{\n'
+                f'      repositories(first: {self.repos_per_page}{after}, privacy: PUBLIC, '
+                f'ownerAffiliations: [OWNER]) {{{REPO_FIELDS_QUERY}\n      }}\n    }}')
+        return 'query {\n    ' + '\n    '.join(parts) + '\n}', aliases
+
+    def _execute(self, query: str) -> Dict:
+        response = self.monitor.request('POST', f'{self.monitor.api_base}/graphql', json_body={'query': query})
+        if response.status_code != 200:
+            raise RuntimeError(f"GraphQL 请求失败 (状态码: {response.status_code})")
+        result = response.json()
+        if result.get('data') is None:
+            raise RuntimeError(f"GraphQL 查询出错: {result.get('errors')}")
+        cost = (result['data'].get('rateLimit') or {}).get('cost', 0)
+        self.total_cost += cost
+        self.monitor._count('graphql_cost', cost)
+        self.monitor._count('graphql_queries')
+        return result
+
+    def _to_repo_state(self, username: str, node: Dict) -> RepoRecord:
+        """把 GraphQL 仓库节点转换为与 REST 相同的仓库状态"""
+        repo = {
+            'id': node.get('databaseId'),
+            'name': node['name'],
+            'created_at': node['createdAt'],
+            'updated_at': node['updatedAt'],
+            'pushed_at': node.get('pushedAt'),
+            'html_url': node['url']
+        }
+        commits = []
+        target = (node.get('defaultBranchRef') or {}).get('target') or {}
+        history = (target.get('history') or {}).get('nodes') or []
+        if history:
+            commits = [{'sha': history[0]['oid'], 'commit': {'author': {'date': history[0]['authoredDate']}}}]
+        return self.monitor._repo_state(username, repo, commits)
+
+    def fetch_states(self, usernames: List[str]) -> Dict[str, UserSnapshot]:
+        """批量获取用户的 current_state，无法通过 GraphQL 获取的用户不会出现在结果中（由调用方回退到 REST）"""
+        states = {username: UserSnapshot(username) for username in usernames}
+        cursors = {username: None for username in usernames}
+        failed = set()
+
+        while cursors:
+            batch = dict(list(cursors.items())[:self.batch_size])
+            query, aliases = self._build_query(batch)
+            try:
+                result = self._execute(query)
+            except Exception as e:
+                if self.batch_size > 1:
+                    # 查询过大可能超时，缩小批量后重试
+                    self.batch_size = max(1, self.batch_size // 2)
+                    print(f"GraphQL 批量查询失败，批大小调整为 {self.batch_size}: {str(e)}")
+                    continue
+                failed.update(batch)
+                for username in batch:
+                    del cursors[username]
+                continue
+
+            if self.batch_size < self.max_batch:
+                self.batch_size += 1
+
+            for alias, username in aliases.items():
+                owner = result['data'].get(alias)
+                if owner is None:
+                    # 用户不存在或无法访问，交给 REST 处理并输出错误
+                    failed.add(username)
+                    del cursors[username]
+                    continue
+                repositories = owner['repositories']
+                for node in repositories['nodes']:
+                    states[username].add(self._to_repo_state(username, node))
+                page_info = repositories['pageInfo']
+                if page_info['hasNextPage']:
+                    cursors[username] = page_info['endCursor']
+                else:
+                    del cursors[username]
+
+        return {username: state for username, state in states.items() if username not in failed}
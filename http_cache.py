@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class HTTPCache:
+    """基于 ETag / Last-Modified 的条件请求缓存，按 URL 和参数持久化到文件"""
+
+    def __init__(self, cache_file: str = 'http_cache.json'):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.stats = {'requests': 0, 'conditional': 0, 'not_modified': 0}
+        self.load()
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict] = None, trim=None) -> str:
+        """由 URL、排序后的参数和精简函数名生成缓存键"""
+        key = url
+        if params:
+            key += '?' + '&'.join(f'{k}={params[k]}' for k in sorted(params))
+        if trim:
+            key += f'#{trim.__name__}'
+        return key
+
+    def load(self):
+        """加载缓存文件"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+        except Exception:
+            self.entries = {}
+
+    def save(self):
+        """缓存有变化时写回文件（先写临时文件再替换）"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = dict(self.entries)
+            self.dirty = False
+        tmp_file = f'{self.cache_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def conditional_headers(self, key: str) -> Dict[str, str]:
+        """返回该请求应附带的条件请求头"""
+        with self.lock:
+            self.stats['requests'] += 1
+            entry = self.entries.get(key)
+            if entry:
+                self.stats['conditional'] += 1
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def get(self, key: str) -> Optional[Dict]:
+        """命中 304 时取出缓存的条目"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.stats['not_modified'] += 1
+            return entry
+
+    def store(self, key: str, response, data):
+        """保存 200 响应的校验信息和解析后的内容"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self.lock:
+            self.entries[key] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'link': response.headers.get('Link'),
+                'data': data
+            }
+            self.dirty = True
+
+    def discard(self, key: str):
+        """删除不会再使用的条目（如提交游标前进后旧的 since 查询）"""
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+
+    def reset_stats(self):
+        """开始新一轮检查时清零统计"""
+        with self.lock:
+            self.stats = {'requests': 0, 'conditional': 0, 'not_modified': 0}
@@ -1,18 +1,61 @@
+import sys
+
 from github_monitor import GitHubMonitor
-from config import GITHUB_TOKEN, EMAIL_CONFIG
+from config import (GITHUB_TOKEN, GITHUB_TOKENS, EMAIL_CONFIG, DETECTION_MODE, MAX_WORKERS, ENGINE, CONNECTION_LIMIT,
+                    SPREAD_RATIO, LOW_PRIORITY_USERS, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL,
+                    STATE_BACKEND, DIGEST_WINDOW, NOTIFICATION_DEDUP_TTL, COALESCE_NOTIFICATIONS,
+                    FETCH_MODE, REQUEST_TIMEOUT, MAX_RETRIES,
+                    METRICS_PORT, METRICS_FILE, WATCH_LIST_FILE, WATCH_LIST_INTERVAL,
+                    WEBHOOK_PORT, WEBHOOK_HOST, WEBHOOK_SECRET, WEBHOOK_USERS, WEBHOOK_RECONCILE_INTERVAL,
+                    SHARD_WORKERS, SHARD_LEASE_TTL, FAST_START, RUN_ONCE, RUN_ONCE_DEADLINE)
 
 def main():
     # 创建监控实例
-    monitor = GitHubMonitor(GITHUB_TOKEN, EMAIL_CONFIG)
-    
-    # 要监控的GitHub用户名列表
+    options = dict(detection_mode=DETECTION_MODE, spread_ratio=SPREAD_RATIO,
+                   low_priority_users=LOW_PRIORITY_USERS, min_interval=MIN_CHECK_INTERVAL,
+                   max_interval=MAX_CHECK_INTERVAL, state_backend=STATE_BACKEND,
+                   digest_window=DIGEST_WINDOW, dedup_ttl=NOTIFICATION_DEDUP_TTL,
+                   coalesce=COALESCE_NOTIFICATIONS, fetch_mode=FETCH_MODE,
+                   request_timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES,
+                   metrics_port=METRICS_PORT, metrics_file=METRICS_FILE or None,
+                   webhook_port=WEBHOOK_PORT, webhook_host=WEBHOOK_HOST, webhook_secret=WEBHOOK_SECRET,
+                   webhook_users=WEBHOOK_USERS, reconcile_interval=WEBHOOK_RECONCILE_INTERVAL,
+                   fast_start=FAST_START)
+    tokens = GITHUB_TOKENS or GITHUB_TOKEN
+
+    # 要监控的GitHub用户名列表（配置了 WATCH_LIST_FILE 时从文件读取）
     usernames = [ 
         "1",
         "2",
         "3"
     ]
+
+    if SHARD_WORKERS > 1 and not RUN_ONCE:
+        from sharding import ShardCoordinator
+        engine_options = {'connection_limit': CONNECTION_LIMIT} if ENGINE == "asyncio" else {'max_workers': MAX_WORKERS}
+        coordinator = ShardCoordinator(tokens, EMAIL_CONFIG, SHARD_WORKERS, engine=ENGINE,
+                                       options=dict(options, **engine_options), lease_ttl=SHARD_LEASE_TTL)
+        coordinator.run(None if WATCH_LIST_FILE else usernames, check_interval=1800,
+                        watch_list=WATCH_LIST_FILE or None, watch_interval=WATCH_LIST_INTERVAL)
+        return
+
+    if ENGINE == "asyncio":
+        from async_monitor import AsyncGitHubMonitor
+        monitor = AsyncGitHubMonitor(tokens, EMAIL_CONFIG, connection_limit=CONNECTION_LIMIT, **options)
+    else:
+        monitor = GitHubMonitor(tokens, EMAIL_CONFIG, max_workers=MAX_WORKERS, **options)
     
-    # 开始监控（改为30分钟检查一次）
+    # 单次运行：检查一遍后退出，退出码表示本次运行的结果
+    if RUN_ONCE:
+        sys.exit(monitor.run_once(None if WATCH_LIST_FILE else usernames, watch_list=WATCH_LIST_FILE or None,
+                                  deadline=RUN_ONCE_DEADLINE or None))
+
+    # 配置了监控列表文件时从文件读取用户，修改文件后无需重启
+    if WATCH_LIST_FILE:
+        monitor.monitor_users(check_interval=1800, watch_list=WATCH_LIST_FILE, watch_interval=WATCH_LIST_INTERVAL)
+        return
+
+    # 开始监控（初始30分钟检查一次，之后按用户活跃程度自动调整）
     monitor.monitor_users(usernames, check_interval=1800)  # 1800秒 = 30分钟
 
 if __name__ == "__main__":
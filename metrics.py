@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+# 直方图默认分桶（秒），覆盖单次 API 请求到整轮检查
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    items = key + extra
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+class Metrics:
+    """进程内的计数器、仪表和直方图
+
+    可以渲染为 Prometheus 文本格式（通过本地 HTTP /metrics 暴露），也可以导出为 JSON。
+    仪表既可以直接设置，也可以注册回调在导出时读取（如通知队列长度）。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.gauges: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, Dict]] = {}
+        self.callbacks: Dict[str, Callable[[], float]] = {}
+        self.help: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def gauge_callback(self, name: str, func: Callable[[], float]):
+        """注册在导出时才计算的仪表"""
+        self.callbacks[name] = func
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                hist['buckets'][index] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def _callback_values(self) -> Dict[str, float]:
+        values = {}
+        for name, func in self.callbacks.items():
+            try:
+                value = func()
+            except Exception:
+                continue  # 回调出错时跳过，不影响其他指标
+            if value is not None:
+                values[name] = value
+        return values
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        callbacks = self._callback_values()
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                self._header(lines, name, 'counter')
+                for key, value in series.items():
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+            for name, value in callbacks.items():
+                gauges[name] = {(): value}
+            for name, series in sorted(gauges.items()):
+                self._header(lines, name, 'gauge')
+                for key, value in series.items():
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+            for name, series in sorted(self.histograms.items()):
+                self._header(lines, name, 'histogram')
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist['buckets']):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key, (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(key, (("le", "+Inf"),))} {hist["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {hist["sum"]}')
+                    lines.append(f'{name}_count{_format_labels(key)} {hist["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name: str, kind: str):
+        if name in self.help:
+            lines.append(f'# HELP {name} {self.help[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    def to_dict(self) -> Dict:
+        """JSON 友好的快照，标签序列化为 "k=v,k=v" 字符串"""
+        def labels(key):
+            return ','.join(f'{k}={v}' for k, v in key)
+
+        callbacks = self._callback_values()
+        with self.lock:
+            gauges = {name: {labels(k): v for k, v in series.items()} for name, series in self.gauges.items()}
+            gauges.update({name: {'': value} for name, value in callbacks.items()})
+            return {
+                'counters': {name: {labels(k): v for k, v in series.items()}
+                             for name, series in self.counters.items()},
+                'gauges': gauges,
+                'histograms': {name: {labels(k): {'buckets': dict(zip(map(str, self.buckets), h['buckets'])),
+                                                  'sum': h['sum'], 'count': h['count']}
+                                      for k, h in series.items()}
+                               for name, series in self.histograms.items()},
+            }
+
+    def dump_json(self, path: str):
+        """原子写入 JSON 快照"""
+        temp_file = f'{path}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        """在后台线程启动 HTTP 服务：/metrics 为 Prometheus 格式，/metrics.json 为 JSON"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 只在启用服务时导入
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(metrics.to_dict(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
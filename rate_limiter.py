@@ -0,0 +1,99 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """根据 X-RateLimit-* 响应头跟踪剩余配额的令牌桶
+
+    令牌按 (剩余配额 - 保留额度) / 距离重置的秒数 的速率补充，桶容量为可用配额的
+    burst_ratio（至少 burst 个）。配额充足时一轮检查可以快速完成，配额紧张时
+    自动放慢到刚好能撑到重置时间的速度，而不是在窗口中途耗尽。
+    """
+
+    def __init__(self, reserve: int = 50, burst: int = 20, burst_ratio: float = 0.25, low_ratio: float = 0.1):
+        self.reserve = reserve  # 保留给速率查询等请求的额度
+        self.burst = burst  # 令牌桶的最小容量
+        self.burst_ratio = burst_ratio  # 令牌桶容量占可用配额的比例
+        self.low_ratio = low_ratio  # 剩余配额低于该比例时视为配额紧张
+        self.limit = None
+        self.remaining = None  # 未知时不限速
+        self.reset_at = 0.0
+        self.tokens = None  # 首次获得配额信息时装满
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, headers):
+        """从任意 API 响应头中更新配额信息"""
+        resource = headers.get('X-RateLimit-Resource')
+        if resource and resource != 'core':
+            return
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            self.remaining = int(remaining)
+            self.reset_at = float(reset)
+            limit = headers.get('X-RateLimit-Limit')
+            if limit is not None:
+                self.limit = int(limit)
+
+    def update_from_rate_limit(self, core: dict):
+        """使用 /rate_limit 接口返回的 core 数据更新配额信息"""
+        with self.lock:
+            self.limit = core['limit']
+            self.remaining = core['remaining']
+            self.reset_at = float(core['reset'])
+
+    def _expire(self):
+        # 到达重置时间后配额恢复，等待下一次响应头更新
+        if self.remaining is not None and time.time() >= self.reset_at:
+            self.remaining = None
+
+    def reserve_slot(self) -> float:
+        """占用一个请求名额，返回发送请求前需要等待的秒数"""
+        with self.lock:
+            self._expire()
+            now = time.monotonic()
+            if self.remaining is None:
+                self.last_refill = now
+                return 0.0
+
+            usable = self.remaining - self.reserve
+            seconds_left = max(1.0, self.reset_at - time.time())
+            if usable <= 0:
+                # 配额即将耗尽，等待重置
+                self.remaining -= 1
+                return max(0.0, self.reset_at - time.time())
+
+            rate = usable / seconds_left
+            capacity = max(self.burst, usable * self.burst_ratio)
+            if self.tokens is None:
+                self.tokens = capacity
+            self.tokens = min(capacity, self.tokens + (now - self.last_refill) * rate)
+            self.last_refill = now
+            self.tokens -= 1
+            self.remaining -= 1  # 在下一次响应头到达前先按本地估算递减
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / rate
+
+    def acquire(self):
+        """阻塞直到可以发送下一个请求"""
+        delay = self.reserve_slot()
+        if delay > 0:
+            time.sleep(delay)
+
+    def is_low(self) -> bool:
+        """剩余配额是否已低于警戒线"""
+        with self.lock:
+            self._expire()
+            if self.remaining is None or not self.limit:
+                return False
+            return self.remaining < self.limit * self.low_ratio
+
+    def status(self) -> str:
+        with self.lock:
+            if self.remaining is None:
+                return "未知"
+            return f"{self.remaining}/{self.limit or '?'}"
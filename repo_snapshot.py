@@ -0,0 +1,311 @@
+import calendar
+import copy
+import sys
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+GITHUB_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+@lru_cache(maxsize=4096)
+def _day_start(day: str) -> int:
+    return calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0, 0, 0, 0))
+
+
+def parse_time(value) -> Optional[int]:
+    """把 GitHub 时间字符串转换为 UTC 秒级时间戳，None 保持为 None"""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    # REST / GraphQL 返回的固定格式 2024-01-02T03:04:05Z 直接按位置解析，日期部分缓存，比 strptime 快一个数量级
+    if len(value) == 20 and value[10] == 'T' and value[19] == 'Z':
+        return _day_start(value[:10]) + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def format_time(value: Optional[int]) -> Optional[str]:
+    """时间戳转换回 GitHub 的时间字符串格式"""
+    if value is None:
+        return None
+    return time.strftime(GITHUB_TIME_FORMAT, time.gmtime(value))
+
+
+class RepoRecord:
+    """单个仓库的紧凑状态
+
+    时间统一保存为整数时间戳，仓库名经过 sys.intern 驻留；html_url 只在与
+    https://github.com/<用户>/<仓库> 不一致时保存。latest_commit 为 None 表示没有获取到提交。
+    latest_commit 和 head_sha（20 字节）一起作为增量获取提交的游标。
+    """
+
+    __slots__ = ('id', 'name', 'created_at', 'updated_at', 'pushed_at', 'latest_commit', 'head_sha', 'html_url')
+
+    def __init__(self, id, name: str, created_at: Optional[int], updated_at: Optional[int],
+                 pushed_at: Optional[int] = None, latest_commit: Optional[int] = None, html_url: Optional[str] = None,
+                 head_sha: Optional[str] = None):
+        self.id = id
+        self.name = sys.intern(name)
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.pushed_at = pushed_at
+        self.latest_commit = latest_commit
+        self.head_sha = _pack_sha(head_sha)
+        self.html_url = html_url
+
+    @property
+    def has_commits(self) -> bool:
+        return self.latest_commit is not None
+
+    @property
+    def sha(self) -> Optional[str]:
+        """最新提交的 SHA（十六进制）"""
+        return self.head_sha.hex() if self.head_sha is not None else None
+
+    @classmethod
+    def from_api(cls, owner: str, repo: Dict, commits: List[Dict]) -> 'RepoRecord':
+        """由仓库信息和最新提交生成记录（REST、GraphQL 和 webhook 共用）"""
+        latest_commit = parse_time(commits[0]['commit']['author']['date']) if commits else None
+        record = cls(repo.get('id'), repo['name'], parse_time(repo['created_at']), parse_time(repo['updated_at']),
+                     parse_time(repo.get('pushed_at')), latest_commit,
+                     head_sha=commits[0].get('sha') if commits else None)
+        record.set_url(repo.get('html_url'), owner)
+        return record
+
+    def set_url(self, html_url: Optional[str], owner: str):
+        self.html_url = None if not html_url or html_url == default_url(owner, self.name) else html_url
+
+    def url(self, owner: str) -> str:
+        return self.html_url or default_url(owner, self.name)
+
+    def matches(self, repo: Dict) -> bool:
+        """仓库列表中的 pushed_at / updated_at 与记录一致"""
+        return self.pushed_at == parse_time(repo.get('pushed_at')) and self.updated_at == parse_time(repo['updated_at'])
+
+    def to_state(self, owner: str) -> Dict:
+        """转换为状态文件中的字典格式"""
+        state = {
+            'created_at': format_time(self.created_at),
+            'updated_at': format_time(self.updated_at),
+            'pushed_at': format_time(self.pushed_at),
+            'html_url': self.url(owner),
+            'has_commits': self.has_commits,
+        }
+        if self.has_commits:
+            state['latest_commit'] = format_time(self.latest_commit)
+            if self.head_sha is not None:
+                state['latest_sha'] = self.sha
+        if self.id is not None:
+            state['id'] = self.id
+        return state
+
+    @classmethod
+    def from_state(cls, owner: str, name: str, state: Dict) -> 'RepoRecord':
+        latest_commit = parse_time(state.get('latest_commit')) if state.get('has_commits') else None
+        record = cls(state.get('id'), name, parse_time(state.get('created_at')), parse_time(state.get('updated_at')),
+                     parse_time(state.get('pushed_at')), latest_commit,
+                     head_sha=state.get('latest_sha') if latest_commit is not None else None)
+        record.set_url(state.get('html_url'), owner)
+        return record
+
+    def __repr__(self):
+        return f'RepoRecord({self.name!r}, id={self.id!r}, updated_at={self.updated_at})'
+
+
+def _pack_sha(sha: Optional[str]) -> Optional[bytes]:
+    """40 位十六进制 SHA 保存为 20 字节，无法解析时不保存"""
+    if not sha:
+        return None
+    try:
+        return bytes.fromhex(sha)
+    except ValueError:
+        return None
+
+
+def default_url(owner: str, name: str) -> str:
+    return f'https://github.com/{owner}/{name}'
+
+
+def is_updated(old: RepoRecord, new: RepoRecord) -> bool:
+    """更新时间变晚且有更新的提交才算真实更新"""
+    if old.updated_at is not None and (new.updated_at or 0) <= old.updated_at:
+        return False
+    return new.latest_commit is not None and (old.latest_commit is None or new.latest_commit > old.latest_commit)
+
+
+class UserSnapshot:
+    """一个用户全部仓库的快照：仓库名 -> RepoRecord
+
+    保存到 known_repos 之后不再原地修改（其他线程可能正在遍历），需要修改时先 copy 再整体替换。
+    """
+
+    __slots__ = ('owner', 'repos')
+
+    def __init__(self, owner: str, records=()):
+        self.owner = sys.intern(owner)
+        self.repos: Dict[str, RepoRecord] = {}
+        for record in records:
+            self.repos[record.name] = record
+
+    def add(self, record: RepoRecord):
+        self.repos[record.name] = record
+
+    def get(self, name: str) -> Optional[RepoRecord]:
+        return self.repos.get(name)
+
+    def pop(self, name: str) -> Optional[RepoRecord]:
+        return self.repos.pop(name, None)
+
+    def copy(self) -> 'UserSnapshot':
+        """浅拷贝（RepoRecord 共享，rename 会替换为新的记录）"""
+        return UserSnapshot(self.owner, self.repos.values())
+
+    def rename(self, old_name: str, new_name: str, html_url: str = None) -> bool:
+        record = self.repos.pop(old_name, None)
+        if record is None:
+            return False
+        record = copy.copy(record)  # 记录可能同时属于其他快照
+        record.name = sys.intern(new_name)
+        record.set_url(html_url, self.owner)
+        self.repos[record.name] = record
+        return True
+
+    def latest_push(self) -> Optional[int]:
+        """所有仓库中最晚的推送时间（没有推送记录时使用更新时间）"""
+        pushed = [record.pushed_at or record.updated_at for record in self.repos.values()]
+        pushed = [value for value in pushed if value is not None]
+        return max(pushed) if pushed else None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.repos
+
+    def __len__(self) -> int:
+        return len(self.repos)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.repos)
+
+    def __getitem__(self, name: str) -> RepoRecord:
+        return self.repos[name]
+
+    def to_state(self) -> Dict:
+        return {name: record.to_state(self.owner) for name, record in self.repos.items()}
+
+    @classmethod
+    def from_state(cls, owner: str, state: Dict) -> 'UserSnapshot':
+        return cls(owner, (RepoRecord.from_state(owner, name, repo) for name, repo in (state or {}).items()))
+
+
+class SnapshotDiff:
+    """两个快照之间的差异"""
+
+    __slots__ = ('created', 'updated', 'deleted', 'renamed')
+
+    def __init__(self):
+        self.created: List[RepoRecord] = []
+        self.updated: List[RepoRecord] = []
+        self.deleted: List[RepoRecord] = []
+        self.renamed: List[Tuple[RepoRecord, RepoRecord]] = []  # (旧记录, 新记录)
+
+    def __bool__(self):
+        return bool(self.created or self.updated or self.deleted or self.renamed)
+
+
+class SnapshotDiffer:
+    """逐个仓库流式对比：仓库列表每到一页就与旧快照对比，不必等整个新快照建立
+
+    同名仓库的更新当场判断；旧快照中没有的仓库先暂存，等最后一页到达后（finish）
+    再按仓库 id 与消失的仓库配对识别改名，其余作为新建，剩下消失的仓库作为删除。
+    """
+
+    __slots__ = ('old', 'diff', 'seen', 'unmatched')
+
+    def __init__(self, old: UserSnapshot):
+        self.old = old
+        self.diff = SnapshotDiff()
+        self.seen = set()
+        self.unmatched: List[RepoRecord] = []  # 旧快照中没有同名仓库的新记录
+
+    def add(self, record: RepoRecord):
+        self.seen.add(record.name)
+        previous = self.old.repos.get(record.name)
+        if previous is None:
+            self.unmatched.append(record)
+        elif is_updated(previous, record):
+            self.diff.updated.append(record)
+
+    def finish(self) -> SnapshotDiff:
+        """所有页都已加入，处理改名、新建和删除"""
+        diff = self.diff
+        missing = {name: record for name, record in self.old.repos.items() if name not in self.seen}
+        missing_ids = {record.id: record for record in missing.values() if record.id is not None}
+        for record in self.unmatched:
+            previous = missing_ids.pop(record.id, None) if record.id is not None else None
+            if previous is None:
+                diff.created.append(record)
+                continue
+            del missing[previous.name]
+            diff.renamed.append((previous, record))
+            if is_updated(previous, record):
+                diff.updated.append(record)
+        diff.deleted.extend(missing.values())
+        return diff
+
+
+def diff_snapshots(old: UserSnapshot, new: UserSnapshot) -> SnapshotDiff:
+    """对比新旧快照，返回新建、更新、删除和改名的仓库
+
+    改名通过仓库 id 识别：旧快照中消失的仓库与新快照中新出现的仓库 id 相同即视为改名，
+    改名后的仓库同时按更新规则判断是否有新提交。旧状态没有 id 时只能识别为删除 + 新建。
+    """
+    differ = SnapshotDiffer(old)
+    for record in new.repos.values():
+        differ.add(record)
+    return differ.finish()
+
+
+_PENDING = object()
+
+
+class LazySnapshots(dict):
+    """用户名 -> UserSnapshot 的字典，某个用户的仓库状态在第一次访问时才读取和转换
+
+    loader(username) 返回该用户保存的仓库状态字典。用户名在创建时就已登记，
+    因此 in / len 不会触发读取；get、[]、pop、items、values 会读取被访问的用户。
+    """
+
+    def __init__(self, usernames, loader):
+        super().__init__((username, _PENDING) for username in usernames)
+        self.loader = loader
+
+    def _resolve(self, username: str, value):
+        if value is _PENDING:
+            value = UserSnapshot.from_state(username, self.loader(username))
+            dict.__setitem__(self, username, value)
+        return value
+
+    def __getitem__(self, username: str) -> UserSnapshot:
+        return self._resolve(username, dict.__getitem__(self, username))
+
+    def get(self, username: str, default=None):
+        value = dict.get(self, username, default)
+        return default if value is default else self._resolve(username, value)
+
+    def pop(self, username: str, *default):
+        value = dict.pop(self, username, *default)
+        return value if value is not _PENDING else UserSnapshot.from_state(username, self.loader(username))
+
+    def items(self):
+        return [(username, self[username]) for username in list(dict.keys(self))]
+
+    def values(self):
+        return [self[username] for username in list(dict.keys(self))]
+
+    def loaded(self) -> Dict[str, UserSnapshot]:
+        """已经读取过的用户（未访问的用户状态没有变化，保存时可以跳过）"""
+        return {username: value for username, value in dict.items(self) if value is not _PENDING}
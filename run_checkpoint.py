@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+import time
+from typing import List
+
+
+class RunCheckpoint:
+    """单次运行（run_once）的进度文件
+
+    记录本次运行已经检查完的用户，运行被中断（超过时限、收到 SIGTERM 或进程被杀）后，
+    下次运行跳过这些用户继续检查剩余的用户；全部检查完成后删除文件。
+    超过 max_age 秒的进度视为过期，重新检查所有用户。
+    """
+
+    def __init__(self, path: str = 'run_checkpoint.json', max_age: float = 86400):
+        self.path = path
+        self.max_age = max_age
+        self.started_at = time.time()
+        self.done = set()
+        self.lock = threading.Lock()
+
+    def resume(self, usernames: List[str]) -> List[str]:
+        """读取上次未完成的进度，返回本次需要检查的用户（保持原有顺序）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = None
+        if saved and time.time() - saved.get('started_at', 0) <= self.max_age:
+            self.started_at = saved['started_at']
+            self.done = set(saved.get('done', [])) & set(usernames)
+        return [username for username in usernames if username not in self.done]
+
+    def mark_done(self, username: str):
+        """记录一个用户已检查完成（每个用户写入一次，原子替换文件）"""
+        with self.lock:
+            self.done.add(username)
+            data = {'started_at': self.started_at, 'done': sorted(self.done)}
+            tmp_file = f'{self.path}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.path)
+
+    def is_done(self, username: str) -> bool:
+        return username in self.done
+
+    def clear(self):
+        """所有用户检查完成，下次运行重新开始"""
+        with self.lock:
+            self.done.clear()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
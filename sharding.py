@@ -0,0 +1,315 @@
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from github_monitor import Colors, GitHubMonitor
+
+
+class HashRing:
+    """一致性哈希环：节点增减时只有相邻区间的用户需要迁移"""
+
+    def __init__(self, nodes=(), replicas: int = 64):
+        self.replicas = replicas  # 每个节点在环上的虚拟节点数，越多分布越均匀
+        self.nodes = []
+        self.keys = []
+        self.owners = []
+        self.rebuild(nodes)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def rebuild(self, nodes):
+        self.nodes = sorted(set(nodes))
+        points = sorted((self._hash(f'{node}#{i}'), node) for node in self.nodes for i in range(self.replicas))
+        self.keys = [key for key, _ in points]
+        self.owners = [node for _, node in points]
+
+    def owner(self, key: str):
+        """返回负责该键的节点，环为空时返回 None"""
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self._hash(key)) % len(self.keys)
+        return self.owners[index]
+
+
+class LeaseTable:
+    """保存在 SQLite 中的工作进程租约，超过 ttl 未续约的进程视为已离开
+
+    user_claims 表记录每个用户当前由哪个进程持有：用户只有在原持有者保存状态并释放、
+    或原持有者租约过期后才能被其他进程认领，避免两个进程同时检查同一用户或读到未保存的状态。
+    """
+
+    def __init__(self, db_file: str = 'shard_leases.db', ttl: float = 30):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS leases ('
+                          'worker TEXT PRIMARY KEY, pid INTEGER, host TEXT, expires_at REAL NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS user_claims (username TEXT PRIMARY KEY, worker TEXT NOT NULL)')
+        self.conn.commit()
+
+    def renew(self, worker: str, pid: int = None):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('INSERT INTO leases (worker, pid, host, expires_at) VALUES (?, ?, ?, ?) '
+                                  'ON CONFLICT (worker) DO UPDATE SET pid = excluded.pid, host = excluded.host, '
+                                  'expires_at = excluded.expires_at',
+                                  (worker, pid or os.getpid(), socket.gethostname(), time.time() + self.ttl))
+
+    def release(self, worker: str):
+        """释放租约和该进程持有的全部用户"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM leases WHERE worker = ?', (worker,))
+                self.conn.execute('DELETE FROM user_claims WHERE worker = ?', (worker,))
+
+    def claim(self, worker: str, usernames: List[str]) -> List[str]:
+        """认领用户，返回认领成功的（未被持有、已由本进程持有或持有者租约已过期）"""
+        claimed = []
+        with self.lock:
+            with self.conn:
+                live = {row[0] for row in self.conn.execute('SELECT worker FROM leases WHERE expires_at > ?',
+                                                            (time.time(),))}
+                for username in usernames:
+                    row = self.conn.execute('SELECT worker FROM user_claims WHERE username = ?',
+                                            (username,)).fetchone()
+                    if row is not None and row[0] != worker and row[0] in live:
+                        continue
+                    self.conn.execute('INSERT INTO user_claims (username, worker) VALUES (?, ?) '
+                                      'ON CONFLICT (username) DO UPDATE SET worker = excluded.worker',
+                                      (username, worker))
+                    claimed.append(username)
+        return claimed
+
+    def release_users(self, worker: str, usernames: List[str]):
+        """释放本进程持有的用户（调用前必须已经保存这些用户的状态）"""
+        with self.lock:
+            with self.conn:
+                self.conn.executemany('DELETE FROM user_claims WHERE username = ? AND worker = ?',
+                                      [(username, worker) for username in usernames])
+
+    def release_except(self, worker: str, usernames: List[str]):
+        """释放本进程上次运行遗留的、现在不再分配给它的用户"""
+        keep = set(usernames)
+        with self.lock:
+            with self.conn:
+                held = [row[0] for row in self.conn.execute('SELECT username FROM user_claims WHERE worker = ?',
+                                                            (worker,))]
+                self.conn.executemany('DELETE FROM user_claims WHERE username = ? AND worker = ?',
+                                      [(username, worker) for username in held if username not in keep])
+
+    def live_workers(self) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute('SELECT worker FROM leases WHERE expires_at > ? ORDER BY worker',
+                                     (time.time(),)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ShardMember:
+    """工作进程在分片中的成员身份：定期续约，并根据存活的进程计算自己负责的用户"""
+
+    def __init__(self, worker_id: str, lease_file: str = 'shard_leases.db', ttl: float = 30, replicas: int = 64):
+        self.worker_id = worker_id
+        self.leases = LeaseTable(lease_file, ttl)
+        self.heartbeat_interval = ttl / 3  # 错过两次续约仍不会过期
+        self.ring = HashRing(replicas=replicas)
+        self.lock = threading.Lock()  # 心跳线程重建哈希环时，检查线程可能正在查询归属
+
+    def heartbeat(self) -> bool:
+        """续约并刷新成员列表，成员变化（需要重新分配用户）时返回 True"""
+        self.leases.renew(self.worker_id)
+        members = self.leases.live_workers()
+        if self.worker_id not in members:
+            members.append(self.worker_id)
+        with self.lock:
+            if sorted(members) == self.ring.nodes:
+                return False
+            self.ring.rebuild(members)
+        return True
+
+    def owns(self, username: str) -> bool:
+        with self.lock:
+            return self.ring.owner(username) == self.worker_id
+
+    def members(self) -> List[str]:
+        with self.lock:
+            return list(self.ring.nodes)
+
+    def claim(self, usernames: List[str]) -> List[str]:
+        return self.leases.claim(self.worker_id, usernames)
+
+    def release_users(self, usernames: List[str]):
+        self.leases.release_users(self.worker_id, usernames)
+
+    def release_except(self, usernames: List[str]):
+        self.leases.release_except(self.worker_id, usernames)
+
+    def owned(self, usernames: List[str]) -> List[str]:
+        return [username for username in usernames if self.owns(username)]
+
+    def leave(self):
+        """主动释放租约，其他进程在下次续约时接管这里的用户"""
+        try:
+            self.leases.release(self.worker_id)
+        finally:
+            self.leases.close()
+
+
+def run_worker(worker_id: str, tokens, email_config: Dict, engine: str, options: Dict, usernames: List[str],
+               check_interval: int, watch_list: str, watch_interval: float, lease_file: str, lease_ttl: float):
+    """工作进程入口：只检查一致性哈希分配给自己的用户，通知写入共享的 SQLite 发送队列"""
+    shard = ShardMember(worker_id, lease_file, lease_ttl)
+    options = dict(options, shard=shard)
+    if engine == 'asyncio':
+        from async_monitor import AsyncGitHubMonitor
+        monitor = AsyncGitHubMonitor(tokens, email_config, **options)
+    else:
+        monitor = GitHubMonitor(tokens, email_config, **options)
+    monitor.monitor_users(usernames, check_interval=check_interval, watch_list=watch_list,
+                          watch_interval=watch_interval)
+
+
+class ShardCoordinator:
+    """分片模式的协调进程
+
+    启动 workers 个工作进程，按一致性哈希把用户分给各进程，每个进程使用自己的 token
+    （token 按进程轮流分配）。所有进程共享 SQLite 状态库和通知队列，
+    通知由协调进程统一发送（SMTP 长连接和汇总模式照常生效）。
+    工作进程退出后租约过期，其余进程接管它的用户；协调进程随后重启该进程，用户再迁回。
+    """
+
+    def __init__(self, tokens, email_config: Dict, workers: int, engine: str = 'threads', options: Dict = None,
+                 lease_file: str = 'shard_leases.db', lease_ttl: float = 30, restart_delay: float = 10):
+        if workers < 1:
+            raise ValueError("分片模式至少需要 1 个工作进程")
+        if isinstance(tokens, str) or tokens is None:
+            tokens = [tokens] if tokens else []
+        self.tokens = list(tokens)
+        self.email_config = email_config
+        self.workers = workers
+        self.engine = engine
+        self.options = dict(options or {})
+        self.lease_file = lease_file
+        self.lease_ttl = lease_ttl
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context('spawn')  # 子进程不继承协调进程的线程和数据库连接
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        self.restart_at: Dict[str, float] = {}
+        self.stop_event = threading.Event()
+        self.monitor = None
+
+    def worker_ids(self) -> List[str]:
+        return [f'shard-{index}' for index in range(self.workers)]
+
+    def worker_tokens(self, index: int) -> List[str]:
+        """第 index 个进程使用的 token：token 多于进程时平均分配，少于进程时轮流共用"""
+        if not self.tokens:
+            return []
+        if len(self.tokens) >= self.workers:
+            return self.tokens[index::self.workers]
+        return [self.tokens[index % len(self.tokens)]]
+
+    def worker_options(self, index: int) -> Dict:
+        options = dict(self.options, state_backend='sqlite', webhook_port=0)
+        if options.get('metrics_port'):
+            options['metrics_port'] += index + 1
+        if options.get('metrics_file'):
+            base, extension = os.path.splitext(options['metrics_file'])
+            options['metrics_file'] = f'{base}.shard-{index}{extension}'
+        return options
+
+    def _start(self, index: int, worker_id: str):
+        process = self.context.Process(
+            target=run_worker, name=worker_id,
+            args=(worker_id, self.worker_tokens(index), self.email_config, self.engine, self.worker_options(index),
+                  self.usernames, self.check_interval, self.watch_list, self.watch_interval,
+                  self.lease_file, self.lease_ttl))
+        process.start()
+        self.processes[worker_id] = process
+
+    def run(self, usernames: List[str] = None, check_interval: int = 1800, watch_list: str = None,
+            watch_interval: float = 30):
+        self.usernames = list(usernames or [])
+        self.check_interval = check_interval
+        self.watch_list = watch_list
+        self.watch_interval = watch_interval
+
+        # 协调进程只负责发送通知：不使用 token，也不检查任何用户；首次运行时在这里完成状态迁移
+        delivery_options = {key: self.options[key] for key in ('digest_window', 'metrics_port', 'metrics_file')
+                            if key in self.options}
+        self.monitor = GitHubMonitor(None, self.email_config, state_backend='sqlite', **delivery_options)
+        self.monitor.known_repos = {}
+        self.monitor.notification_queue.poll_interval = 1  # 及时发现其他进程写入的通知
+
+        # 先为所有进程登记租约，避免先启动的进程暂时接管全部用户
+        leases = LeaseTable(self.lease_file, self.lease_ttl)
+        for worker_id in self.worker_ids():
+            leases.renew(worker_id)
+        leases.close()
+
+        for index, worker_id in enumerate(self.worker_ids()):
+            self._start(index, worker_id)
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}分片模式已启动: "
+              f"{Colors.YELLOW}{self.workers}{Colors.ENDC} {Colors.BLUE}个工作进程 "
+              f"({', '.join(self.worker_ids())}){Colors.ENDC}")
+
+        self.monitor.start_metrics()
+        threading.Thread(target=self.monitor.notification_sender, daemon=True).start()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda signum, frame: self.stop_event.set())
+        try:
+            while not self.stop_event.wait(1):
+                self._supervise()
+        finally:
+            self.shutdown()
+
+    def _supervise(self):
+        """重启意外退出的工作进程"""
+        now = time.time()
+        for index, worker_id in enumerate(self.worker_ids()):
+            process = self.processes.get(worker_id)
+            if process is not None and process.is_alive():
+                continue
+            if worker_id not in self.restart_at:
+                exitcode = process.exitcode if process is not None else None
+                print(f"{Colors.RED}工作进程 {worker_id} 已退出 (exitcode={exitcode})，"
+                      f"{self.restart_delay:.0f} 秒后重启，期间由其他进程接管其用户{Colors.ENDC}")
+                self.restart_at[worker_id] = now + self.restart_delay
+            elif now >= self.restart_at[worker_id]:
+                del self.restart_at[worker_id]
+                self._start(index, worker_id)
+                print(f"{Colors.BLUE}工作进程 {worker_id} 已重启{Colors.ENDC}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def shutdown(self):
+        """通知所有工作进程保存状态并退出，然后关闭发送通道"""
+        self.stop_event.set()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM：工作进程保存状态并释放租约
+        for process in self.processes.values():
+            process.join(timeout=60)
+        if self.monitor is not None:
+            self.monitor.smtp.close()
+            self.monitor.metrics.shutdown()
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{Colors.GREEN}{current_time}{Colors.ENDC}] {Colors.BLUE}所有工作进程已停止{Colors.ENDC}")
@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class SMTPConnection:
+    """复用已登录的 SMTP 长连接：断开时自动重连，空闲超时后主动关闭
+
+    email_config 中的 smtp_security 可选 'starttls' / 'ssl' / 'none'，
+    未设置时按端口判断：587 使用 STARTTLS，其余使用 SSL。
+    """
+
+    def __init__(self, email_config, idle_timeout: float = 60):
+        self.email_config = email_config
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+
+    def _security(self) -> str:
+        security = self.email_config.get('smtp_security')
+        if security:
+            return security
+        return 'starttls' if self.email_config['smtp_port'] == 587 else 'ssl'
+
+    def _connect(self):
+        import smtplib
+        host = self.email_config['smtp_server']
+        port = self.email_config['smtp_port']
+        security = self._security()
+        if security == 'ssl':
+            server = smtplib.SMTP_SSL(host, port, timeout=30)
+        else:
+            server = smtplib.SMTP(host, port, timeout=30)
+            if security == 'starttls':
+                server.starttls()  # 升级到 TLS 连接
+        if self.email_config.get('password'):
+            server.login(self.email_config['sender'], self.email_config['password'])
+        self.server = server
+
+    def _close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+        self.server = None
+
+    def send(self, msg):
+        """发送邮件，连接已断开时重连后重试一次"""
+        import smtplib  # 延迟到第一次发送时才导入，不发通知的运行不需要加载
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > self.idle_timeout:
+                self._close()
+            for attempt in range(2):
+                if self.server is None:
+                    self._connect()
+                try:
+                    self.server.send_message(msg)
+                    self.last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def close_if_idle(self):
+        """连接空闲超过 idle_timeout 时关闭"""
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > self.idle_timeout:
+                self._close()
+
+    def close(self):
+        with self.lock:
+            self._close()
@@ -0,0 +1,79 @@
+import socketserver
+import threading
+import time
+from typing import List
+
+
+class SMTPSink:
+    """本地 SMTP 接收端，只统计收到的邮件，不做任何投递
+
+    支持 EHLO/HELO、MAIL、RCPT、DATA、RSET、NOOP、QUIT，足够 smtplib 以
+    smtp_security='none' 且不登录的方式发送邮件。可选的 latency 模拟慢速邮件服务器。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # 每封邮件 DATA 结束后的模拟延迟（秒）
+        self.lock = threading.Lock()
+        self.received: List[float] = []  # 每封邮件的接收时间
+        self.connections = 0
+        self.server = None
+
+    def stats(self):
+        with self.lock:
+            received = list(self.received)
+            connections = self.connections
+        return {
+            'emails': len(received),
+            'smtp_connections': connections,
+            'first_email_at': received[0] if received else None,
+            'last_email_at': received[-1] if received else None,
+        }
+
+    def _record(self):
+        with self.lock:
+            self.received.append(time.time())
+
+    def serve(self, port: int = 0, host: str = '127.0.0.1'):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write((line + '\r\n').encode('ascii'))
+
+            def handle(self):
+                with sink.lock:
+                    sink.connections += 1
+                self.reply('220 bench-sink ESMTP')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode('utf-8', 'replace').strip().upper()
+                    if command.startswith('EHLO'):
+                        self.reply('250-bench-sink')
+                        self.reply('250 8BITMIME')
+                    elif command.startswith(('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP')):
+                        self.reply('250 OK')
+                    elif command == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while True:
+                            data = self.rfile.readline()
+                            if not data or data in (b'.\r\n', b'.\n'):
+                                break
+                        if sink.latency:
+                            time.sleep(sink.latency)
+                        sink._record()
+                        self.reply('250 OK queued')
+                    elif command == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
@@ -0,0 +1,256 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+
+# 除仓库状态外，按用户名保存的状态字段（与 monitor_state.json 中的键一致）
+STATE_SECTIONS = ('last_check', 'inaccessible_repos', 'schedule')
+
+
+def empty_state() -> Dict:
+    state = {'repos': {}}
+    for section in STATE_SECTIONS:
+        state[section] = {}
+    return state
+
+
+class JSONStateStore:
+    """整文件保存到 monitor_state.json，先写临时文件再原子替换，避免写到一半损坏
+
+    单个用户的更新只标记为待写入，距上次写入超过 flush_interval 秒或调用 flush 时才重写整个文件，
+    避免每检查一个用户就重写并 fsync 一次；进程崩溃最多丢失这段时间内的状态（重新检测到的提交由去重索引过滤）。
+    """
+
+    def __init__(self, state_file: str = 'monitor_state.json', flush_interval: float = 5):
+        self.state_file = state_file
+        self.flush_interval = flush_interval
+        self.state = empty_state()
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_write = 0.0
+
+    def load(self, usernames=None, repos: bool = True) -> Dict:
+        """读取状态；repos=False 时不返回仓库状态（之后用 load_repos 按用户读取）"""
+        with self.lock:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                for key in self.state:
+                    self.state[key] = loaded.get(key, {})
+            keys = [key for key in self.state if repos or key != 'repos']
+            result = empty_state()
+            for key in keys:
+                value = self.state[key]
+                result[key] = dict(value) if usernames is None else {u: value[u] for u in usernames if u in value}
+            return result
+
+    def repo_users(self):
+        """保存了仓库状态的用户（需要先调用 load）"""
+        with self.lock:
+            return list(self.state['repos'])
+
+    def load_repos(self, username: str) -> Dict:
+        """单个用户的仓库状态（整个文件在 load 时已经读入）"""
+        with self.lock:
+            return self.state['repos'].get(username, {})
+
+    def save_user(self, username: str, repos: Dict, sections: Dict):
+        """更新单个用户的状态，距上次写入超过 flush_interval 秒时写回文件
+
+        sections 中的值（如 inaccessible_repos[username]）会被监控继续原地修改，
+        合并写入前先通过 JSON 复制一份，写入的是调用时的内容。
+        """
+        sections = json.loads(json.dumps(sections))
+        with self.lock:
+            self.state['repos'][username] = repos
+            for section, value in sections.items():
+                self.state[section][username] = value
+            self.dirty = True
+            if time.monotonic() - self.last_write >= self.flush_interval:
+                self._write()
+
+    def flush(self):
+        """写入尚未保存的用户更新（每轮检查结束时调用）"""
+        with self.lock:
+            if self.dirty:
+                self._write()
+
+    def save_all(self, state: Dict, partial_repos: bool = False):
+        """整体保存；partial_repos=True 时 state 中没有的用户保留文件中原有的仓库状态"""
+        with self.lock:
+            for key in self.state:
+                if key == 'repos' and partial_repos:
+                    self.state[key] = dict(self.state[key], **state.get(key, {}))
+                else:
+                    self.state[key] = dict(state.get(key, {}))
+            self._write()
+
+    def _write(self):
+        data = dict(self.state)
+        data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+        self.dirty = False
+        self.last_write = time.monotonic()
+
+    def forget(self, usernames):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class SQLiteStateStore:
+    """SQLite（WAL 模式）状态存储，每个用户/仓库一行，只写入发生变化的行
+
+    首次使用时如果数据库为空且存在旧的 monitor_state.json，会自动导入一次，
+    导入后旧文件重命名为 monitor_state.json.migrated。
+    """
+
+    def __init__(self, db_file: str = 'monitor_state.db', migrate_from: str = 'monitor_state.json'):
+        self.db_file = db_file
+        self.migrate_from = migrate_from
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS repos ('
+                          'username TEXT NOT NULL, repo TEXT NOT NULL, data TEXT NOT NULL, '
+                          'PRIMARY KEY (username, repo))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS user_state ('
+                          'username TEXT NOT NULL, section TEXT NOT NULL, data TEXT NOT NULL, '
+                          'PRIMARY KEY (username, section))')
+        self.conn.commit()
+        # 已写入的行内容，用于跳过未变化的行
+        self.written_repos = {}
+        self.written_sections = {}
+
+    def load(self, usernames=None, repos: bool = True) -> Dict:
+        """读取全部状态；指定 usernames 时只读取这些用户（分片模式接管用户时使用），
+        repos=False 时不读取仓库表（之后用 load_repos 按用户读取）
+        """
+        self._migrate()
+        state = empty_state()
+        repo_query = 'SELECT username, repo, data FROM repos'
+        section_query = 'SELECT username, section, data FROM user_state'
+        params = ()
+        if usernames is not None:
+            usernames = list(usernames)
+            if not usernames:
+                return state
+            condition = f" WHERE username IN ({', '.join('?' * len(usernames))})"
+            repo_query += condition
+            section_query += condition
+            params = usernames
+        with self.lock:
+            if repos:
+                for username, repo, data in self.conn.execute(repo_query, params):
+                    state['repos'].setdefault(username, {})[repo] = json.loads(data)
+                    self.written_repos.setdefault(username, {})[repo] = data
+            for username, section, data in self.conn.execute(section_query, params):
+                if section in state:
+                    state[section][username] = json.loads(data)
+                self.written_sections[(username, section)] = data
+        return state
+
+    def repo_users(self):
+        """保存了仓库状态的用户"""
+        self._migrate()
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT DISTINCT username FROM repos')]
+
+    def load_repos(self, username: str) -> Dict:
+        """只读取单个用户的仓库状态"""
+        repos = {}
+        with self.lock:
+            written = self.written_repos.setdefault(username, {})
+            for repo, data in self.conn.execute('SELECT repo, data FROM repos WHERE username = ?', (username,)):
+                repos[repo] = json.loads(data)
+                written[repo] = data
+        return repos
+
+    def forget(self, usernames):
+        """丢弃这些用户已写入内容的缓存（用户交给其他进程后，下次接管时重新读取）"""
+        with self.lock:
+            for username in usernames:
+                self.written_repos.pop(username, None)
+                for section in STATE_SECTIONS:
+                    self.written_sections.pop((username, section), None)
+
+    def _migrate(self):
+        """从旧的 JSON 状态文件一次性导入"""
+        if not self.migrate_from or not os.path.exists(self.migrate_from):
+            return
+        with self.lock:
+            has_rows = self.conn.execute('SELECT 1 FROM repos LIMIT 1').fetchone()
+        if has_rows:
+            return
+        with open(self.migrate_from, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        self.save_all(legacy)
+        os.replace(self.migrate_from, f'{self.migrate_from}.migrated')
+
+    def save_user(self, username: str, repos: Dict, sections: Dict):
+        with self.lock:
+            with self.conn:
+                self._upsert_user(username, repos, sections)
+
+    def save_all(self, state: Dict, partial_repos: bool = False):
+        # 逐用户增量写入，state 中没有的用户本来就保持不变
+        repos = state.get('repos', {})
+        usernames = set(repos)
+        for section in STATE_SECTIONS:
+            usernames.update(state.get(section, {}))
+        with self.lock:
+            with self.conn:
+                for username in usernames:
+                    sections = {section: state[section][username] for section in STATE_SECTIONS
+                                if username in state.get(section, {})}
+                    self._upsert_user(username, repos.get(username), sections)
+
+    def _upsert_user(self, username: str, repos: Dict, sections: Dict):
+        if repos is not None:
+            written = self.written_repos.setdefault(username, {})
+            for repo, repo_state in repos.items():
+                data = json.dumps(repo_state, ensure_ascii=False, sort_keys=True)
+                if written.get(repo) == data:
+                    continue
+                self.conn.execute('INSERT INTO repos (username, repo, data) VALUES (?, ?, ?) '
+                                  'ON CONFLICT (username, repo) DO UPDATE SET data = excluded.data',
+                                  (username, repo, data))
+                written[repo] = data
+            for repo in [r for r in written if r not in repos]:
+                self.conn.execute('DELETE FROM repos WHERE username = ? AND repo = ?', (username, repo))
+                del written[repo]
+
+        for section, value in sections.items():
+            data = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            if self.written_sections.get((username, section)) == data:
+                continue
+            self.conn.execute('INSERT INTO user_state (username, section, data) VALUES (?, ?, ?) '
+                              'ON CONFLICT (username, section) DO UPDATE SET data = excluded.data',
+                              (username, section, data))
+            self.written_sections[(username, section)] = data
+
+    def flush(self):
+        pass  # 每次保存都已提交
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_state_store(backend: str = 'json'):
+    """按名称创建状态存储后端: 'json' 或 'sqlite'"""
+    if backend == 'sqlite':
+        return SQLiteStateStore()
+    if backend == 'json':
+        return JSONStateStore()
+    raise ValueError(f"未知的状态存储后端: {backend}")
@@ -0,0 +1,51 @@
+import pytest
+
+import dedup_index
+from dedup_index import DedupIndex
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_index.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def index(tmp_path, clock):
+    idx = DedupIndex(str(tmp_path / 'index.db'), ttl=100, prune_interval=0)
+    yield idx
+    idx.close()
+
+
+def test_same_commit_is_claimed_once(index):
+    assert index.claim('alice', [('repo', 'a1'), ('repo', 'b2')]) == {('repo', 'a1'), ('repo', 'b2')}
+    assert index.claim('alice', [('repo', 'a1'), ('repo', 'c3')]) == {('repo', 'c3')}
+
+
+def test_keys_are_scoped_per_user(index):
+    index.claim('alice', [('repo', 'a1')])
+    assert index.claim('bob', [('repo', 'a1')]) == {('repo', 'a1')}
+
+
+def test_commit_can_be_notified_again_after_ttl(index, clock):
+    index.claim('alice', [('repo', 'a1')])
+    clock.now += 99
+    assert index.claim('alice', [('repo', 'a1')]) == set()
+    clock.now += 1
+    assert index.claim('alice', [('repo', 'a1')]) == {('repo', 'a1')}
+
+
+def test_expired_entries_are_pruned(index, clock):
+    index.claim('alice', [('repo', 'a1'), ('repo', 'b2')])
+    clock.now += 150
+    index.claim('alice', [('repo', 'c3')])
+    assert len(index) == 1
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from durable_queue import DurableQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = DurableQueue(str(tmp_path / 'queue.db'), max_attempts=3, base_delay=10, max_delay=15)
+    yield q
+    q.close()
+
+
+def next_attempt(queue: DurableQueue, row_id: int) -> float:
+    return queue.conn.execute('SELECT next_attempt FROM outbox WHERE id = ?', (row_id,)).fetchone()[0]
+
+
+def test_ack_removes_delivered_items(queue):
+    queue.put({'subject': 'a'})
+    queue.put({'subject': 'b'})
+    batch = queue.get_batch(timeout=0)
+    assert [item['subject'] for _, item in batch] == ['a', 'b']
+    queue.ack([row_id for row_id, _ in batch])
+    assert queue.qsize() == 0
+
+
+def test_leased_items_are_not_handed_out_twice(queue):
+    queue.put({'subject': 'a'})
+    assert len(queue.get_batch(timeout=0)) == 1
+    assert queue.get_batch(timeout=0) == []
+
+
+def test_fail_backs_off_exponentially_up_to_max_delay(queue):
+    queue.put({'subject': 'a'})
+    [(row_id, _)] = queue.get_batch(timeout=0)
+
+    before = time.time()
+    queue.fail([row_id], 'smtp down')
+    assert before + 10 <= next_attempt(queue, row_id) <= time.time() + 10
+    assert queue.get_batch(timeout=0) == []  # 退避期间不会再取出
+
+    queue.fail([row_id], 'smtp down')
+    assert next_attempt(queue, row_id) <= time.time() + 15  # 20 秒被限制为 max_delay
+
+
+def test_fail_moves_item_to_dead_letter_after_max_attempts(queue):
+    queue.put({'subject': 'a'})
+    [(row_id, _)] = queue.get_batch(timeout=0)
+    for _ in range(3):
+        queue.fail([row_id], 'smtp down')
+    assert queue.qsize() == 0
+    assert queue.dead_letter_count() == 1
+    attempts, error = queue.conn.execute('SELECT attempts, last_error FROM dead_letter').fetchone()
+    assert (attempts, error) == (3, 'smtp down')
+
+    assert queue.replay_dead_letters() == 1
+    assert queue.dead_letter_count() == 0
+    assert [item for _, item in queue.get_batch(timeout=0)] == [{'subject': 'a'}]
+
+
+def test_fail_can_update_payloads(queue):
+    queue.put({'subject': 'a'})
+    [(row_id, item)] = queue.get_batch(timeout=0)
+    item['delivered_to'] = ['b@example.com']
+    queue.fail([row_id], 'partial', payloads={row_id: item})
+    queue.conn.execute('UPDATE outbox SET next_attempt = 0')
+    assert queue.get_batch(timeout=0) == [(row_id, {'subject': 'a', 'delivered_to': ['b@example.com']})]
+
+
+def test_unacked_items_are_recovered_on_restart(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    first = DurableQueue(path)
+    first.put({'subject': 'a'})
+    assert len(first.get_batch(timeout=0)) == 1
+    first.close()
+
+    second = DurableQueue(path)
+    try:
+        assert [item for _, item in second.get_batch(timeout=0)] == [{'subject': 'a'}]
+    finally:
+        second.close()
@@ -0,0 +1,364 @@
+import socket
+import time
+
+import pytest
+
+import async_monitor
+from async_monitor import AsyncGitHubMonitor
+from fake_github import FakeGitHub
+from github_monitor import EXIT_CHECK_FAILED, EXIT_DEADLINE, EXIT_OK, EXIT_UNDELIVERED, GitHubMonitor, RequestCancelled
+from http_cache import HTTPCache
+from repo_snapshot import RepoRecord, UserSnapshot, format_time, parse_time
+from smtp_sink import SMTPSink
+
+EMAIL = {'smtp_server': '127.0.0.1', 'smtp_port': 1, 'smtp_security': 'none',
+         'sender': 'monitor@example.com', 'password': '', 'receiver': 'me@example.com'}
+
+ENGINES = [
+    pytest.param(GitHubMonitor, id='threads'),
+    pytest.param(AsyncGitHubMonitor, id='async',
+                 marks=pytest.mark.skipif(async_monitor.aiohttp is None, reason='需要 aiohttp')),
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # 状态、队列和缓存文件都写在当前目录
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def serve_github():
+    """启动本地模拟的 GitHub API，返回 (FakeGitHub, api_base)"""
+    servers = []
+
+    def serve(**options):
+        fake = FakeGitHub(**dict({'users': 2, 'repos': 3}, **options))
+        server = fake.serve()
+        servers.append(server)
+        return fake, f'http://127.0.0.1:{server.server_port}'
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def github(serve_github):
+    return serve_github()
+
+
+@pytest.fixture
+def smtp():
+    """启动本地 SMTP 接收端，返回 (SMTPSink, 指向它的邮件配置)"""
+    sink = SMTPSink()
+    server = sink.serve()
+    yield sink, dict(EMAIL, smtp_port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def push(fake, username, repo, message='change', when=None):
+    """在模拟的仓库上推送一个提交；指定更早的 when 时相当于强制推送，只留下这个提交"""
+    with fake.lock:
+        entry = fake.users[username][repo]
+        entry['pushed_at'] = entry['updated_at'] = fake._tick()
+        if when is not None:
+            entry['commits'].clear()
+        entry['commits'].insert(0, fake._commit(repo, when or entry['pushed_at'], message))
+
+
+def create_repo(fake, username, repo):
+    with fake.lock:
+        fake._create_repo(username, repo, len(fake.users[username]) + 900)
+
+
+def queued(monitor):
+    """取出通知队列中的全部通知，按标题排序"""
+    return sorted((item for _, item in monitor.notification_queue.get_batch(timeout=0)),
+                  key=lambda item: item['subject'])
+
+
+def subjects(monitor):
+    return [item['subject'] for item in queued(monitor)]
+
+
+def record(name, sha, when):
+    return RepoRecord(1, name, parse_time('2024-01-01T00:00:00Z'), parse_time(when), parse_time(when),
+                      parse_time(when), head_sha=sha)
+
+
+def test_failed_state_save_does_not_consume_dedup_claim(workdir):
+    monitor = GitHubMonitor('', EMAIL, dedup_ttl=3600)
+    monitor.known_repos['alice'] = UserSnapshot('alice', [record('repo', 'aa' * 20, '2024-01-01T00:00:00Z')])
+    changed = UserSnapshot('alice', [record('repo', 'bb' * 20, '2024-02-01T00:00:00Z')])
+
+    save_user = monitor.state_store.save_user
+    calls = []
+
+    def failing_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError('disk full')
+        return save_user(*args)
+
+    monitor.state_store.save_user = failing_once
+    with pytest.raises(RuntimeError):
+        monitor._commit_user_state('alice', changed)
+    assert monitor.known_repos['alice']['repo'].sha == 'aa' * 20  # 快照已回滚
+
+    # 重试时同一个变化仍然会通知，并且入队后才算已通知
+    notifications = monitor._commit_user_state('alice', changed)
+    assert [subject for subject, _ in notifications] == ['GitHub更新通知: alice/repo']
+    monitor._dispatch_notifications('alice', notifications)
+    assert monitor.notification_queue.qsize() == 1
+    assert monitor._commit_user_state('alice', changed) == []
+
+
+def test_failed_enqueue_releases_dedup_claim(workdir):
+    monitor = GitHubMonitor('', EMAIL, dedup_ttl=3600)
+    monitor.known_repos['alice'] = UserSnapshot('alice', [record('repo', 'aa' * 20, '2024-01-01T00:00:00Z')])
+    changed = UserSnapshot('alice', [record('repo', 'bb' * 20, '2024-02-01T00:00:00Z')])
+    notifications = monitor._commit_user_state('alice', changed)
+
+    def broken_put(item):
+        raise OSError('database is locked')
+
+    monitor.notification_queue.put = broken_put
+    with pytest.raises(OSError):
+        monitor._dispatch_notifications('alice', notifications)
+    assert monitor.dedup.claim('alice', [('repo', 'bb' * 20)]) == {('repo', 'bb' * 20)}
+
+
+def test_stop_cancels_rate_limit_wait(workdir):
+    monitor = GitHubMonitor('', EMAIL)
+    monitor.stop()
+    started = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        monitor._wait_or_cancel(60)
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_cursor_queries_drop_latest_commit_cache_entries(workdir, github, engine):
+    fake, base = github
+    monitor = engine('', EMAIL, api_base=base)
+    trimmed, untrimmed = monitor._first_commit_keys(f'{base}/repos/user0/repo1/commits')
+    monitor._perform_check(['user0'])
+    assert trimmed in monitor.http_cache.entries  # 首次检查只取最新提交
+
+    # 强制推送到更早的提交：since 查询为空，退回未精简的 per_page=1 请求
+    push(fake, 'user0', 'repo1', 'rewritten', when='2023-06-01T00:00:00Z')
+    monitor._perform_check(['user0'])
+    assert trimmed not in monitor.http_cache.entries
+    assert untrimmed in monitor.http_cache.entries
+
+    push(fake, 'user0', 'repo1')
+    monitor._perform_check(['user0'])
+    assert untrimmed not in monitor.http_cache.entries
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_events_cache_keeps_only_etag(workdir, github, engine):
+    _, base = github
+    monitor = engine('', EMAIL, api_base=base, detection_mode='events')
+    monitor._perform_check(['user0'])
+    monitor._perform_check(['user0'])
+    key = HTTPCache.make_key(f'{base}/users/user0/events', trim=monitor._drop_events)
+    assert monitor.http_cache.entries[key]['data'] == []
+    monitor._discard_events_etag('user0')
+    assert key not in monitor.http_cache.entries
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_check_reports_pushes_and_new_repos(workdir, github, engine):
+    fake, base = github
+    monitor = engine('', EMAIL, api_base=base)
+    monitor._perform_check(['user0', 'user1'])
+    assert queued(monitor) == []  # 首次检查只建立基线
+    assert sorted(monitor.known_repos['user0']) == ['repo0', 'repo1', 'repo2']
+
+    push(fake, 'user0', 'repo1', 'first')
+    push(fake, 'user0', 'repo1', 'second')
+    create_repo(fake, 'user1', 'fresh')
+    monitor._perform_check(['user0', 'user1'])
+    notifications = queued(monitor)
+    assert [item['subject'] for item in notifications] == ['GitHub更新通知: user0/repo1',
+                                                           'GitHub通知: user1 创建了新仓库 fresh']
+    assert '新提交 (2):' in notifications[0]['content']
+    assert monitor.known_repos['user0']['repo1'].sha == fake.users['user0']['repo1']['commits'][0]['sha']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_repo_list_and_commits_follow_link_pagination(workdir, serve_github, engine):
+    fake, base = serve_github(users=1, repos=120)
+    monitor = engine('', EMAIL, api_base=base)
+    monitor.max_new_commits = 300
+    monitor._perform_check(['user0'])
+    assert len(monitor.known_repos['user0']) == 120
+
+    for i in range(150):
+        push(fake, 'user0', 'repo7', f'burst {i}')
+    fake.reset_stats()
+    monitor._perform_check(['user0'])
+    [notification] = queued(monitor)
+    assert '新提交 (150):' in notification['content']
+    # 仓库列表两页，repo7 的增量提交两页，其余仓库各一次条件请求
+    assert fake.snapshot_stats()['by_endpoint'] == {'repos': 2, 'commits': 121}
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_unchanged_check_replays_cached_responses(workdir, github, engine):
+    fake, base = github
+    monitor = engine('', EMAIL, api_base=base)
+    monitor._perform_check(['user0', 'user1'])
+    monitor._perform_check(['user0', 'user1'])  # 游标建立后的第一次增量查询
+    before = {username: snapshot.to_state() for username, snapshot in monitor.known_repos.items()}
+
+    fake.reset_stats()
+    monitor._perform_check(['user0', 'user1'])
+    stats = fake.snapshot_stats()
+    assert stats['requests'] == stats['not_modified'] == 8
+    assert {username: snapshot.to_state() for username, snapshot in monitor.known_repos.items()} == before
+    assert queued(monitor) == []
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_events_mode_skips_users_without_activity(workdir, github, engine):
+    fake, base = github
+    monitor = engine('', EMAIL, api_base=base, detection_mode='events')
+    monitor._perform_check(['user0', 'user1'])
+    monitor._perform_check(['user0', 'user1'])  # 记录事件流的 ETag
+
+    fake.reset_stats()
+    monitor._perform_check(['user0', 'user1'])
+    assert fake.snapshot_stats()['by_endpoint'] == {'events': 2}
+
+    push(fake, 'user1', 'repo2')
+    fake.reset_stats()
+    monitor._perform_check(['user0', 'user1'])
+    assert fake.snapshot_stats()['by_endpoint']['events'] == 2
+    assert 'repos' in fake.snapshot_stats()['by_endpoint']
+    assert subjects(monitor) == ['GitHub更新通知: user1/repo2']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_commits_are_fetched_from_the_cursor(workdir, github, engine):
+    fake, base = github
+    monitor = engine('', EMAIL, api_base=base)
+    monitor._perform_check(['user0'])
+    cursor = monitor.known_repos['user0']['repo0'].latest_commit
+    assert cursor is not None
+
+    push(fake, 'user0', 'repo0')
+    monitor._perform_check(['user0'])
+    url = f'{base}/repos/user0/repo0/commits'
+    since = {'since': format_time(cursor), 'per_page': 100}
+    # 游标前进后旧的 since 查询被丢弃，新的游标查询在下一次检查时建立
+    assert HTTPCache.make_key(url, since, monitor._compact_commits) not in monitor.http_cache.entries
+    assert monitor.known_repos['user0']['repo0'].latest_commit > cursor
+    monitor._perform_check(['user0'])
+    since['since'] = format_time(monitor.known_repos['user0']['repo0'].latest_commit)
+    assert HTTPCache.make_key(url, since, monitor._compact_commits) in monitor.http_cache.entries
+
+
+@pytest.mark.skipif(async_monitor.aiohttp is None, reason='需要 aiohttp')
+def test_async_engine_matches_thread_engine(tmp_path, monkeypatch, serve_github):
+    results = []
+    for engine in (GitHubMonitor, AsyncGitHubMonitor):
+        directory = tmp_path / engine.__name__
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        fake, base = serve_github(users=3, repos=40)
+        monitor = engine('', EMAIL, api_base=base)
+        usernames = ['user0', 'user1', 'user2']
+        monitor._perform_check(usernames)
+        fake.churn(7)
+        create_repo(fake, 'user2', 'fresh')
+        monitor._perform_check(usernames)
+        states = {username: snapshot.to_state() for username, snapshot in monitor.known_repos.items()}
+        results.append((queued(monitor), states))
+    assert results[0] == results[1]
+    assert len(results[0][0]) == 8
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_run_once_exit_codes(workdir, serve_github, engine):
+    fake, base = serve_github(latency=0.05)
+
+    def run_once(usernames, **kwargs):
+        monitor = engine('', EMAIL, api_base=base, max_workers=1)
+        return monitor.run_once(usernames, flush_timeout=1, **kwargs)
+
+    assert run_once(['user0', 'user1']) == EXIT_OK
+    push(fake, 'user0', 'repo0')
+    assert run_once(['user0', 'user1']) == EXIT_UNDELIVERED  # SMTP 服务器无法连接
+    assert run_once(['user0', 'user1'], deadline=0.01) == EXIT_DEADLINE
+    # 上次没检查完的用户继续检查；不存在的用户返回 404
+    assert run_once(['user0', 'user1', 'ghost']) == EXIT_CHECK_FAILED
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_revoked_token_fails_over_to_next_token(workdir, serve_github, engine):
+    fake, base = serve_github(revoked_tokens={'revoked-token'})
+    monitor = engine(['revoked-token', 'working-token'], EMAIL, api_base=base, fast_start=True)
+    monitor._perform_check(['user0'])
+    assert fake.snapshot_stats()['unauthorized'] == 1  # 401 后立即换用另一个 token 重试
+    monitor._perform_check(['user0', 'user1'])
+    assert fake.snapshot_stats()['unauthorized'] == 1
+    assert sorted(monitor.known_repos) == ['user0', 'user1']
+    revoked, working = monitor.token_pool.clients
+    assert revoked.disabled_reason == '凭证无效 (401)'
+    assert working.disabled_reason is None
+
+
+def test_smtp_connection_is_reused_and_reconnects(workdir, smtp):
+    sink, email = smtp
+    monitor = GitHubMonitor('', email)
+    assert monitor.send_email('first', 'body')
+    assert monitor.send_email('second', 'body')
+    assert sink.stats()['smtp_connections'] == 1
+
+    # 服务器断开连接后，下一封邮件重连后发送成功
+    monitor.smtp.server.sock.shutdown(socket.SHUT_RDWR)
+    assert monitor.send_email('third', 'body')
+    stats = sink.stats()
+    assert (stats['emails'], stats['smtp_connections']) == (3, 2)
+
+
+def test_idle_smtp_connection_is_closed(workdir, smtp):
+    sink, email = smtp
+    monitor = GitHubMonitor('', email, smtp_idle_timeout=0.05)
+    assert monitor.send_email('first', 'body')
+    time.sleep(0.1)
+    monitor.smtp.close_if_idle()
+    assert monitor.smtp.server is None
+    assert monitor.send_email('second', 'body')
+    assert sink.stats()['smtp_connections'] == 2
+
+
+def test_failed_digest_is_retried_only_for_missing_receivers(workdir, smtp):
+    sink, email = smtp
+    monitor = GitHubMonitor('', dict(email, receiver='a@example.com, b@example.com'), digest_window=60)
+    for repo in ('repo0', 'repo1', 'repo2'):
+        monitor.notification_queue.put({'username': 'alice', 'subject': f'GitHub更新通知: alice/{repo}',
+                                        'content': 'change'})
+
+    attempts = []
+    send_digest = monitor.send_digest
+
+    def flaky_send_digest(notifications, receiver):
+        attempts.append((receiver, len(notifications)))
+        if receiver == 'b@example.com' and len(attempts) == 2:
+            return False  # b 第一次发送失败
+        return send_digest(notifications, receiver)
+
+    monitor.send_digest = flaky_send_digest
+    assert monitor.flush_notifications(timeout=5) == 3  # 三条通知合并为一封，等待重试
+    monitor.notification_queue.conn.execute('UPDATE outbox SET next_attempt = 0')
+    assert monitor.flush_notifications(timeout=5) == 0
+
+    assert attempts == [('a@example.com', 3), ('b@example.com', 3), ('b@example.com', 3)]
+    assert sink.stats()['emails'] == 2
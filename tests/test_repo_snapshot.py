@@ -0,0 +1,71 @@
+from repo_snapshot import RepoRecord, SnapshotDiffer, UserSnapshot, diff_snapshots, parse_time
+
+
+def record(name, id=None, updated='2024-01-01T00:00:00Z', commit='2024-01-01T00:00:00Z'):
+    return RepoRecord(id, name, parse_time('2023-01-01T00:00:00Z'), parse_time(updated),
+                      parse_time(updated), parse_time(commit), head_sha='ab' * 20)
+
+
+def snapshot(*records):
+    return UserSnapshot('octocat', records)
+
+
+def names(records):
+    return sorted(r.name for r in records)
+
+
+def test_created_updated_and_deleted_repos():
+    old = snapshot(record('kept', 1), record('changed', 2), record('gone', 3))
+    new = snapshot(record('kept', 1),
+                   record('changed', 2, updated='2024-02-01T00:00:00Z', commit='2024-02-01T00:00:00Z'),
+                   record('fresh', 4))
+    diff = diff_snapshots(old, new)
+    assert names(diff.created) == ['fresh']
+    assert names(diff.updated) == ['changed']
+    assert names(diff.deleted) == ['gone']
+    assert diff.renamed == []
+
+
+def test_metadata_only_update_is_not_reported():
+    old = snapshot(record('repo', 1))
+    new = snapshot(record('repo', 1, updated='2024-02-01T00:00:00Z'))  # 没有新提交
+    assert not diff_snapshots(old, new)
+
+
+def test_rename_is_detected_by_id():
+    old = snapshot(record('old-name', 7))
+    new = snapshot(record('new-name', 7))
+    diff = diff_snapshots(old, new)
+    assert [(a.name, b.name) for a, b in diff.renamed] == [('old-name', 'new-name')]
+    assert diff.created == [] and diff.deleted == [] and diff.updated == []
+
+
+def test_rename_with_new_commits_is_also_an_update():
+    old = snapshot(record('old-name', 7))
+    new = snapshot(record('new-name', 7, updated='2024-02-01T00:00:00Z', commit='2024-02-01T00:00:00Z'))
+    diff = diff_snapshots(old, new)
+    assert len(diff.renamed) == 1
+    assert names(diff.updated) == ['new-name']
+
+
+def test_rename_without_id_is_delete_and_create():
+    old = snapshot(record('old-name'))
+    new = snapshot(record('new-name'))
+    diff = diff_snapshots(old, new)
+    assert names(diff.deleted) == ['old-name']
+    assert names(diff.created) == ['new-name']
+    assert diff.renamed == []
+
+
+def test_streaming_differ_resolves_renames_across_pages():
+    old = snapshot(record('a', 1), record('b', 2), record('c', 3))
+    differ = SnapshotDiffer(old)
+    # 第一页出现改名后的仓库，它的旧名字直到最后一页都没有出现
+    differ.add(record('b-renamed', 2))
+    differ.add(record('a', 1, updated='2024-02-01T00:00:00Z', commit='2024-02-01T00:00:00Z'))
+    assert names(differ.diff.updated) == ['a']  # 同名仓库的更新当场得出
+    differ.add(record('d', 4))
+    diff = differ.finish()
+    assert [(a.name, b.name) for a, b in diff.renamed] == [('b', 'b-renamed')]
+    assert names(diff.created) == ['d']
+    assert names(diff.deleted) == ['c']
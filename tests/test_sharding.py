@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from sharding import HashRing, LeaseTable
+
+USERS = [f'user{i}' for i in range(2000)]
+
+
+def owners(ring: HashRing):
+    return {user: ring.owner(user) for user in USERS}
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner('user0') is None
+
+
+def test_ownership_is_deterministic():
+    assert owners(HashRing(['w0', 'w1', 'w2'])) == owners(HashRing(['w2', 'w0', 'w1']))
+
+
+def test_adding_a_node_only_moves_users_to_it():
+    before = owners(HashRing(['w0', 'w1', 'w2']))
+    after = owners(HashRing(['w0', 'w1', 'w2', 'w3']))
+    moved = [user for user in USERS if before[user] != after[user]]
+    assert all(after[user] == 'w3' for user in moved)
+    # 理想情况下迁移 1/4，虚拟节点带来的偏差留足余量
+    assert 0.1 < len(moved) / len(USERS) < 0.4
+
+
+def test_removing_a_node_only_moves_its_users():
+    before = owners(HashRing(['w0', 'w1', 'w2', 'w3']))
+    after = owners(HashRing(['w0', 'w1', 'w3']))
+    for user in USERS:
+        if before[user] != 'w2':
+            assert after[user] == before[user]
+        else:
+            assert after[user] != 'w2'
+
+
+@pytest.fixture
+def leases(tmp_path):
+    table = LeaseTable(str(tmp_path / 'leases.db'), ttl=30)
+    yield table
+    table.close()
+
+
+def test_claimed_users_are_handed_over_only_after_release(leases):
+    leases.renew('w0')
+    leases.renew('w1')
+    assert leases.claim('w0', ['alice', 'bob']) == ['alice', 'bob']
+    assert leases.claim('w1', ['alice']) == []  # w0 仍然存活且没有释放
+    leases.release_users('w0', ['alice'])
+    assert leases.claim('w1', ['alice', 'bob']) == ['alice']
+
+
+def test_claims_of_expired_workers_can_be_taken_over(leases):
+    leases.renew('w0')
+    leases.claim('w0', ['alice'])
+    leases.conn.execute('UPDATE leases SET expires_at = ? WHERE worker = ?', (time.time() - 1, 'w0'))
+    leases.conn.commit()
+    assert leases.claim('w1', ['alice']) == ['alice']
+
+
+def test_release_except_drops_stale_claims(leases):
+    leases.renew('w0')
+    leases.claim('w0', ['alice', 'bob'])
+    leases.release_except('w0', ['alice'])
+    leases.renew('w1')
+    assert leases.claim('w1', ['alice', 'bob']) == ['bob']
@@ -0,0 +1,19 @@
+import json
+
+from state_store import JSONStateStore
+
+
+def test_save_user_copies_section_values(tmp_path):
+    store = JSONStateStore(str(tmp_path / 'monitor_state.json'), flush_interval=3600)
+    store.load()
+    inaccessible = {'repo': {'status': 404, 'failures': 1}}
+    store.save_user('alice', {}, {'inaccessible_repos': inaccessible})
+
+    # 监控之后继续原地修改，其他用户的更新合并写入时不应带上这些修改
+    inaccessible['repo']['failures'] = 2
+    inaccessible['other'] = {'status': 403, 'failures': 1}
+    store.save_user('bob', {}, {'last_check': '2024-01-01T00:00:00+00:00'})
+    store.flush()
+    with open(tmp_path / 'monitor_state.json', encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['inaccessible_repos']['alice'] == {'repo': {'status': 404, 'failures': 1}}
@@ -0,0 +1,144 @@
+import hashlib
+import hmac
+
+import pytest
+
+from webhook_receiver import WebhookReceiver
+
+
+def sign(secret: bytes, body: bytes) -> str:
+    return 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def make_receiver(secret: str = 'secret') -> WebhookReceiver:
+    return WebhookReceiver(monitor=None, secret=secret, port=0)
+
+
+def make_receiver_for(monitor) -> WebhookReceiver:
+    return WebhookReceiver(monitor=monitor, secret='secret', port=0)
+
+
+def test_verify_accepts_valid_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    assert make_receiver().verify(body, sign(b'secret', body))
+
+
+def test_verify_rejects_wrong_secret_or_tampered_body():
+    receiver = make_receiver()
+    body = b'{"ref": "refs/heads/main"}'
+    assert not receiver.verify(body, sign(b'other', body))
+    assert not receiver.verify(body + b' ', sign(b'secret', body))
+
+
+def test_verify_rejects_missing_or_malformed_signature():
+    receiver = make_receiver()
+    body = b'{}'
+    digest = hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+    assert not receiver.verify(body, None)
+    assert not receiver.verify(body, '')
+    assert not receiver.verify(body, digest)  # 缺少 sha256= 前缀
+    assert not receiver.verify(body, 'sha1=' + digest)
+
+
+def test_secret_is_required():
+    with pytest.raises(ValueError):
+        make_receiver(secret='')
+
+
+EMAIL = {'smtp_server': '127.0.0.1', 'smtp_port': 1, 'smtp_security': 'none',
+         'sender': 'monitor@example.com', 'password': '', 'receiver': 'me@example.com'}
+
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    from github_monitor import GitHubMonitor
+    from repo_snapshot import RepoRecord, UserSnapshot, parse_time
+
+    monkeypatch.chdir(tmp_path)
+    monitor = GitHubMonitor('', EMAIL)
+    monitor.usernames = ['alice']
+    when = parse_time('2024-01-01T00:00:00Z')
+    monitor.known_repos['alice'] = UserSnapshot('alice', [
+        RepoRecord(1, 'app', when, when, when, when, head_sha='aa' * 20),
+        RepoRecord(2, 'lib', when, when, when, when, head_sha='cc' * 20),
+    ])
+    return monitor
+
+
+def repository(name, id, **extra):
+    repo = {'id': id, 'name': name, 'owner': {'login': 'alice'}, 'default_branch': 'main',
+            'created_at': 1704067200, 'updated_at': '2024-03-01T00:00:00Z', 'pushed_at': 1709251200,
+            'html_url': f'https://github.com/alice/{name}'}
+    repo.update(extra)
+    return repo
+
+
+def push(ref='refs/heads/main'):
+    return {'ref': ref, 'repository': repository('app', 1),
+            'head_commit': {'id': 'bb' * 20, 'timestamp': '2024-03-01T00:00:00Z'},
+            'commits': [{'id': 'bb' * 20, 'timestamp': '2024-03-01T00:00:00Z', 'message': 'fix bug\n\ndetails',
+                         'author': {'name': 'Alice'}}]}
+
+
+def test_push_to_default_branch_updates_snapshot_and_notifies(monitor):
+    before = monitor.known_repos['alice']
+    assert make_receiver_for(monitor).handle('push', push()) == 'notified'
+    after = monitor.known_repos['alice']
+    assert after is not before  # 整体替换，不原地修改
+    assert before['app'].sha == 'aa' * 20
+    assert after['app'].sha == 'bb' * 20
+    assert monitor.notification_queue.qsize() == 1
+
+
+def test_push_to_other_branch_is_ignored(monitor):
+    before = monitor.known_repos['alice']
+    assert make_receiver_for(monitor).handle('push', push('refs/heads/feature')) == 'ignored'
+    assert monitor.known_repos['alice'] is before
+    assert monitor.notification_queue.qsize() == 0
+
+
+def test_events_for_unmonitored_users_are_ignored(monitor):
+    payload = push()
+    payload['repository']['owner'] = {'login': 'mallory'}
+    assert make_receiver_for(monitor).handle('push', payload) == 'ignored'
+
+
+def test_created_repository_notifies(monitor):
+    payload = {'action': 'created', 'repository': repository('new', 3)}
+    assert make_receiver_for(monitor).handle('repository', payload) == 'notified'
+    assert 'new' in monitor.known_repos['alice']
+    assert monitor.notification_queue.qsize() == 1
+
+
+def test_renamed_repository_keeps_state_without_notifying(monitor):
+    before = monitor.known_repos['alice']
+    payload = {'action': 'renamed', 'repository': repository('application', 1),
+               'changes': {'repository': {'name': {'from': 'app'}}}}
+    assert make_receiver_for(monitor).handle('repository', payload) == 'renamed'
+    after = monitor.known_repos['alice']
+    assert 'app' not in after and after['application'].sha == 'aa' * 20
+    assert before['app'].name == 'app'  # 旧快照中的记录没有被修改
+    assert monitor.notification_queue.qsize() == 0
+
+
+def test_deleted_repository_is_removed(monitor):
+    payload = {'action': 'deleted', 'repository': repository('lib', 2)}
+    assert make_receiver_for(monitor).handle('repository', payload) == 'deleted'
+    assert 'lib' not in monitor.known_repos['alice']
+    assert monitor.notification_queue.qsize() == 0
+
+
+def test_poll_started_before_webhook_neither_overwrites_nor_repeats_it(monitor):
+    from repo_snapshot import SnapshotDiffer, UserSnapshot
+
+    base = monitor.known_repos['alice']
+    differ = SnapshotDiffer(base)
+    polled = UserSnapshot('alice')
+    for record in base.repos.values():  # 轮询在推送之前拿到了仓库列表
+        polled.add(record)
+        differ.add(record)
+
+    make_receiver_for(monitor).handle('push', push())
+    assert monitor._commit_user_state('alice', polled, differ) == []
+    assert monitor.known_repos['alice']['app'].sha == 'bb' * 20
+    assert monitor.notification_queue.qsize() == 1
@@ -0,0 +1,106 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class TimerScheduler:
+    """基于最小堆的定时任务调度器
+
+    run() 只睡眠到最近一个任务的到期时间，没有任务到期时不会被唤醒；
+    stop() / wake() 通过事件立即打断睡眠，用于退出和重新计算调度（如热加载用户列表）。
+    同名任务只保留最后一次安排，旧的条目在出堆时丢弃。
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.latest: Dict[str, int] = {}  # 任务名 -> 最新条目的序号
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.pending = collections.deque()  # call_soon 提交的任务，deque.append 不需要加锁
+
+    def schedule(self, when: float, name: str, func: Callable, *args, deadline: Optional[float] = None):
+        """在时间戳 when 执行 func(*args)；deadline 秒内没能开始执行的任务直接跳过"""
+        with self.lock:
+            seq = next(self.counter)
+            self.latest[name] = seq
+            heapq.heappush(self.heap, (when, seq, name, func, args, deadline))
+            earliest = self.heap[0][1] == seq
+        if earliest:
+            self.wakeup.set()  # 新任务比当前等待的更早，重新计算睡眠时间
+
+    def schedule_in(self, delay: float, name: str, func: Callable, *args, deadline: Optional[float] = None):
+        self.schedule(time.time() + delay, name, func, *args, deadline=deadline)
+
+    def cancel(self, name: str):
+        with self.lock:
+            self.latest.pop(name, None)
+
+    def next_run(self, name: str) -> Optional[float]:
+        """任务下次执行的时间戳，没有安排时返回 None"""
+        with self.lock:
+            seq = self.latest.get(name)
+            for when, entry_seq, *_ in self.heap:
+                if entry_seq == seq:
+                    return when
+        return None
+
+    def call_soon(self, func: Callable, *args):
+        """让 run 循环尽快执行 func(*args)，可以在信号处理函数中调用"""
+        self.pending.append((func, args))
+        self.wakeup.set()
+
+    def wake(self):
+        """打断当前睡眠"""
+        self.wakeup.set()
+
+    def stop(self):
+        """停止 run 循环，正在执行的任务会先完成"""
+        self.stopped.set()
+        self.wakeup.set()
+
+    def _pop_due(self, now: float):
+        """取出一个到期任务；没有到期任务时返回 (None, 需要等待的秒数)"""
+        with self.lock:
+            while self.heap:
+                when, seq, name, func, args, deadline = self.heap[0]
+                if self.latest.get(name) != seq:
+                    heapq.heappop(self.heap)  # 已取消或被重新安排
+                    continue
+                if when > now:
+                    return None, when - now
+                heapq.heappop(self.heap)
+                del self.latest[name]
+                return (when, name, func, args, deadline), 0
+            return None, None
+
+    def run(self, on_error: Callable = None, on_skip: Callable = None):
+        """执行任务直到 stop() 被调用"""
+        while not self.stopped.is_set():
+            while self.pending:
+                func, args = self.pending.popleft()
+                try:
+                    func(*args)
+                except Exception as e:
+                    if on_error:
+                        on_error(getattr(func, '__name__', 'call_soon'), e)
+            job, wait = self._pop_due(time.time())
+            if job is None:
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+                continue
+            when, name, func, args, deadline = job
+            lateness = time.time() - when
+            if deadline is not None and lateness > deadline:
+                if on_skip:
+                    on_skip(name, lateness)
+                continue
+            try:
+                func(*args)
+            except Exception as e:
+                if on_error:
+                    on_error(name, e)
@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from rate_limiter import RateLimiter
+
+
+def mask_token(token: str) -> str:
+    """日志和指标中只显示 token 的末 4 位"""
+    if not token:
+        return 'anonymous'
+    return f'…{token[-4:]}'
+
+
+class TokenClient:
+    """单个 token 的 Session、配额状态和使用统计"""
+
+    def __init__(self, token: str, pool_size: int):
+        self.token = token
+        self.label = mask_token(token)
+        self.session = requests.Session()
+        # 连接池大小与工作线程数一致，保证并发请求都能复用连接
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if token:
+            self.session.headers.update({'Authorization': f'token {token}'})
+        self.rate_limiter = RateLimiter()
+        self.disabled_until = 0.0  # 在此时间之前不参与轮换
+        self.disabled_reason = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def auth_header(self) -> Dict:
+        return {'Authorization': f'token {self.token}'} if self.token else {}
+
+    def available(self) -> float:
+        """可用于排序的剩余配额，未知时视为充足"""
+        remaining = self.rate_limiter.remaining
+        return float('inf') if remaining is None else remaining - self.rate_limiter.reserve
+
+
+class TokenPool:
+    """多个 GitHub token 组成的池，每个请求交给剩余配额最多的 token
+
+    返回 401 或配额耗尽（403 rate limit）的 token 暂时移出轮换，到重置时间后自动恢复。
+    只配置一个 token（或不配置）时行为与单 token 完全相同。
+    """
+
+    def __init__(self, tokens, pool_size: int = 8, disable_seconds: float = 3600):
+        if isinstance(tokens, str) or tokens is None:
+            tokens = [tokens] if tokens else []
+        tokens = list(dict.fromkeys(t.strip() for t in tokens if t and t.strip()))  # 去重并保持顺序
+        self.clients: List[TokenClient] = [TokenClient(t, pool_size) for t in tokens] or [TokenClient('', pool_size)]
+        self.disable_seconds = disable_seconds  # 401 且没有重置时间时的禁用时长
+        self.lock = threading.Lock()
+
+    @property
+    def authenticated(self) -> bool:
+        return bool(self.clients[0].token)
+
+    def _enabled(self, now: float) -> List[TokenClient]:
+        return [c for c in self.clients if c.disabled_until <= now]
+
+    def select(self) -> TokenClient:
+        """选择剩余配额最多的可用 token；全部被禁用时返回最早恢复的那个"""
+        now = time.time()
+        with self.lock:
+            enabled = self._enabled(now)
+            if not enabled:
+                return min(self.clients, key=lambda c: c.disabled_until)
+            return max(enabled, key=TokenClient.available)
+
+    def reserve(self, pinned: TokenClient = None):
+        """选择 token 并占用一个请求名额，返回 (client, 需要等待的秒数)
+
+        选中的 token 需要长时间等待（如刚被耗尽）时，换成另一个等待更短的 token。
+        """
+        client = pinned or self.select()
+        delay = client.rate_limiter.reserve_slot()
+        if delay > 1 and pinned is None and len(self.clients) > 1:
+            now = time.time()
+            with self.lock:
+                others = [c for c in self._enabled(now) if c is not client and c.available() > 0]
+            if others:
+                other = max(others, key=TokenClient.available)
+                other_delay = other.rate_limiter.reserve_slot()
+                if other_delay < delay:
+                    return other, other_delay
+        return client, delay
+
+    def has_available(self) -> bool:
+        with self.lock:
+            return bool(self._enabled(time.time()))
+
+    def report(self, client: TokenClient, status_code: int, headers, text: str = '') -> bool:
+        """记录一次响应并更新配额；token 因此被移出轮换时返回 True"""
+        client.rate_limiter.update(headers)
+        with self.lock:
+            client.requests += 1
+            if status_code < 400:
+                if client.disabled_reason and client.disabled_until <= time.time():
+                    client.disabled_reason = None
+                return False
+            client.errors += 1
+            reset = headers.get('X-RateLimit-Reset')
+            if status_code == 401:
+                reason = '凭证无效 (401)'
+                until = time.time() + self.disable_seconds
+            elif status_code == 403 and (headers.get('X-RateLimit-Remaining') == '0'
+                                         or 'rate limit exceeded' in text.lower()):
+                reason = '配额耗尽 (403)'
+                until = float(reset) if reset else time.time() + self.disable_seconds
+            else:
+                return False
+            client.disabled_until = until
+            client.disabled_reason = reason
+            return True
+
+    def is_low(self) -> bool:
+        """所有可用 token 的配额都已紧张"""
+        now = time.time()
+        enabled = self._enabled(now)
+        return not enabled or all(c.rate_limiter.is_low() for c in enabled)
+
+    def remaining(self) -> Optional[int]:
+        """所有 token 已知剩余配额之和，全部未知时返回 None"""
+        values = [c.rate_limiter.remaining for c in self.clients if c.rate_limiter.remaining is not None]
+        return sum(values) if values else None
+
+    def status(self) -> str:
+        if len(self.clients) == 1:
+            return self.clients[0].rate_limiter.status()
+        now = time.time()
+        enabled = len(self._enabled(now))
+        remaining = self.remaining()
+        limit = sum(c.rate_limiter.limit or 0 for c in self.clients)
+        total = '未知' if remaining is None else f"{remaining}/{limit or '?'}"
+        return f"{total} ({enabled}/{len(self.clients)} 个 token 可用)"
+
+    def usage(self) -> List[Dict]:
+        """每个 token 的使用情况"""
+        now = time.time()
+        with self.lock:
+            return [{
+                'token': c.label,
+                'requests': c.requests,
+                'errors': c.errors,
+                'remaining': c.rate_limiter.status(),
+                'disabled_until': c.disabled_until if c.disabled_until > now else None,
+                'disabled_reason': c.disabled_reason if c.disabled_until > now else None,
+            } for c in self.clients]
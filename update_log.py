@@ -0,0 +1,135 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只有单进程时才安全
+    fcntl = None
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class UpdateLog:
+    """以 JSON Lines 追加写入的更新记录，按大小或时间轮转，支持流式查询
+
+    每条通知只追加一行，写入开销与历史记录数量无关；
+    轮转后的文件为 update.jsonl.1 ~ update.jsonl.N，数字越大越旧。
+    """
+
+    def __init__(self, log_file: str = 'update.jsonl', max_bytes: int = 10 * 1024 * 1024,
+                 max_age: int = 30 * 86400, backups: int = 5, legacy_file: str = 'update.json'):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.lock = threading.Lock()
+        self._migrate_legacy(legacy_file)
+        self.started_at = self._first_record_time()
+
+    def _migrate_legacy(self, legacy_file: str):
+        """把旧的 update.json（整个列表）一次性转换为 JSON Lines"""
+        if not legacy_file or not os.path.exists(legacy_file) or os.path.exists(self.log_file):
+            return
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        with open(self.log_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(legacy_file, f'{legacy_file}.migrated')
+
+    def _first_record_time(self) -> float:
+        """当前日志文件中第一条记录的时间，用于按时间轮转"""
+        try:
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                first = json.loads(f.readline())
+            return datetime.strptime(first['timestamp'], TIME_FORMAT).timestamp()
+        except (OSError, ValueError, KeyError):
+            return time.time()
+
+    def append(self, record: Dict):
+        """追加一条记录"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock, self._file_lock():
+            if self._should_rotate():
+                self._rotate()
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _should_rotate(self) -> bool:
+        try:
+            size = os.path.getsize(self.log_file)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if size >= self.max_bytes:
+            return True
+        if time.time() - self.started_at < self.max_age:
+            return False
+        # 其他进程可能已经轮转过，以文件中第一条记录为准
+        self.started_at = self._first_record_time()
+        return time.time() - self.started_at >= self.max_age
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """跨进程的写入锁：分片模式下多个进程追加同一个日志，轮转必须互斥"""
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.log_file}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rotate(self):
+        oldest = f'{self.log_file}.{self.backups}'
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.backups - 1, 0, -1):
+            source = f'{self.log_file}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.log_file}.{index + 1}')
+        os.replace(self.log_file, f'{self.log_file}.1')
+        self.started_at = time.time()
+
+    def _files(self):
+        """按从旧到新的顺序返回所有日志文件"""
+        files = [f'{self.log_file}.{index}' for index in range(self.backups, 0, -1)]
+        files.append(self.log_file)
+        return [path for path in files if os.path.exists(path)]
+
+    def iter_records(self, username: str = None, since=None, until=None) -> Iterator[Dict]:
+        """逐行读取记录，可按用户和时间范围过滤，不会一次性加载全部内容
+
+        since / until 可以是 datetime 或 "%Y-%m-%d %H:%M:%S" 格式的字符串
+        """
+        if isinstance(since, datetime):
+            since = since.strftime(TIME_FORMAT)
+        if isinstance(until, datetime):
+            until = until.strftime(TIME_FORMAT)
+
+        for path in self._files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 跳过写到一半的行
+                    if username is not None and record.get('username') != username:
+                        continue
+                    timestamp = record.get('timestamp', '')
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp > until:
+                        continue
+                    yield record
@@ -0,0 +1,100 @@
+import json
+import os
+from typing import Dict, Optional
+
+# 可以在监控列表文件中修改、无需重启即生效的设置
+RELOADABLE_SETTINGS = ('low_priority_users', 'webhook_users', 'min_interval', 'max_interval', 'spread_ratio',
+                       'detection_mode', 'digest_window')
+
+
+def _parse(path: str, text: str):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        return json.loads(text)
+    # TOML / YAML 解析器只在用到时导入（yaml 的导入耗时与整个请求库相当）
+    if extension == '.toml':
+        try:
+            import tomllib  # Python 3.11+
+        except ImportError:
+            raise ImportError("TOML 格式的监控列表需要 Python 3.11 及以上版本") from None
+        return tomllib.loads(text)
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:  # 可选依赖，只有 YAML 格式的监控列表需要
+            raise ImportError("YAML 格式的监控列表需要 PyYAML，请先执行 pip install pyyaml") from None
+        return yaml.safe_load(text)
+    # 纯文本：每行一个用户名，# 开头为注释
+    return [line.split('#', 1)[0].strip() for line in text.splitlines()]
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_settings(settings: Dict):
+    """检查可热加载设置的类型和取值范围，不合法时抛出 ValueError"""
+    for key in ('min_interval', 'max_interval'):
+        if key in settings and not (_is_number(settings[key]) and settings[key] > 0):
+            raise ValueError(f"{key} 必须是大于 0 的秒数: {settings[key]!r}")
+    if 'min_interval' in settings and 'max_interval' in settings and settings['min_interval'] > settings['max_interval']:
+        raise ValueError(f"min_interval ({settings['min_interval']}) 不能大于 max_interval ({settings['max_interval']})")
+    if 'spread_ratio' in settings and not (_is_number(settings['spread_ratio']) and 0 <= settings['spread_ratio'] <= 1):
+        raise ValueError(f"spread_ratio 必须在 0 到 1 之间: {settings['spread_ratio']!r}")
+    if 'digest_window' in settings and not (_is_number(settings['digest_window']) and settings['digest_window'] >= 0):
+        raise ValueError(f"digest_window 必须是不小于 0 的秒数: {settings['digest_window']!r}")
+    if 'detection_mode' in settings and settings['detection_mode'] not in ('repos', 'events'):
+        raise ValueError(f"detection_mode 只能是 repos 或 events: {settings['detection_mode']!r}")
+    for key in ('low_priority_users', 'webhook_users'):
+        if key in settings and not isinstance(settings[key], (list, type(None))):
+            raise ValueError(f"{key} 必须是用户名列表")
+
+
+def load_watch_list(path: str) -> Dict:
+    """读取监控列表文件，返回 {'users': [...], 'settings': {...}}
+
+    文件可以是用户名列表，也可以是包含 users 和可选设置项（见 RELOADABLE_SETTINGS）的对象，
+    支持 .json / .toml / .yaml / .yml，其他扩展名按每行一个用户名的纯文本处理。
+    设置项不合法时与解析错误一样抛出异常，调用方保留当前的列表和设置。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = _parse(path, f.read())
+    if isinstance(data, list):
+        data = {'users': data}
+    if not isinstance(data, dict) or not isinstance(data.get('users'), list):
+        raise ValueError(f"监控列表 {path} 中缺少 users 列表")
+
+    users = []
+    seen = set()
+    for user in data['users']:
+        user = str(user).strip() if user is not None else ''
+        if user and user not in seen:
+            seen.add(user)
+            users.append(user)
+    settings = {key: data[key] for key in RELOADABLE_SETTINGS if key in data}
+    validate_settings(settings)
+    return {'users': users, 'settings': settings}
+
+
+class WatchList:
+    """监控列表文件，按修改时间和大小判断是否需要重新加载"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature = None
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        signature = self._stat()
+        return signature is not None and signature != self.signature
+
+    def load(self) -> Dict:
+        # 先记录签名：文件内容有误时只报告一次，等下次修改后再重新加载
+        self.signature = self._stat()
+        return load_watch_list(self.path)
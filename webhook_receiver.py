@@ -0,0 +1,195 @@
+import hashlib
+import hmac
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+def to_github_time(value) -> Optional[str]:
+    """把 webhook 中的时间（Unix 时间戳或带时区的 ISO 字符串）转换为 REST 接口的 UTC 格式"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value, timezone.utc)
+    else:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class WebhookReceiver:
+    """接收 GitHub webhook（push / repository / create），增量更新 known_repos
+
+    每个请求都校验 X-Hub-Signature-256 的 HMAC 签名。通知沿用轮询的对比逻辑和
+    save_update / notification_queue 流程，因此邮件内容与轮询检测到的完全一致。
+    只处理正在监控且已经建立基线的用户，其余事件直接忽略，交给轮询处理。
+    处理时持有该用户的锁（与轮询提交结果互斥），修改快照的副本后整体替换，不影响正在遍历旧快照的线程。
+    """
+
+    def __init__(self, monitor, secret: str, port: int, host: str = '0.0.0.0', path: str = '/webhook'):
+        if not secret:
+            raise ValueError("启用 webhook 接收必须设置 WEBHOOK_SECRET")
+        self.monitor = monitor
+        self.secret = secret.encode('utf-8')
+        self.port = port
+        self.host = host
+        self.path = path
+        self.server = None
+
+    def verify(self, body: bytes, signature: str) -> bool:
+        """校验 sha256=<hex> 格式的签名"""
+        if not signature or not signature.startswith('sha256='):
+            return False
+        expected = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature[len('sha256='):])
+
+    def _owner(self, repository: Dict) -> Optional[str]:
+        owner = repository.get('owner') or {}
+        username = owner.get('login') or owner.get('name')
+        if username not in self.monitor.usernames or username not in self.monitor.known_repos:
+            return None
+        return username
+
+    def _repo_info(self, repository: Dict) -> Dict:
+        created_at = to_github_time(repository.get('created_at'))
+        return {
+            'id': repository.get('id'),
+            'name': repository['name'],
+            'created_at': created_at,
+            'updated_at': to_github_time(repository.get('updated_at')) or created_at,
+            'pushed_at': to_github_time(repository.get('pushed_at')),
+            'html_url': repository.get('html_url'),
+        }
+
+    def handle(self, event: str, payload: Dict) -> str:
+        """处理一个 webhook 事件，返回处理结果（用于响应和统计）"""
+        if event == 'ping':
+            return 'pong'
+        repository = payload.get('repository')
+        if not repository:
+            return 'ignored'
+        username = self._owner(repository)
+        if username is None:
+            return 'ignored'
+
+        with self.monitor.user_lock(username):
+            if event == 'push':
+                return self._handle_push(username, repository, payload)
+            if event == 'repository':
+                return self._handle_repository(username, repository, payload)
+            if event == 'create' and payload.get('ref_type') == 'repository':
+                return self._apply(username, self._repo_info(repository), [])
+        return 'ignored'
+
+    def _handle_push(self, username: str, repository: Dict, payload: Dict) -> str:
+        # 轮询只关注默认分支的最新提交
+        default_branch = repository.get('default_branch') or repository.get('master_branch')
+        if default_branch and payload.get('ref') != f'refs/heads/{default_branch}':
+            return 'ignored'
+        head = payload.get('head_commit')
+        if not head or payload.get('deleted'):
+            return 'ignored'
+        repo = self._repo_info(repository)
+        pushed_at = repo['pushed_at'] or to_github_time(head.get('timestamp'))
+        # push 事件中的 updated_at 可能早于推送时间，取较晚者保证与轮询的判断一致
+        repo['pushed_at'] = pushed_at
+        repo['updated_at'] = max(filter(None, (repo['updated_at'], pushed_at)))
+        commits = [{'sha': head.get('id'), 'commit': {'author': {'date': to_github_time(head.get('timestamp'))}}}]
+        # push 事件自带本次推送的提交（最多 20 个，从旧到新），直接用于通知中的提交摘要
+        new_commits = [{
+            'sha': commit.get('id'),
+            'commit': {
+                'author': {'name': (commit.get('author') or {}).get('name'),
+                           'date': to_github_time(commit.get('timestamp'))},
+                'message': (commit.get('message') or '').split('\n', 1)[0],
+            },
+        } for commit in reversed(payload.get('commits') or [])]
+        return self._apply(username, repo, commits, new_commits)
+
+    def _handle_repository(self, username: str, repository: Dict, payload: Dict) -> str:
+        action = payload.get('action')
+        known = self.monitor.known_repos[username]
+        if action == 'created':
+            return self._apply(username, self._repo_info(repository), [])
+        snapshot = known.copy()
+        if action == 'deleted':
+            if snapshot.pop(repository['name']) is not None:
+                self.monitor._store_snapshot(username, snapshot, known)
+            return 'deleted'
+        if action == 'renamed':
+            old_name = ((payload.get('changes') or {}).get('repository') or {}).get('name', {}).get('from')
+            # 改名不是新仓库，直接迁移状态，避免轮询时误报为新建仓库
+            if old_name and snapshot.rename(old_name, repository['name'], repository.get('html_url')):
+                self.monitor._store_snapshot(username, snapshot, known)
+            return 'renamed'
+        return 'ignored'
+
+    def _apply(self, username: str, repo: Dict, commits, new_commits=None) -> str:
+        """用与轮询相同的规则对比并保存仓库状态，有变化时发出通知"""
+        monitor = self.monitor
+        known = monitor.known_repos[username]
+        repo_state = monitor._repo_state(username, repo, commits)
+        old_state = known.get(repo['name'])
+        if old_state is not None and not repo_state.has_commits and old_state.has_commits:
+            return 'unchanged'
+        snapshot = known.copy()
+        snapshot.add(repo_state)
+        try:
+            notification = monitor._diff_repo(username, repo_state, old_state, new_commits)
+            monitor._store_snapshot(username, snapshot, known)
+        except BaseException:
+            monitor._release_claims(username)
+            raise
+        if notification:
+            monitor._dispatch_notifications(username, [notification])
+            return 'notified'
+        return 'unchanged'
+
+    def serve(self):
+        """在后台线程启动 HTTP 服务"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 只在启用服务时导入
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, text: str):
+                body = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path.split('?', 1)[0] != receiver.path:
+                    return self._reply(404, 'not found')
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                event = self.headers.get('X-GitHub-Event', '')
+                if not receiver.verify(body, self.headers.get('X-Hub-Signature-256')):
+                    receiver.monitor.metrics.inc('webhooks_total', event=event, result='bad_signature')
+                    return self._reply(401, 'invalid signature')
+                try:
+                    result = receiver.handle(event, json.loads(body))
+                except Exception as e:
+                    receiver.monitor.metrics.inc('webhooks_total', event=event, result='error')
+                    print(f"处理 webhook 事件 {event} 时出错: {str(e)}")
+                    return self._reply(500, 'error')
+                receiver.monitor.metrics.inc('webhooks_total', event=event, result=result)
+                self._reply(200 if result != 'ignored' else 202, result)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,55 @@
+import itertools
+import threading
+from queue import PriorityQueue
+
+
+class WorkerPool:
+    """固定大小的工作线程池，线程在多轮检查之间复用"""
+
+    def __init__(self, size: int = 8, name: str = 'monitor-worker'):
+        self.size = max(1, size)
+        self.name = name
+        self.jobs = PriorityQueue()
+        self.counter = itertools.count()  # 同优先级按提交顺序执行
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """启动工作线程（只启动一次）"""
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.size):
+                thread = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, func, *args, priority: float = 0):
+        """提交任务，priority 越小越先执行"""
+        self.start()
+        self.jobs.put((priority, next(self.counter), func, args))
+
+    def wait(self):
+        """等待所有已提交的任务完成"""
+        self.jobs.join()
+
+    def shutdown(self):
+        """通知所有工作线程退出"""
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.jobs.put((float('inf'), next(self.counter), None, ()))
+        for thread in threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            _, _, func, args = self.jobs.get()
+            try:
+                if func is None:
+                    return
+                func(*args)
+            except Exception as e:
+                print(f"工作线程执行任务时出错: {str(e)}")
+            finally:
+                self.jobs.task_done()